@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from sqlalchemy import select, insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from database import run_db, dialect_insert
+from models import Chat, User, ChatMember
+from identity import get_chat, chat_cache, user_cache, member_cache, UserRow, MemberRow, chat_row, member_row
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 10  # seconds between timed flushes
+MAX_PENDING = 500    # (chat, user) pairs buffered before an early flush
+
+
+def _upsert(db, model, rows, key, columns):
+    """
+    Batched INSERT .. ON CONFLICT DO UPDATE keyed on the primary key.
+    Returns the resulting rows.
+    """
+    upsert = dialect_insert(db)
+    if upsert is None:
+        return [db.merge(model(**row)) for row in rows]
+
+    stmt = upsert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={c: stmt.excluded[c] for c in columns}
+    ).returning(*model.__table__.columns)
+    return db.execute(stmt, rows).all()
+
+
+def _write_chat(db, chat_id, title):
+    row = get_chat(db, chat_id)
+    if row is None:
+        saved = _upsert(db, Chat, [{"chat_id": chat_id, "title": title}], "chat_id", ["title"])
+        db.commit()
+        chat_cache.set(chat_id, chat_row(saved[0]))
+
+
+class ActivityBuffer:
+    """
+    Write-behind buffer for group activity.
+    Repeat sightings of the same (chat, user) are merged in memory and
+    written out as one batch on a timer, when the buffer fills up, or on shutdown.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self.max_pending = max_pending
+        self.chats = {}    # chat_id -> title
+        self.users = {}    # user_id -> (full_name, username)
+        self.members = {}  # (chat_id, user_id) -> last_active
+        self.oldest = None # monotonic time of the oldest unflushed sighting
+        self.early_flush = None # task of a size-triggered flush in progress
+        self._flushing = asyncio.Lock() # the timer and an early flush could otherwise insert the same new member
+        self.stats = {
+            "sightings": 0, "flushes": 0, "errors": 0, "rows_flushed": 0,
+            "last_flush_size": 0, "max_flush_size": 0,
+            "last_lag": 0.0, "max_lag": 0.0,
+        }
+
+    def __len__(self):
+        return len(self.members)
+
+    def record(self, chat_id, title, user_id, full_name, username):
+        """Buffer one sighting. Returns True when the buffer should be flushed early."""
+        self.chats[chat_id] = title
+        self.users[user_id] = (full_name, username)
+        self.members[(chat_id, user_id)] = datetime.now()
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.stats["sightings"] += 1
+        return len(self.members) >= self.max_pending
+
+    def flush_soon(self, create_task):
+        """Starts an early flush in the background unless one is already under way."""
+        if self.early_flush is None or self.early_flush.done():
+            self.early_flush = create_task(self.flush())
+
+    async def write_new_chat(self, chat_id, title):
+        """
+        Writes a chat's row straight away when it isn't known yet, instead of at the next
+        flush: session settings and squads are read from it by the very next handler.
+        """
+        if chat_cache.get(chat_id) is not None:
+            return
+        try:
+            await run_db(_write_chat, chat_id, title)
+        except SQLAlchemyError as e:
+            logger.error("Writing new chat %s failed: %s", chat_id, e)
+
+    async def flush(self):
+        async with self._flushing:
+            return await self._flush()
+
+    async def _flush(self):
+        if not self.members:
+            return 0
+
+        chats, users, members, oldest = self.chats, self.users, self.members, self.oldest
+        self.chats, self.users, self.members, self.oldest = {}, {}, {}, None
+
+        try:
+            await run_db(self._write, chats, users, members)
+        except SQLAlchemyError as e:
+            logger.error("Activity flush failed: %s", e)
+            self.stats["errors"] += 1
+            self._requeue(chats, users, members, oldest)
+            return 0
+
+        size = len(members)
+        lag = time.monotonic() - oldest
+        self.stats["flushes"] += 1
+        self.stats["rows_flushed"] += size
+        self.stats["last_flush_size"] = size
+        self.stats["max_flush_size"] = max(self.stats["max_flush_size"], size)
+        self.stats["last_lag"] = lag
+        self.stats["max_lag"] = max(self.stats["max_lag"], lag)
+        return size
+
+    def _write(self, db, chats, users, members):
+        # 1. Chats and Users (parents first so the member FKs resolve).
+        # Rows already cached with the same names need no write at all.
+        chat_rows, user_rows = [], []
+        for cid, title in chats.items():
+            cached = chat_cache.get(cid)
+            if cached is None or cached.title != title:
+                chat_rows.append({"chat_id": cid, "title": title})
+        for uid, (name, username) in users.items():
+            if user_cache.get(uid) != UserRow(uid, name, username):
+                user_rows.append({"user_id": uid, "full_name": name, "username": username})
+
+        saved_chats = []
+        if chat_rows:
+            saved_chats = _upsert(db, Chat, chat_rows, "chat_id", ["title"])
+        if user_rows:
+            _upsert(db, User, user_rows, "user_id", ["full_name", "username"])
+
+        # 2. Member links: ids come from the cache, one lookup for the rest
+        known = {}
+        for pair in members:
+            row = member_cache.get(pair)
+            if row is not None:
+                known[pair] = row
+
+        learned = {}
+        unknown = [pair for pair in members if pair not in known]
+        if unknown:
+            rows = db.execute(
+                select(ChatMember).where(
+                    ChatMember.chat_id.in_({cid for cid, _ in unknown}),
+                    ChatMember.user_id.in_({uid for _, uid in unknown})
+                )
+            ).scalars()
+            for m in rows:
+                if (m.chat_id, m.user_id) in members:
+                    learned[(m.chat_id, m.user_id)] = member_row(m)
+            known.update(learned)
+
+        updates, inserts = [], []
+        for (cid, uid), seen in members.items():
+            if (cid, uid) in known:
+                updates.append({"id": known[(cid, uid)].id, "last_active": seen})
+            else:
+                inserts.append({"chat_id": cid, "user_id": uid, "last_active": seen})
+
+        if updates:
+            db.execute(update(ChatMember), updates)
+        if inserts:
+            created = db.execute(
+                insert(ChatMember).returning(ChatMember.id, ChatMember.chat_id, ChatMember.user_id), inserts
+            )
+            for member_id, cid, uid in created:
+                learned[(cid, uid)] = MemberRow(member_id, cid, uid, False)
+        db.commit()
+
+        # 3. Write through to the identity cache once the batch is durable
+        for c in saved_chats:
+            chat_cache.set(c.chat_id, chat_row(c))
+        for row in user_rows:
+            user_cache.set(row["user_id"], UserRow(row["user_id"], row["full_name"], row["username"]))
+        for pair, row in learned.items():
+            member_cache.set(pair, row)
+
+    def _requeue(self, chats, users, members, oldest):
+        # Newer sightings recorded since the swap win over the failed batch
+        for key, val in chats.items(): self.chats.setdefault(key, val)
+        for key, val in users.items(): self.users.setdefault(key, val)
+        for key, val in members.items(): self.members.setdefault(key, val)
+        if oldest is not None and (self.oldest is None or oldest < self.oldest):
+            self.oldest = oldest
+
+
+activity_buffer = ActivityBuffer()
+
+
+async def flush_activity(context):
+    await activity_buffer.flush()
@@ -0,0 +1,15 @@
+"""
+Offline benchmarks. Nothing here talks to Telegram.
+
+Modules point DATABASE_URL at a scratch SQLite file before importing the bot,
+so run them as modules from the repo root, e.g. `python -m benchmarks.handlers`.
+"""
+import os
+import tempfile
+
+
+def use_scratch_db(name="bench.db"):
+    path = os.path.join(tempfile.mkdtemp(prefix="marceline-bench-"), name)
+    os.environ["DATABASE_URL"] = "sqlite:///" + path
+    os.environ.setdefault("BOT_TOKEN", "0:bench")
+    return path
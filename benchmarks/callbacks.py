@@ -0,0 +1,85 @@
+"""
+Cost of finding the handler for a button press: the old regex prefixes plus
+handle_callback's if-chain vs. callbacks.decode's single dict lookup.
+
+    python -m benchmarks.callbacks --presses 200000
+"""
+import argparse
+import re
+import time
+
+from benchmarks import use_scratch_db
+use_scratch_db()
+
+import callbacks
+import features.general, features.session, features.stats # register their ops
+
+# The old routing: three CallbackQueryHandler patterns tried in order, then the
+# catch-all's chain of == / startswith checks with split("_") parsing.
+OLD_PATTERNS = [(re.compile(r"^dm_"), "dm"), (re.compile(r"^lb_"), "lb"), (re.compile(r"^stat_"), "stat")]
+
+def old_session_chain(data):
+    if data == "new_1v1": return "new_1v1", ()
+    if data.startswith("sel_opp_"):
+        parts = data.split("_")
+        return "sel_opp", (int(parts[2]), int(parts[3]))
+    if data == "new_2v2": return "new_2v2", ()
+    if data == "pick_opp": return "pick_opp", ()
+    if data in ["rsvp_in", "rsvp_out"]: return data, ()
+    if data == "rsvp_pending": return data, ()
+    if data.startswith("time_"):
+        if data == "time_back": return data, ()
+        return "time", (data.split("_")[1],)
+    if data == "stop_session": return data, ()
+    if data == "stats_input": return data, ()
+    return None
+
+def old_stats_chain(data):
+    for prefix in ("stat_matches_", "stat_winsA_", "stat_winsB_"):
+        if data.startswith(prefix):
+            return prefix, (int(data.split("_")[-1]),)
+    return None
+
+def old_dispatch(data):
+    for pattern, name in OLD_PATTERNS:
+        if pattern.match(data):
+            if name == "stat":
+                return old_stats_chain(data)
+            return name, (data,)
+    return old_session_chain(data)
+
+
+# A press mix that leans on RSVP, like a real session burst
+OLD_MIX = ["rsvp_in"] * 6 + ["rsvp_out"] * 2 + ["time_15m", "stats_input", "sel_opp_123456789_987654321",
+           "stat_matches_5", "stat_winsA_2", "lb_monthly", "dm_about"]
+NEW_MIX = [callbacks.encode("ri")] * 6 + [callbacks.encode("ro")] * 2 + [
+    callbacks.encode("tm", "15m"), callbacks.encode("si"), callbacks.encode("so", 123456789, 987654321),
+    callbacks.encode("sm", 5), callbacks.encode("sa", 2), callbacks.encode("lb", "m"), callbacks.encode("da")]
+
+
+def measure(fn, mix, presses):
+    n = len(mix)
+    start = time.perf_counter()
+    for i in range(presses):
+        fn(mix[i % n])
+    return (time.perf_counter() - start) / presses * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--presses", type=int, default=200000)
+    args = parser.parse_args()
+
+    assert all(callbacks.decode(d) for d in NEW_MIX + OLD_MIX)
+    print(f"{args.presses:,} presses, longest callback_data {max(len(d) for d in NEW_MIX)} bytes "
+          f"(old {max(len(d) for d in OLD_MIX)})")
+    print(f"{'old patterns + if-chain':<28}{measure(old_dispatch, OLD_MIX, args.presses):>8.0f} ns/press")
+    print(f"{'decode (v1)':<28}{measure(callbacks.decode, NEW_MIX, args.presses):>8.0f} ns/press")
+    print(f"{'decode (legacy strings)':<28}{measure(callbacks.decode, OLD_MIX, args.presses):>8.0f} ns/press")
+    # Last branch of the old chain
+    print(f"{'old, stats_input only':<28}{measure(old_dispatch, ['stats_input'], args.presses):>8.0f} ns/press")
+    print(f"{'decode, stats_input only':<28}{measure(callbacks.decode, [callbacks.encode('si')], args.presses):>8.0f} ns/press")
+
+
+if __name__ == "__main__":
+    main()
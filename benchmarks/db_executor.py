@@ -0,0 +1,79 @@
+"""
+Updates/sec with DB work inline on the event loop vs. on the run_db pool.
+
+Every statement is delayed by --latency ms to simulate a remote Postgres.
+Each fake update does one DB read plus one (simulated) Telegram API call.
+
+    python -m benchmarks.db_executor --updates 200 --latency 20
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks import use_scratch_db
+use_scratch_db()
+
+from sqlalchemy import event
+from database import engine, init_db, run_db, SessionLocal
+from models import Chat
+
+API_LATENCY = 0.01 # simulated Telegram round trip
+
+
+def _load_about(db, chat_id):
+    # Deliberately uncached, so every update really reaches the database
+    return db.query(Chat.about_text).filter_by(chat_id=chat_id).scalar()
+
+
+def add_db_latency(seconds):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _sleep(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(seconds)
+
+
+async def inline_handler(chat_id):
+    # Old style: blocking session inside the coroutine
+    with SessionLocal() as db:
+        about = _load_about(db, chat_id)
+    await asyncio.sleep(API_LATENCY)
+    return about
+
+
+async def executor_handler(chat_id):
+    about = await run_db(_load_about, chat_id)
+    await asyncio.sleep(API_LATENCY)
+    return about
+
+
+async def measure(handler, updates, concurrent):
+    start = time.perf_counter()
+    if concurrent:
+        await asyncio.gather(*(handler(i % 10) for i in range(updates)))
+    else:
+        for i in range(updates):
+            await handler(i % 10)
+    return updates / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=20, help="simulated DB latency per statement (ms)")
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as db:
+        db.add_all([Chat(chat_id=i, title=f"Chat {i}", about_text="hi") for i in range(10)])
+        db.commit()
+    add_db_latency(args.latency / 1000)
+
+    print(f"{args.updates} updates, {args.latency:.0f} ms DB latency, {API_LATENCY * 1000:.0f} ms API latency")
+    for concurrent in (False, True):
+        mode = "concurrent" if concurrent else "sequential"
+        before = await measure(inline_handler, args.updates, concurrent)
+        after = await measure(executor_handler, args.updates, concurrent)
+        print(f"{mode:<11} inline: {before:8.1f} upd/s   run_db: {after:8.1f} upd/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""Synthetic Telegram objects: real telegram.Update instances wired to a bot that records calls."""
+import asyncio
+import itertools
+from datetime import datetime
+from telegram import Update, Message, Chat, User, CallbackQuery, MessageEntity
+
+_ids = itertools.count(1)
+
+
+class FakeBot:
+    """Stands in for context.bot. Every API method succeeds instantly and is counted."""
+    defaults = None
+
+    def __init__(self):
+        self.calls = 0
+        self._message_ids = itertools.count(100000)
+
+    def __getattr__(self, name):
+        async def api_call(*args, **kwargs):
+            self.calls += 1
+            if name.startswith(("send_", "edit_message")):
+                chat = Chat(kwargs.get("chat_id", 0), Chat.SUPERGROUP)
+                msg = Message(next(self._message_ids), datetime.now(), chat, text=kwargs.get("text"))
+                msg.set_bot(self)
+                return msg
+            return True
+        return api_call
+
+
+class FakeApplication:
+    def create_task(self, coroutine, update=None):
+        return asyncio.ensure_future(coroutine)
+
+
+class FakeContext:
+    def __init__(self, bot, args=None, chat_data=None):
+        self.bot = bot
+        self.args = args or []
+        self.chat_data = {} if chat_data is None else chat_data
+        self.user_data = {}
+        self.bot_data = {}
+        self.application = FakeApplication()
+
+
+def _user(user_id):
+    return User(user_id, f"Player {user_id}", False, username=f"player{user_id}")
+
+def _chat(chat_id):
+    return Chat(chat_id, Chat.SUPERGROUP, title="Bench Group")
+
+
+def message_update(bot, chat_id, user_id, text, reply_to=None):
+    entities = None
+    if text.startswith("/"):
+        entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text.split()[0]))]
+    msg = Message(next(_ids), datetime.now(), _chat(chat_id), from_user=_user(user_id),
+                  text=text, entities=entities, reply_to_message=reply_to)
+    msg.set_bot(bot)
+    update = Update(next(_ids), message=msg)
+    update.set_bot(bot)
+    return update
+
+
+def callback_update(bot, chat_id, user_id, data, message_id):
+    msg = Message(message_id, datetime.now(), _chat(chat_id), text="...")
+    msg.set_bot(bot)
+    query = CallbackQuery(str(next(_ids)), _user(user_id), "bench", message=msg, data=data)
+    query.set_bot(bot)
+    update = Update(next(_ids), callback_query=query)
+    update.set_bot(bot)
+    return update
@@ -0,0 +1,180 @@
+"""
+Latency and SQL statements per call for the real handlers in features/,
+driven by synthetic updates against a seeded SQLite database.
+
+    python -m benchmarks.handlers
+    python -m benchmarks.handlers --matches 1000,100000,1000000 --members 50,5000 --iterations 200
+    python -m benchmarks.handlers --cold   # clear in-process caches before every call
+
+"matches" is the number of stored match series rows for the benchmark chat.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import use_scratch_db
+use_scratch_db()
+
+from sqlalchemy import event, insert
+from database import engine, init_db, SessionLocal
+from models import (Chat, User, ChatMember, VaultItem, RoastLine, GameSession,
+                    MatchStat, MatchSeries, PlayerMonthStat, BotSetting)
+from cache import registry
+from activity import activity_buffer
+from session_store import session_store
+from features import general, session, stats, vault, roast
+import callbacks
+from benchmarks.fakes import FakeBot, FakeContext, message_update, callback_update
+
+CHAT_ID = -100100
+SESSION_MSG = 777
+VAULT_KEYS = 1000
+ROASTS = 200
+BATCH = 50000
+
+
+# --- Seeding ---
+def seed(matches, members):
+    rng = random.Random(42)
+    with SessionLocal() as db:
+        for model in (PlayerMonthStat, MatchSeries, MatchStat, GameSession, RoastLine,
+                      VaultItem, ChatMember, User, Chat, BotSetting):
+            db.query(model).delete()
+
+        db.add(Chat(chat_id=CHAT_ID, title="Bench Group", primary_squad=[1, 2, 3, 4]))
+        db.flush()
+        db.execute(insert(User), [
+            {"user_id": uid, "full_name": f"Player {uid}", "username": f"player{uid}"}
+            for uid in range(1, members + 1)
+        ])
+        db.execute(insert(ChatMember), [
+            {"chat_id": CHAT_ID, "user_id": uid, "is_excluded": False} for uid in range(1, members + 1)
+        ])
+
+        # Results concentrate on a core of regulars, spread over two years
+        players = list(range(1, min(members, 40) + 1))
+        now = datetime.now(timezone.utc)
+        for start in range(0, matches, BATCH):
+            rows = []
+            for _ in range(min(BATCH, matches - start)):
+                a, b = rng.sample(players, 2)
+                played = rng.randint(1, 10)
+                wins_a = rng.randint(0, played)
+                wins_b = rng.randint(0, played - wins_a)
+                rows.append({
+                    "chat_id": CHAT_ID, "player_a_id": a, "player_b_id": b, "played": played,
+                    "wins_a": wins_a, "wins_b": wins_b, "draws": played - wins_a - wins_b,
+                    "timestamp": now - timedelta(minutes=rng.randint(0, 60 * 24 * 730)),
+                })
+            db.execute(insert(MatchSeries), rows)
+
+        db.execute(insert(VaultItem), [
+            {"chat_id": CHAT_ID, "keyword": f"key{i}", "item_type": "text", "content": f"saved text {i}"}
+            for i in range(VAULT_KEYS)
+        ])
+        db.execute(insert(RoastLine), [{"chat_id": CHAT_ID, "text": f"roast line {i}"} for i in range(ROASTS)])
+        db.add(GameSession(
+            message_id=SESSION_MSG, chat_id=CHAT_ID, session_type="2v2", initiator_id=1,
+            expires_at=now + timedelta(days=1),
+            state_data={"type": "2v2", "pA": 1, "squad": [1, 2, 3, 4], "in": [], "out": [], "pending": {}}
+        ))
+        db.commit()
+
+        stats.rebuild_rollups(db, CHAT_ID)
+    session_store.load()
+
+
+def reset_caches():
+    for c in registry.values():
+        c.clear()
+
+
+# --- Scenarios: each returns a coroutine for iteration i ---
+def scenarios(bot, members):
+    rng = random.Random(7)
+
+    async def flush_100_sightings(i):
+        for _ in range(100):
+            uid = rng.randint(1, members)
+            activity_buffer.record(CHAT_ID, "Bench Group", uid, f"Player {uid}", f"player{uid}")
+        await activity_buffer.flush()
+
+    def rsvp(i):
+        data = callbacks.encode("ri" if i % 2 == 0 else "ro")
+        return callbacks.route(callback_update(bot, CHAT_ID, 1 + i % 4, data, SESSION_MSG), FakeContext(bot))
+
+    return {
+        "track_activity": lambda i: general.track_activity(
+            message_update(bot, CHAT_ID, rng.randint(1, members), "gg"), FakeContext(bot)),
+        "activity flush (100)": flush_100_sightings,
+        "mention_all": lambda i: general.mention_all(message_update(bot, CHAT_ID, 1, "/all"), FakeContext(bot)),
+        "rsvp in/out": rsvp,
+        "lb overall": lambda i: callbacks.route(
+            callback_update(bot, CHAT_ID, 1, callbacks.encode("lb", "o"), 500), FakeContext(bot)),
+        "lb monthly": lambda i: callbacks.route(
+            callback_update(bot, CHAT_ID, 1, callbacks.encode("lb", "m"), 500), FakeContext(bot)),
+        "player profile": lambda i: stats.show_individual_stats(
+            message_update(bot, CHAT_ID, 1 + i % 10, "/stats"), FakeContext(bot)),
+        "recall_item": lambda i: vault.recall_item(
+            message_update(bot, CHAT_ID, 1, f"/q key{i % VAULT_KEYS}"), FakeContext(bot, [f"key{i % VAULT_KEYS}"])),
+        "roast_command": lambda i: roast.roast_command(message_update(bot, CHAT_ID, 1, "/roast"), FakeContext(bot)),
+    }
+
+
+async def run_scenario(make_call, iterations, cold, counter):
+    latencies, statements = [], []
+    for i in range(iterations):
+        if cold:
+            reset_caches()
+        coro = make_call(i)
+        before = counter[0]
+        start = time.perf_counter()
+        await coro
+        latencies.append((time.perf_counter() - start) * 1000)
+        statements.append(counter[0] - before)
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "sql": statistics.mean(statements),
+        "sql_max": max(statements),
+    }
+
+
+def parse_sizes(value):
+    return [int(float(v.lower().replace("k", "e3").replace("m", "e6"))) for v in value.split(",")]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", default="1k,100k", help="comma list, e.g. 1k,100k,1m")
+    parser.add_argument("--members", default="50,5k", help="comma list, e.g. 50,5k")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--cold", action="store_true", help="clear caches before every call")
+    args = parser.parse_args()
+
+    init_db()
+    counter = [0]
+    @event.listens_for(engine, "after_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+
+    bot = FakeBot()
+    for matches in parse_sizes(args.matches):
+        for members in parse_sizes(args.members):
+            start = time.perf_counter()
+            seed(matches, members)
+            reset_caches()
+            print(f"\n== {matches:,} match series, {members:,} members "
+                  f"(seeded in {time.perf_counter() - start:.1f}s, {'cold' if args.cold else 'warm'} caches) ==")
+            print(f"{'handler':<22}{'p50 ms':>9}{'p95 ms':>9}{'sql/call':>10}{'sql max':>9}")
+            for name, make_call in scenarios(bot, members).items():
+                r = await run_scenario(make_call, args.iterations, args.cold, counter)
+                print(f"{name:<22}{r['p50']:>9.2f}{r['p95']:>9.2f}{r['sql']:>10.2f}{r['sql_max']:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Cost of one update_persistence run: DBPersistence vs PTB's PicklePersistence.
+
+Every chat holds an open stats wizard. Each cycle, --touched chats saw updates
+and half of those actually changed their chat_data; the rest come back unchanged,
+as they do in PTB. The calls are gathered and then written out the way
+Application.update_persistence does it.
+
+    python -m benchmarks.persistence --chats 1k,10k --touched 20 --cycles 50
+
+PicklePersistence with on_flush=False rewrites its whole file for every changed
+chat; with on_flush=True it writes nothing until shutdown, so its "flush" column
+is the one dump that has to happen then (and everything since the start is lost
+on a crash).
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import use_scratch_db
+use_scratch_db()
+
+from telegram.ext import PicklePersistence
+from database import init_db
+from persistence import DBPersistence
+from benchmarks.handlers import parse_sizes
+
+
+def wizard(chat_id, step):
+    return {"stats_wizards": {str(chat_id % 1000 + 1): {
+        "pA": 10 + chat_id % 7, "pB": 20 + chat_id % 5, "started": 1700000000.0 + step,
+        "matches": step % 9, "winsA": step % 4,
+    }}}
+
+
+async def seed(persistence, chats):
+    if isinstance(persistence, DBPersistence):
+        await asyncio.gather(*(persistence.update_chat_data(chat_id, wizard(chat_id, 0)) for chat_id in range(chats)))
+    else: # one dump, not one per chat
+        persistence.chat_data = {chat_id: wizard(chat_id, 0) for chat_id in range(chats)}
+    await persistence.flush()
+
+
+async def cycle(persistence, chats, touched, step):
+    ids = random.sample(range(chats), touched)
+    # PTB passes the live chat_data objects; copies here keep Pickle's equality check honest
+    await asyncio.gather(*(
+        persistence.update_chat_data(chat_id, wizard(chat_id, step if i % 2 else 0))
+        for i, chat_id in enumerate(ids)
+    ))
+    if isinstance(persistence, DBPersistence):
+        await persistence.flush()
+
+
+async def measure(persistence, chats, touched, cycles):
+    await seed(persistence, chats)
+    start = time.perf_counter()
+    for step in range(1, cycles + 1):
+        await cycle(persistence, chats, touched, step)
+    per_cycle = (time.perf_counter() - start) / cycles * 1000
+    start = time.perf_counter()
+    await persistence.flush()
+    return per_cycle, (time.perf_counter() - start) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", default="1k,10k")
+    parser.add_argument("--touched", type=int, default=20, help="chats with updates per cycle")
+    parser.add_argument("--cycles", type=int, default=50)
+    args = parser.parse_args()
+    init_db()
+
+    print(f"{args.touched} chats touched per cycle, half of them changed")
+    print(f"{'chats':>7}  {'persistence':<24}{'ms/cycle':>10}{'flush ms':>10}")
+    for chats in parse_sizes(args.chats):
+        folder = tempfile.mkdtemp(prefix="marceline-pickle-")
+        contenders = (
+            ("DBPersistence", DBPersistence()),
+            ("Pickle on_flush=False", PicklePersistence(os.path.join(folder, "a.pickle"), on_flush=False)),
+            ("Pickle on_flush=True", PicklePersistence(os.path.join(folder, "b.pickle"), on_flush=True)),
+        )
+        for name, persistence in contenders:
+            random.seed(chats)
+            per_cycle, flush_ms = await measure(persistence, chats, args.touched, args.cycles)
+            print(f"{chats:>7}  {name:<24}{per_cycle:>10.2f}{flush_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
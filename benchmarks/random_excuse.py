@@ -0,0 +1,84 @@
+"""
+/excuse latency: ORDER BY random() over the chat's excuses vs a pick from the
+cached id array.
+
+    python -m benchmarks.random_excuse --excuses 10k,50k,200k --iterations 500
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks import use_scratch_db
+use_scratch_db()
+
+from sqlalchemy import insert, func
+from database import init_db, SessionLocal, run_db
+from models import VaultItem
+from features import vault
+from benchmarks.handlers import parse_sizes
+
+CHAT_ID = -100300
+OTHER_CHAT = -100301 # rows in another chat, so the filter has work to do
+
+
+def seed(excuses):
+    with SessionLocal() as db:
+        db.query(VaultItem).delete()
+        for chat_id in (CHAT_ID, OTHER_CHAT):
+            db.execute(insert(VaultItem), [
+                {"chat_id": chat_id, "keyword": f"ex{i}", "item_type": "excuse" if i % 4 else "text",
+                 "content": f"my wifi died during round {i}"}
+                for i in range(excuses * 4 // 3)
+            ])
+        db.commit()
+
+
+def _order_by_random(db, chat_id):
+    # The query /excuse used to run
+    item = db.query(VaultItem).filter_by(chat_id=chat_id, item_type="excuse").order_by(func.random()).first()
+    return item.content if item else None
+
+
+async def old_excuse():
+    return await run_db(_order_by_random, CHAT_ID)
+
+
+async def new_excuse():
+    ids = await vault.excuse_ids(CHAT_ID)
+    return await run_db(vault._excuse_content, random.choice(ids))
+
+
+async def measure(call, iterations):
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        assert await call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--excuses", default="10k,50k")
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    init_db()
+    for excuses in parse_sizes(args.excuses):
+        seed(excuses)
+        vault.excuse_cache.clear()
+        start = time.perf_counter()
+        await vault.excuse_ids(CHAT_ID)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        print(f"\n== {excuses:,} excuses: id array loaded in {load_ms:.1f} ms ==")
+        print(f"{'strategy':<20}{'p50 ms':>9}{'p95 ms':>9}")
+        for name, call in (("ORDER BY random()", old_excuse), ("cached ids", new_excuse)):
+            p50, p95 = await measure(call, args.iterations)
+            print(f"{name:<20}{p50:>9.3f}{p95:>9.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
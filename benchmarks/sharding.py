@@ -0,0 +1,128 @@
+"""
+Throughput of sharded mode against the number of worker processes.
+
+The front (sharding.ShardWebhookServer + ShardRouter) receives updates for many
+chats over kept-alive webhook connections and routes them to N workers. Each
+worker's handler burns --work-ms of CPU, standing in for a leaderboard render, so
+one process tops out at about 1000 / work_ms updates/s. Run it on a multi-core box:
+
+    python -m benchmarks.sharding --shards 1,2,4 --updates 2000 --work-ms 5
+"""
+import argparse
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import time
+
+from benchmarks import use_scratch_db
+use_scratch_db()
+
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+from sharding import ShardRouter, ShardWebhookServer
+from webhook import SECRET_HEADER
+from benchmarks.webhook import FakeBotAPI, make_update, read_request_status, HOST, API_PORT
+from benchmarks.handlers import parse_sizes
+
+FRONT_PORT = 18083
+SECRET = "bench-secret"
+CONNECTIONS = 40
+
+
+def burn(n):
+    # A fixed amount of CPU, not of wall time: workers sharing a core must really compete
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def calibrate(work_ms):
+    n = 100000
+    start = time.perf_counter()
+    burn(n)
+    return max(1, int(n * work_ms / 1000 / (time.perf_counter() - start)))
+
+
+def build_bench_app(done, work, index, shards):
+    app = ApplicationBuilder().token("1:bench").base_url(f"http://{HOST}:{API_PORT}/bot").build()
+
+    async def render(update, context):
+        burn(work)
+        with done.get_lock():
+            done.value += 1
+
+    app.add_handler(MessageHandler(filters.ALL, render))
+    return app
+
+
+async def post_all(total):
+    pool = asyncio.Queue()
+    for _ in range(CONNECTIONS):
+        pool.put_nowait(await asyncio.open_connection(HOST, FRONT_PORT))
+
+    async def post(update_id):
+        reader, writer = await pool.get()
+        body = json.dumps(make_update(update_id)).encode()
+        writer.write(
+            f"POST /telegram HTTP/1.1\r\nHost: bench\r\n{SECRET_HEADER}: {SECRET}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        assert await read_request_status(reader) == 200
+        pool.put_nowait((reader, writer))
+
+    await asyncio.gather(*(post(i) for i in range(1, total + 1)))
+    while not pool.empty():
+        pool.get_nowait()[1].close()
+
+
+async def run(shards, total, work):
+    api = FakeBotAPI(0)
+    await api.start()
+    done = multiprocessing.get_context("spawn").Value("i", 0)
+    router = ShardRouter(shards, functools.partial(build_bench_app, done, work))
+    router.start()
+    server = ShardWebhookServer(router, "telegram", SECRET)
+    await server.start(HOST, FRONT_PORT)
+
+    # Let every worker get through startup before the clock starts
+    await post_all(shards * 10)
+    while done.value < shards * 10:
+        await asyncio.sleep(0.05)
+    done.value = 0
+
+    start = time.perf_counter()
+    await post_all(total)
+    while done.value < total:
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start
+
+    await server.stop()
+    stop_start = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, router.stop)
+    stop_s = time.perf_counter() - stop_start
+    await api.stop()
+    return total / elapsed, stop_s, router.routed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", default="1,2,4")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--work-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.updates} updates, {args.work_ms} ms CPU per update")
+    print(f"{'shards':>6}{'updates/s':>11}{'speedup':>9}{'stop s':>8}  routed per shard")
+    work = calibrate(args.work_ms)
+    base = None
+    for shards in parse_sizes(args.shards):
+        rate, stop_s, routed = await run(shards, args.updates, work)
+        base = base or rate
+        print(f"{shards:>6}{rate:>11.0f}{rate / base:>8.1f}x{stop_s:>8.2f}  {routed}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
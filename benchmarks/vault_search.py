@@ -0,0 +1,94 @@
+"""
+/qsearch and /q-miss suggestion latency on a chat with many saves.
+
+    python -m benchmarks.vault_search --saves 10k,50k --queries 500
+"""
+import argparse
+import asyncio
+import random
+import string
+import time
+
+from benchmarks import use_scratch_db
+use_scratch_db()
+
+from sqlalchemy import insert
+from database import init_db, SessionLocal
+from models import VaultItem
+from features import vault
+from benchmarks.handlers import parse_sizes
+
+CHAT_ID = -100200
+# ~100 consonant-vowel syllables plus gamer slang, so keywords share trigrams the way real ones do
+SYLLABLES = [c + v for c in "bcdfghklmnprstvwyz" for v in "aeiou"] + ["gg", "ez", "noob", "clutch", "lag", "pro"]
+
+
+def make_keyword(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) + str(rng.randint(0, 99))
+
+
+def seed(saves, rng):
+    keywords = set()
+    while len(keywords) < saves:
+        keywords.add(make_keyword(rng))
+    keywords = sorted(keywords)
+    with SessionLocal() as db:
+        db.query(VaultItem).delete()
+        rows = []
+        for i, k in enumerate(keywords):
+            excuse = i % 10 == 0
+            rows.append({
+                "chat_id": CHAT_ID, "keyword": k, "item_type": "excuse" if excuse else "text",
+                "content": " ".join(rng.choice(["lag", "ping", "wifi", "cat", "keyboard", "sun", "ref"]) for _ in range(5))
+                           if excuse else f"saved text {i}",
+            })
+        db.execute(insert(VaultItem), rows)
+        db.commit()
+    return keywords
+
+
+def queries(keywords, rng, n):
+    def typo(k):
+        i = rng.randrange(len(k))
+        return k[:i] + rng.choice(string.ascii_lowercase) + k[i + 1:]
+    kinds = {
+        "exact": lambda: rng.choice(keywords),
+        "prefix": lambda: rng.choice(keywords)[:3],
+        "typo": lambda: typo(rng.choice(keywords)),
+        "excuse words": lambda: "wifi lag",
+        "miss": lambda: "".join(rng.choice(string.ascii_lowercase) for _ in range(8)),
+    }
+    return {kind: [make() for _ in range(n)] for kind, make in kinds.items()}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--saves", default="10k,50k")
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    init_db()
+    rng = random.Random(3)
+    for saves in parse_sizes(args.saves):
+        keywords = seed(saves, rng)
+        vault.search_cache.clear()
+
+        start = time.perf_counter()
+        index = await vault.search_index(CHAT_ID)
+        load_ms = (time.perf_counter() - start) * 1000
+        print(f"\n== {saves:,} saves: index loaded in {load_ms:.0f} ms ({len(index.grams):,} trigrams) ==")
+        print(f"{'query':<14}{'p50 ms':>9}{'p95 ms':>9}{'hits':>7}")
+        for kind, qs in queries(keywords, rng, args.queries).items():
+            latencies, hits = [], 0
+            for q in qs:
+                start = time.perf_counter()
+                found = (await vault.search_index(CHAT_ID)).search(q, limit=10)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += bool(found)
+            latencies.sort()
+            print(f"{kind:<14}{latencies[len(latencies) // 2]:>9.2f}"
+                  f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:>9.2f}{hits / len(qs):>7.0%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,228 @@
+"""
+End-to-end update latency: webhook listener vs getUpdates long polling.
+
+A local fake Bot API serves getMe/getUpdates/setWebhook. The load generator
+produces message updates at a fixed rate and either queues them for getUpdates
+or POSTs them to webhook.WebhookServer over kept-alive connections, the way
+Telegram does. Latency runs from "Telegram has the update" to the handler.
+
+    python -m benchmarks.webhook --rates 20,200,1000 --updates 2000 --rtt 0,40
+
+--rtt adds a simulated round trip (ms) between Telegram and the bot.
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+
+from benchmarks import use_scratch_db
+use_scratch_db()
+
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+from webhook import WebhookServer, read_request, respond, SECRET_HEADER
+from benchmarks.handlers import parse_sizes
+
+HOST = "127.0.0.1"
+API_PORT = 18081
+WEBHOOK_PORT = 18082
+SECRET = "bench-secret"
+CONNECTIONS = 40 # Telegram's default max_connections for a webhook
+CHATS = 50
+
+ME = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+def make_update(update_id):
+    chat_id = -1000 - update_id % CHATS
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": "gg",
+            "chat": {"id": chat_id, "type": "supergroup", "title": "Bench"},
+            "from": {"id": 10 + update_id % 7, "is_bot": False, "first_name": "P"},
+        },
+    }
+
+
+class FakeBotAPI:
+    """The slice of the Bot API that polling and setWebhook need."""
+
+    def __init__(self, rtt):
+        self.half_rtt = rtt / 2000
+        self.pending = []
+        self.arrived = asyncio.Event()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, HOST, API_PORT)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def push(self, update):
+        self.pending.append(update)
+        self.arrived.set()
+
+    async def handle(self, reader, writer):
+        try:
+            while (request := await read_request(reader)) is not None:
+                method_name = request[1].rsplit("/", 1)[-1]
+                if request[2].get("content-type", "").startswith("application/json"):
+                    params = json.loads(request[3] or b"{}")
+                else: # PTB sends form fields
+                    params = {k: v[0] for k, v in parse_qs(request[3].decode()).items()}
+                await asyncio.sleep(self.half_rtt) # request travels to Telegram
+                result = await self.call(method_name, params)
+                await asyncio.sleep(self.half_rtt) # response travels back
+                respond(writer, 200, json.dumps({"ok": True, "result": result}).encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def call(self, method_name, params):
+        if method_name == "getMe":
+            return ME
+        if method_name != "getUpdates":
+            return True
+        offset = int(params.get("offset", 0))
+        self.pending = [u for u in self.pending if u["update_id"] >= offset]
+        if not self.pending:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), float(params.get("timeout", 10)))
+            except asyncio.TimeoutError:
+                return []
+        return self.pending[:int(params.get("limit", 100))]
+
+
+def build_app(sent, latencies, done, total):
+    app = (
+        ApplicationBuilder()
+        .token("1:bench")
+        .base_url(f"http://{HOST}:{API_PORT}/bot")
+        .base_file_url(f"http://{HOST}:{API_PORT}/file/bot")
+        .build()
+    )
+
+    async def record(update, context):
+        latencies.append((time.perf_counter() - sent[update.update_id]) * 1000)
+        if len(latencies) == total:
+            done.set()
+
+    app.add_handler(MessageHandler(filters.ALL, record))
+    return app
+
+
+async def generate(rate, total, sent, deliver):
+    start = time.perf_counter()
+    tasks = []
+    for update_id in range(1, total + 1):
+        delay = start + (update_id - 1) / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent[update_id] = time.perf_counter()
+        tasks.append(asyncio.create_task(deliver(make_update(update_id))))
+    await asyncio.gather(*tasks)
+
+
+async def run_polling(rate, total, rtt):
+    api = FakeBotAPI(rtt)
+    await api.start()
+    sent, latencies, done = {}, [], asyncio.Event()
+    app = build_app(sent, latencies, done, total)
+    async with app:
+        await app.updater.start_polling(poll_interval=0, timeout=10)
+        await app.start()
+
+        async def deliver(update):
+            api.push(update)
+
+        started = time.perf_counter()
+        await generate(rate, total, sent, deliver)
+        await done.wait()
+        elapsed = time.perf_counter() - started
+        await app.updater.stop()
+        await app.stop()
+    await api.stop()
+    return latencies, elapsed
+
+
+async def run_webhook(rate, total, rtt):
+    api = FakeBotAPI(rtt)
+    await api.start()
+    sent, latencies, done = {}, [], asyncio.Event()
+    app = build_app(sent, latencies, done, total)
+    async with app:
+        await app.start()
+        server = WebhookServer(app, "telegram", SECRET)
+        await server.start(HOST, WEBHOOK_PORT)
+
+        pool = asyncio.Queue()
+        for _ in range(CONNECTIONS):
+            pool.put_nowait(await asyncio.open_connection(HOST, WEBHOOK_PORT))
+
+        async def deliver(update):
+            await asyncio.sleep(rtt / 2000) # Telegram -> bot
+            reader, writer = await pool.get()
+            body = json.dumps(update).encode()
+            writer.write(
+                f"POST /telegram HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                f"{SECRET_HEADER}: {SECRET}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            status = await read_request_status(reader)
+            pool.put_nowait((reader, writer))
+            assert status == 200, status
+
+        started = time.perf_counter()
+        await generate(rate, total, sent, deliver)
+        await done.wait()
+        elapsed = time.perf_counter() - started
+        while not pool.empty():
+            pool.get_nowait()[1].close()
+        await server.stop()
+        await app.stop()
+    await api.stop()
+    return latencies, elapsed
+
+
+async def read_request_status(reader):
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+def pct(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rates", default="20,200,1000", help="updates per second")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rtt", default="0,40", help="simulated Telegram round trip, ms")
+    args = parser.parse_args()
+
+    for rtt in parse_sizes(args.rtt):
+        print(f"\n== round trip {rtt} ms, {args.updates} updates ==")
+        print(f"{'mode':<9}{'rate/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'handled/s':>11}")
+        for rate in parse_sizes(args.rates):
+            for mode, run in (("polling", run_polling), ("webhook", run_webhook)):
+                latencies, elapsed = await run(rate, min(args.updates, rate * 20), rtt)
+                latencies.sort()
+                print(f"{mode:<9}{rate:>8}{pct(latencies, 0.5):>9.1f}{pct(latencies, 0.95):>9.1f}"
+                      f"{pct(latencies, 0.99):>9.1f}{len(latencies) / elapsed:>11.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
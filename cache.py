@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+
+# name -> TTLCache, so hit/miss counters can be reported in one place
+registry = {}
+
+
+class Generations:
+    """
+    Write counters per scope (a chat, usually), shared by the caches holding data about it.
+    Bumping a scope makes everything cached under its older counter stale, including
+    values that were still being loaded when the write landed.
+
+    Counters come from one sequence, so a bumped scope never gets an old value back.
+    Bounded: a scope that falls out reads as the highest counter dropped so far, which
+    at worst makes a few current entries look stale and costs a reload.
+    """
+
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self._counters = OrderedDict() # scope -> counter, least recently bumped first
+        self._last = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def current(self, scope):
+        with self._lock:
+            return self._counters.get(scope, self._floor)
+
+    def bump(self, scope):
+        with self._lock:
+            self._last += 1
+            self._counters[scope] = self._last
+            self._counters.move_to_end(scope)
+            while len(self._counters) > self.maxsize:
+                _, dropped = self._counters.popitem(last=False)
+                self._floor = max(self._floor, dropped)
+            return self._last
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with a per-entry time-to-live.
+    Thread safe: it is read from handlers on the event loop and from run_db workers.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=600, generations=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generations = generations # for fetch/invalidate
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        registry[name] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    async def fetch(self, key, load, scope=None):
+        """
+        Read-through by generation: the value cached for key if it was loaded at scope's
+        current generation, else `await load()`, kept only if scope wasn't invalidated
+        while it loaded. scope defaults to key.
+        """
+        scope = key if scope is None else scope
+        gen = self.generations.current(scope)
+        entry = self.get(key)
+        if entry is not None and entry[0] == gen:
+            return entry[1]
+        value = await load()
+        if self.generations.current(scope) == gen:
+            self.set(key, (gen, value))
+        return value
+
+    def invalidate(self, scope):
+        """Call after a committed write: bumps scope's generation and drops the entry keyed by it."""
+        self.generations.bump(scope)
+        self.pop(scope)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data), "hits": self.hits, "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def cache_stats():
+    return {name: c.stats() for name, c in registry.items()}
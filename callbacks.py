@@ -0,0 +1,91 @@
+"""
+Compact, versioned callback_data and the router that dispatches it.
+
+    "1so:123456789:987654321"  ->  version 1, op "so", args (123456789, 987654321)
+
+Features register one coroutine per op with the argument types it expects:
+
+    @register("so", int, int)
+    async def select_opponent(update, context, opp_id, host_id): ...
+
+and build buttons with encode("so", opp_id, host_id). A single CallbackQueryHandler(route)
+in main.py decodes the data and finds the handler with one dict lookup.
+Buttons still carrying the old "rsvp_in" / "stat_matches_3" style strings are mapped
+onto the same ops until those messages age out.
+"""
+import perf
+
+VERSION = "1"
+SEP = ":"
+MAX_BYTES = 64 # Bot API limit for callback_data
+
+_routes = {} # op -> (handler, arg types)
+_legacy_exact = {} # old callback_data -> (op, args)
+_legacy_prefixes = [] # (old prefix, op), args follow the prefix separated by "_"
+
+
+def register(op, *types):
+    def decorator(fn):
+        if op in _routes:
+            raise ValueError(f"callback op {op!r} registered twice")
+        _routes[op] = (fn, types)
+        return fn
+    return decorator
+
+
+def legacy(old, op, *args):
+    """Maps a pre-v1 callback string (or, ending in "_", prefix) onto an op."""
+    if old.endswith("_"):
+        _legacy_prefixes.append((old, op))
+    else:
+        _legacy_exact[old] = (op, tuple(str(a) for a in args))
+
+
+def encode(op, *args):
+    data = VERSION + op + "".join(SEP + str(a) for a in args)
+    if len(data.encode()) > MAX_BYTES:
+        raise ValueError(f"callback_data over {MAX_BYTES} bytes: {data!r}")
+    return data
+
+
+def decode(data):
+    """Returns (handler, typed args), or None for unknown, stale or malformed data."""
+    if not data:
+        return None
+    if data[:1] == VERSION:
+        op, _, rest = data[1:].partition(SEP)
+        raw = rest.split(SEP) if rest else ()
+    else:
+        op, raw = _decode_legacy(data)
+    route = _routes.get(op)
+    if route is None:
+        return None
+    fn, types = route
+    if len(raw) != len(types):
+        return None
+    if not types:
+        return fn, ()
+    try:
+        return fn, tuple([t(v) for t, v in zip(types, raw)])
+    except ValueError:
+        return None
+
+
+def _decode_legacy(data):
+    if data in _legacy_exact:
+        return _legacy_exact[data]
+    for prefix, op in _legacy_prefixes:
+        if data.startswith(prefix):
+            return op, data[len(prefix):].split("_")
+    return None, []
+
+
+async def route(update, context):
+    query = update.callback_query
+    decoded = decode(query.data)
+    if decoded is None:
+        await query.answer("⌛ This button is no longer active.")
+        return
+    fn, args = decoded
+    perf.rename(fn.__name__)
+    await fn(update, context, *args)
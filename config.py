@@ -6,6 +6,17 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 SUPERADMIN_ID = int(os.getenv("SUPERADMIN_ID", "0"))
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot.db")
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4")) # threads running DB work off the event loop
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8")) # handlers running at once (one per chat at a time)
+SHARDS = int(os.getenv("SHARDS", "1")) # worker processes; chats are split between them by id
+
+# How updates arrive: "polling" (default) or "webhook"
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")            # public https base URL, e.g. https://marceline.herokuapp.com
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", os.getenv("WEBHOOK_PORT", "8443"))) # Heroku web dynos set PORT
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")      # random per start when unset
 
 # Fix for Heroku Postgres URL (needs postgresql:// instead of postgres://)
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
@@ -1,19 +1,47 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from config import DATABASE_URL
+from config import DATABASE_URL, DB_WORKERS
 
 engine = create_engine(DATABASE_URL)
 # Changed: Removed scoped_session to ensure fresh sessions per request
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
-    session = SessionLocal()
-    try:
-        yield session
-    finally:
-        session.close()
+# Handlers are async, but SQLAlchemy sessions are blocking.
+# All DB work runs on this bounded pool so a slow query never stalls the event loop.
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+def _unit_of_work(fn, args, kwargs):
+    with SessionLocal() as db:
+        return fn(db, *args, **kwargs)
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Runs fn(db, *args, **kwargs) with a fresh session on the DB thread pool.
+    fn should return plain values, not ORM objects (the session is closed afterwards).
+    """
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context into the worker so perf tracing can attribute the queries
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, ctx.run, _unit_of_work, fn, args, kwargs)
+
+def dialect_insert(db):
+    """The INSERT construct that supports ON CONFLICT for this backend, or None."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
 
 def init_db():
+    import models # noqa: F401 - register every table on Base
+    from migrations import run_migrations
     Base.metadata.create_all(bind=engine)
+    run_migrations()
@@ -1,9 +1,32 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from database import get_db, init_db
-from models import Chat, GameSession, MatchStat
+from database import run_db
+from models import Chat, GameSession, MatchStat, MatchSeries, PlayerMonthStat
+from identity import forget_chat
+from session_store import session_store
+from pagination import paged_list, keyset_page, send_first_page
+from cache import cache_stats
+from datetime import datetime
 from config import SUPERADMIN_ID
 
+# --- DB units of work (run via run_db) ---
+def _reset_chat(db, chat_id):
+    db.query(MatchStat).filter_by(chat_id=chat_id).delete()
+    db.query(MatchSeries).filter_by(chat_id=chat_id).delete()
+    db.query(PlayerMonthStat).filter_by(chat_id=chat_id).delete()
+    db.query(GameSession).filter_by(chat_id=chat_id).delete()
+    db.commit()
+
+def _groups_page(db, chat_id, after, before, size):
+    return keyset_page(db.query(Chat.chat_id, Chat.title), Chat.chat_id, after, before, size)
+
+def _forget_chat(db, chat_id):
+    c = db.query(Chat).filter_by(chat_id=chat_id).first()
+    if c: 
+        db.delete(c)
+        db.commit()
+        forget_chat(chat_id)
+
 async def reset_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != SUPERADMIN_ID: return
     if not context.args or context.args[0] != "CONFIRM":
@@ -11,20 +34,19 @@ async def reset_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        db.query(MatchStat).filter_by(chat_id=chat_id).delete()
-        db.query(GameSession).filter_by(chat_id=chat_id).delete()
-        db.commit()
+    await run_db(_reset_chat, chat_id)
+    session_store.discard_chat(chat_id)
+    from features.stats import forget_rendered
+    forget_rendered(chat_id)
     await update.message.reply_text("Reset complete.")
 
+paged_list("gr", _groups_page, lambda row, n: f"{row.title} ({row.chat_id})",
+           title="Active Groups:", empty="No groups.",
+           allowed=lambda update: update.effective_user.id == SUPERADMIN_ID)
+
 async def list_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != SUPERADMIN_ID: return
-    with next(get_db()) as db:
-        chats = db.query(Chat).all()
-        msg = "Active Groups:\n"
-        for c in chats:
-            msg += f"{c.title} ({c.chat_id})\n"
-        await update.message.reply_text(msg)
+    await send_first_page(update, "gr")
 
 async def leave_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Usage: /groupdel [chat_id] (or current if empty)
@@ -39,10 +61,78 @@ async def leave_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.leave_chat(target_id)
         await update.message.reply_text(f"Left group {target_id}.")
         # Optional: Remove from DB logic here if strict
-        with next(get_db()) as db:
-            c = db.query(Chat).filter_by(chat_id=target_id).first()
-            if c: 
-                db.delete(c)
-                db.commit()
+        await run_db(_forget_chat, target_id)
     except Exception as e:
         await update.message.reply_text(f"Error leaving: {e}")
+
+async def rebuild_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Usage: /statsrebuild [all] -> regenerate leaderboard rollups from raw match history
+    if update.effective_user.id != SUPERADMIN_ID: return
+    from features.stats import rebuild_rollups, forget_rendered
+
+    chat_id = None if context.args and context.args[0] == "all" else update.effective_chat.id
+    rows = await run_db(rebuild_rollups, chat_id)
+    forget_rendered(chat_id)
+    await update.message.reply_text(f"Rebuilt {rows} leaderboard rows.")
+
+async def show_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != SUPERADMIN_ID: return
+    msg = "Cache Stats:\n"
+    for name, st in cache_stats().items():
+        msg += f"{name}: {st['size']} rows, {st['hits']} hits / {st['misses']} misses ({st['hit_rate']:.0%})\n"
+    await update.message.reply_text(msg)
+
+async def show_perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != SUPERADMIN_ID: return
+    import perf
+    from activity import activity_buffer
+
+    rows, slowest = perf.summary()
+    msg = "<b>⏱ Handlers (p50/p95 ms, p95 sql/db ms/api ms)</b>\n"
+    for r in rows[:15]:
+        msg += (f"{r['handler']} ×{r['count']}: {r['p50']:.0f}/{r['p95']:.0f} ms, "
+                f"{r['sql_p95']:.0f} sql, db {r['db_p95']:.0f}, api {r['api_p95']:.0f}\n")
+
+    msg += "\n<b>🐢 Slowest recent updates</b>\n"
+    for t in slowest:
+        msg += (f"{datetime.fromtimestamp(t.started):%H:%M:%S} {t.handler}: {t.wall_ms:.0f} ms "
+                f"({t.sql} sql / {t.db_ms:.0f} ms, {t.api_calls} api / {t.api_ms:.0f} ms)\n")
+
+    bg = perf.background
+    msg += f"\n<b>Background</b>: {bg.sql} sql / {bg.db_ms:.0f} ms, {bg.api_calls} api / {bg.api_ms:.0f} ms\n"
+    a = activity_buffer.stats
+    ss = session_store.stats
+    msg += (f"<b>Session store</b>: {len(session_store)} live, {len(session_store.dirty)} dirty, "
+            f"{ss['writes']} writes → {ss['rows_flushed']} rows in {ss['flushes']} flushes\n")
+    msg += (f"<b>Activity buffer</b>: {len(activity_buffer)} pending, {a['flushes']} flushes, "
+            f"last {a['last_flush_size']} rows / {a['last_lag']:.1f}s lag, max lag {a['max_lag']:.1f}s\n")
+    for name, st in cache_stats().items():
+        msg += f"<b>{name}</b>: {st['size']} rows, {st['hit_rate']:.0%} hits\n"
+
+    processor = context.application.update_processor
+    if hasattr(processor, "busiest"):
+        p = processor.stats
+        waiting, chats = processor.depth()
+        busiest = ", ".join(f"{cid} {n}" for cid, n in processor.busiest()) or "none"
+        msg += (f"<b>Updates</b>: {processor.running}/{processor.workers} running, {waiting} waiting in {chats} chats "
+                f"(busiest: {busiest}), max chat backlog {p['max_chat_depth']}, "
+                f"chat wait avg {p['chat_wait_ms_total'] / (p['processed'] or 1):.0f} / max {p['max_chat_wait_ms']:.0f} ms, "
+                f"{p['slot_yields']} rate-limit waits off-slot\n")
+
+    persistence = context.application.persistence
+    if hasattr(persistence, "written"):
+        ps = persistence.stats
+        msg += (f"<b>Persistence</b>: {len(persistence.written)} keys, {len(persistence.dirty)} dirty, "
+                f"{ps['updates']} updates ({ps['unchanged']} unchanged) → {ps['rows_written']} rows "
+                f"in {ps['flushes']} writes, {ps['errors']} errors\n")
+
+    scheduler = getattr(context.bot, "rate_limiter", None)
+    if scheduler is not None and hasattr(scheduler, "depth"):
+        from scheduler import PRIORITY_NAMES
+        s = scheduler.stats
+        sent = sum(s["sent"]) or 1
+        queued = ", ".join(f"{n} {d}" for n, d in zip(PRIORITY_NAMES, scheduler.depth()))
+        msg += (f"<b>Outbound queue</b>: {queued} (max {s['max_depth']}), "
+                f"wait avg {s['wait_ms_total'] / sent:.0f} / max {s['max_wait_ms']:.0f} ms, "
+                f"{s['retry_after']} RetryAfter, {len(scheduler.chats)} chat buckets\n")
+    await update.message.reply_text(msg, parse_mode="HTML")
@@ -1,8 +1,12 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, MessageEntity
 from telegram.ext import ContextTypes
-from database import get_db
+from database import run_db
 from models import ChatMember, User, Chat, BotSetting
-from utils import ensure_user_and_chat, get_chat_member_name
+from utils import get_chat_member_name
+from activity import activity_buffer
+from identity import get_chat, get_users, forget_chat, forget_member
+from scheduler import priority, BULK
+from callbacks import register, legacy, encode
 from config import SUPERADMIN_ID
 
 # --- CONSTANTS ---
@@ -24,6 +28,7 @@ FULL_COMMAND_LIST = """<b>🤖 Marceline Commands</b>
 <b>🔐 Vault</b>
 /save [key] - Save (Reply)
 /q [key] - Recall
+/qsearch [text] - Search saves
 /sshow, /sdel - Manage saves
 /ssave [key] - Save sticker
 /s [key] - Recall sticker
@@ -43,10 +48,17 @@ FULL_COMMAND_LIST = """<b>🤖 Marceline Commands</b>
 /about - Group info"""
 
 async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Middleware to track user activity."""
-    if update.effective_chat.type in ['group', 'supergroup']:
-        with next(get_db()) as db:
-            ensure_user_and_chat(update, db)
+    """Middleware to track user activity (buffered, see activity.py)."""
+    if update.effective_chat.type in ['group', 'supergroup'] and update.effective_user:
+        user = update.effective_user
+        await activity_buffer.write_new_chat(update.effective_chat.id, update.effective_chat.title or "Unknown Chat")
+        full = activity_buffer.record(
+            update.effective_chat.id, update.effective_chat.title or "Unknown Chat",
+            user.id, user.full_name, user.username
+        )
+        if full:
+            # The update that filled the buffer shouldn't wait for the write
+            activity_buffer.flush_soon(context.application.create_task)
 
 # --- Helpers to get Settings ---
 def get_setting(db, key, default_val):
@@ -62,64 +74,59 @@ def set_setting(db, key, val):
         setting.value = val
     db.commit()
 
+DEFAULT_REPO = "https://github.com/Doom098/marceline-bot"
+
 # --- Start & DM Menu ---
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat.type == 'private':
-        with next(get_db()) as db:
-            repo_url = get_setting(db, "dm_repo", "https://github.com/Doom098/marceline-bot")
+        repo_url = await run_db(get_setting, "dm_repo", DEFAULT_REPO)
         
-        keyboard = [
-            [InlineKeyboardButton("📜 Commands", callback_data="dm_commands")],
-            [InlineKeyboardButton("ℹ️ About", callback_data="dm_about")],
-            [InlineKeyboardButton("📦 Repo", url=repo_url)]
-        ]
         await update.message.reply_text(
             "👋 <b>I'm Marceline!</b>\nYour Telegram Group Helper.\n\nChoose an option:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=_dm_menu(repo_url),
             parse_mode="HTML"
         )
     else:
         await update.message.reply_text("I'm ready! Use /help to see what I can do.")
 
-async def handle_dm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def _dm_menu(repo_url):
+    keyboard = [
+        [InlineKeyboardButton("📜 Commands", callback_data=encode("dc"))],
+        [InlineKeyboardButton("ℹ️ About", callback_data=encode("da"))],
+        [InlineKeyboardButton("📦 Repo", url=repo_url)]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+_DM_BACK = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data=encode("db"))]])
+
+@register("dc")
+async def dm_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    data = query.data
     await query.answer()
-    
-    with next(get_db()) as db:
-        repo_url = get_setting(db, "dm_repo", "https://github.com/Doom098/marceline-bot")
-        
-        # Updated Default Texts using the Full List
-        default_cmds = FULL_COMMAND_LIST
-        default_about = "<b>Marceline Bot</b>\nBuilt with Python."
-        
-        if data == "dm_commands":
-            text = get_setting(db, "dm_commands", default_cmds)
-            await query.message.edit_text(
-                text, 
-                parse_mode="HTML", 
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="dm_back")]])
-            )
-
-        elif data == "dm_about":
-            text = get_setting(db, "dm_about", default_about)
-            await query.message.edit_text(
-                text, 
-                parse_mode="HTML", 
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="dm_back")]])
-            )
-
-        elif data == "dm_back":
-            keyboard = [
-                [InlineKeyboardButton("📜 Commands", callback_data="dm_commands")],
-                [InlineKeyboardButton("ℹ️ About", callback_data="dm_about")],
-                [InlineKeyboardButton("📦 Repo", url=repo_url)]
-            ]
-            await query.message.edit_text(
-                "👋 <b>I'm Marceline!</b>\nYour Telegram Group Helper.\n\nChoose an option:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode="HTML"
-            )
+    text = await run_db(get_setting, "dm_commands", FULL_COMMAND_LIST)
+    await query.message.edit_text(text, parse_mode="HTML", reply_markup=_DM_BACK)
+
+@register("da")
+async def dm_about(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    text = await run_db(get_setting, "dm_about", "<b>Marceline Bot</b>\nBuilt with Python.")
+    await query.message.edit_text(text, parse_mode="HTML", reply_markup=_DM_BACK)
+
+@register("db")
+async def dm_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    repo_url = await run_db(get_setting, "dm_repo", DEFAULT_REPO)
+    await query.message.edit_text(
+        "👋 <b>I'm Marceline!</b>\nYour Telegram Group Helper.\n\nChoose an option:",
+        reply_markup=_dm_menu(repo_url),
+        parse_mode="HTML"
+    )
+
+legacy("dm_commands", "dc")
+legacy("dm_about", "da")
+legacy("dm_back", "db")
 
 # --- Super Admin Setters ---
 async def set_dm_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -129,8 +136,7 @@ async def set_dm_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     text = update.message.text.split(" ", 1)[1]
-    with next(get_db()) as db:
-        set_setting(db, "dm_commands", text)
+    await run_db(set_setting, "dm_commands", text)
     await update.message.reply_text("✅ Commands menu updated.")
 
 async def set_dm_about(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -140,8 +146,7 @@ async def set_dm_about(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
         
     text = update.message.text.split(" ", 1)[1]
-    with next(get_db()) as db:
-        set_setting(db, "dm_about", text)
+    await run_db(set_setting, "dm_about", text)
     await update.message.reply_text("✅ About menu updated.")
 
 async def set_dm_repo(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -151,140 +156,153 @@ async def set_dm_repo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
         
     url = context.args[0]
-    with next(get_db()) as db:
-        set_setting(db, "dm_repo", url)
+    await run_db(set_setting, "dm_repo", url)
     await update.message.reply_text("✅ Repo URL updated.")
 
 # --- Existing Group Logic ---
+def _load_mentions(db, chat_id):
+    members = db.query(ChatMember.user_id).filter(
+        ChatMember.chat_id == chat_id,
+        ChatMember.is_excluded == False
+    ).all()
+
+    users = get_users(db, [uid for uid, in members])
+    return [f"<a href='tg://user?id={uid}'>{users[uid].full_name}</a>" for uid, in members if uid in users]
+
 async def mention_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        members = db.query(ChatMember).filter(
-            ChatMember.chat_id == chat_id,
-            ChatMember.is_excluded == False
-        ).all()
-        
-        if not members:
-            await update.message.reply_text("No one to mention yet.")
-            return
-
-        mentions = []
-        for m in members:
-            user = db.query(User).filter(User.user_id == m.user_id).first()
-            if user:
-                mentions.append(f"<a href='tg://user?id={user.user_id}'>{user.full_name}</a>")
-        
-        chunk_size = 30 
-        chunks = [mentions[i:i + chunk_size] for i in range(0, len(mentions), chunk_size)]
-        
+    mentions = await run_db(_load_mentions, chat_id)
+    
+    if not mentions:
+        await update.message.reply_text("No one to mention yet.")
+        return
+    
+    chunk_size = 30 
+    chunks = [mentions[i:i + chunk_size] for i in range(0, len(mentions), chunk_size)]
+
+    # A big group's pings take the chat's rate limit minutes to get through: send them
+    # outside the update so the chat's next clicks and commands don't queue behind them
+    context.application.create_task(_send_pings(update.message, chunks), update=update)
+
+async def _send_pings(message, chunks):
+    # Pings yield to interactive edits in other chats
+    with priority(BULK):
         for chunk in chunks:
-            await update.message.reply_text(" ".join(chunk), parse_mode="HTML")
+            await message.reply_text(" ".join(chunk), parse_mode="HTML")
+
+class MockUser:
+    def __init__(self, uid, name):
+        self.id = uid
+        self.full_name = name
 
-async def get_target_users(update: Update, context: ContextTypes.DEFAULT_TYPE, db):
+def _lookup_usernames(db, usernames):
+    found = []
+    for username in usernames:
+        user = db.query(User).filter(User.username.ilike(username)).first()
+        if user:
+            found.append(MockUser(user.user_id, user.full_name))
+    return found
+
+async def get_target_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     targets = []
     if update.message.reply_to_message:
         targets.append(update.message.reply_to_message.from_user)
     
+    usernames = []
     if update.message.entities:
         for entity in update.message.entities:
             if entity.type == "text_mention":
                 targets.append(entity.user)
             elif entity.type == "mention":
-                username = update.message.text[entity.offset:entity.offset+entity.length].lstrip('@')
-                user = db.query(User).filter(User.username.ilike(username)).first()
-                if user:
-                    class MockUser:
-                        def __init__(self, uid, name):
-                            self.id = uid
-                            self.full_name = name
-                    targets.append(MockUser(user.user_id, user.full_name))
+                usernames.append(update.message.text[entity.offset:entity.offset+entity.length].lstrip('@'))
+    if usernames:
+        targets.extend(await run_db(_lookup_usernames, usernames))
     return targets
 
+def _set_excluded(db, chat_id, targets, excluded):
+    names = []
+    for t in targets:
+        member = db.query(ChatMember).filter_by(chat_id=chat_id, user_id=t.id).first()
+        if member:
+            member.is_excluded = excluded
+            names.append(t.full_name)
+    db.commit()
+    for t in targets:
+        forget_member(chat_id, t.id)
+    return names
+
 async def exclude_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        targets = await get_target_users(update, context, db)
-        if not targets:
-            await update.message.reply_text("Reply to or mention users to exclude.")
-            return
-
-        count = 0
-        names = []
-        for t in targets:
-            member = db.query(ChatMember).filter_by(chat_id=chat_id, user_id=t.id).first()
-            if member:
-                member.is_excluded = True
-                count += 1
-                names.append(t.full_name)
-        
-        db.commit()
-        if count > 0: await update.message.reply_text(f"🚫 Excluded: {', '.join(names)}")
-        else: await update.message.reply_text("Users not found.")
+    targets = await get_target_users(update, context)
+    if not targets:
+        await update.message.reply_text("Reply to or mention users to exclude.")
+        return
+
+    names = await run_db(_set_excluded, chat_id, targets, True)
+    if names: await update.message.reply_text(f"🚫 Excluded: {', '.join(names)}")
+    else: await update.message.reply_text("Users not found.")
 
 async def include_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        targets = await get_target_users(update, context, db)
-        if not targets:
-            await update.message.reply_text("Reply to or mention users to include.")
-            return
-
-        count = 0
-        names = []
-        for t in targets:
-            member = db.query(ChatMember).filter_by(chat_id=chat_id, user_id=t.id).first()
-            if member:
-                member.is_excluded = False
-                count += 1
-                names.append(t.full_name)
-        
-        db.commit()
-        if count > 0: await update.message.reply_text(f"✅ Included: {', '.join(names)}")
+    targets = await get_target_users(update, context)
+    if not targets:
+        await update.message.reply_text("Reply to or mention users to include.")
+        return
+
+    names = await run_db(_set_excluded, chat_id, targets, False)
+    if names: await update.message.reply_text(f"✅ Included: {', '.join(names)}")
+
+def _load_member_stats(db, chat_id):
+    members = db.query(ChatMember.user_id, ChatMember.is_excluded).filter_by(chat_id=chat_id).all()
+    excluded = [uid for uid, is_excluded in members if is_excluded]
+    users = get_users(db, excluded)
+    excluded_names = [users[uid].full_name for uid in excluded if uid in users]
+    return len(members), len(excluded), excluded_names
 
 async def all_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        members = db.query(ChatMember).filter_by(chat_id=chat_id).all()
-        total = len(members)
-        excluded = [m for m in members if m.is_excluded]
-        excluded_names = []
-        for m in excluded:
-            u = db.query(User).filter_by(user_id=m.user_id).first()
-            if u: excluded_names.append(u.full_name)
-            
-        msg = (f"📊 <b>Member Stats</b>\nTotal: {total}\nIncluded: {total - len(excluded)}\nExcluded: {len(excluded)}\n")
-        if excluded_names: msg += f"Names: {', '.join(excluded_names)}"
-        await update.message.reply_text(msg, parse_mode="HTML")
+    total, excluded, excluded_names = await run_db(_load_member_stats, chat_id)
+        
+    msg = (f"📊 <b>Member Stats</b>\nTotal: {total}\nIncluded: {total - excluded}\nExcluded: {excluded}\n")
+    if excluded_names: msg += f"Names: {', '.join(excluded_names)}"
+    await update.message.reply_text(msg, parse_mode="HTML")
+
+def _load_ping_names(db, chat_id):
+    members = db.query(ChatMember.user_id).filter(ChatMember.chat_id == chat_id, ChatMember.is_excluded == False).all()
+    users = get_users(db, [uid for uid, in members])
+    return [users[uid].full_name for uid, in members if uid in users]
 
 async def who_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        members = db.query(ChatMember).filter(ChatMember.chat_id == chat_id, ChatMember.is_excluded == False).all()
-        names = []
-        for m in members:
-            u = db.query(User).filter_by(user_id=m.user_id).first()
-            names.append(u.full_name)
+    names = await run_db(_load_ping_names, chat_id)
     await update.message.reply_text(f"Will ping: {', '.join(names)}")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Updated to show full list in groups
     await update.message.reply_text(FULL_COMMAND_LIST, parse_mode="HTML")
 
+def _load_about(db, chat_id):
+    chat = get_chat(db, chat_id)
+    return chat.about_text if chat and chat.about_text else "No about info set."
+
 async def about_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        chat = db.query(Chat).filter_by(chat_id=chat_id).first()
-        about = chat.about_text if chat and chat.about_text else "No about info set."
+    about = await run_db(_load_about, chat_id)
     await update.message.reply_text(f"ℹ️ <b>About:</b>\n{about}", parse_mode="HTML")
 
+def _save_about(db, chat_id, text):
+    chat = db.query(Chat).filter_by(chat_id=chat_id).first()
+    if not chat:
+        return False
+    chat.about_text = text
+    db.commit()
+    forget_chat(chat_id)
+    return True
+
 async def set_about(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args: return
     text = " ".join(context.args)
     chat_id = update.effective_chat.id
     if update.effective_user.id != SUPERADMIN_ID: return
-    with next(get_db()) as db:
-        chat = db.query(Chat).filter_by(chat_id=chat_id).first()
-        if chat:
-            chat.about_text = text
-            db.commit()
-            await update.message.reply_text("About updated.")
+    if await run_db(_save_about, chat_id, text):
+        await update.message.reply_text("About updated.")
@@ -1,8 +1,10 @@
 import random
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
-from database import get_db
+from database import run_db
 from models import RoastLine
+from cache import TTLCache, Generations
+from pagination import paged_list, keyset_page, send_first_page
 
 # Load seed roasts (Your existing logic)
 try:
@@ -11,6 +13,56 @@ try:
 except FileNotFoundError:
     SEED_ROASTS = ["You are bad."]
 
+# --- Roast pools ---
+class ShuffleBag:
+    """Draws every line once, in random order, before any repeats. O(1) amortised per draw."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.order = []
+
+    def draw(self):
+        if not self.order:
+            self.order = list(range(len(self.lines)))
+            random.shuffle(self.order)
+        return self.lines[self.order.pop()]
+
+# chat_id -> ShuffleBag over seed + custom lines. Saves and deletes bump the chat's
+# generation, so a pool loaded while a write was in flight is never reused.
+pool_cache = TTLCache("roast_pools", maxsize=1024, ttl=3600, generations=Generations())
+
+def forget_roasts(chat_id):
+    pool_cache.invalidate(chat_id)
+
+async def roast_bag(chat_id):
+    async def load():
+        pool = SEED_ROASTS + await run_db(_custom_roasts, chat_id)
+        return ShuffleBag(pool or ["I have no roasts loaded."])
+    return await pool_cache.fetch(chat_id, load)
+
+# --- DB units of work (run via run_db) ---
+def _custom_roasts(db, chat_id):
+    return [text for text, in db.query(RoastLine.text).filter_by(chat_id=chat_id)]
+
+def _add_roast(db, chat_id, text):
+    db.add(RoastLine(chat_id=chat_id, text=text))
+    db.commit()
+
+def _roasts_page(db, chat_id, after, before, size):
+    q = db.query(RoastLine.id, RoastLine.text).filter_by(chat_id=chat_id)
+    return keyset_page(q, RoastLine.id, after, before, size)
+
+def _delete_roast(db, chat_id, idx):
+    # Numbers are positions in id order, as shown by /roastshow
+    if idx < 1:
+        return False
+    roast = db.query(RoastLine).filter_by(chat_id=chat_id).order_by(RoastLine.id).offset(idx-1).first()
+    if not roast:
+        return False
+    db.delete(roast)
+    db.commit()
+    return True
+
 async def roast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     
@@ -22,17 +74,8 @@ async def roast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         target = update.effective_user
     # --- TARGETING FIX ENDS HERE ---
 
-    # Mix seed + db roasts (Your existing logic)
-    with next(get_db()) as db:
-        db_roasts = db.query(RoastLine).filter_by(chat_id=chat_id).all()
-        custom_lines = [r.text for r in db_roasts]
-    
-    # Combine lists and pick one
-    pool = SEED_ROASTS + custom_lines
-    if not pool:
-        pool = ["I have no roasts loaded."]
-        
-    roast = random.choice(pool)
+    # Seed + db roasts, cached per chat; no repeats until the bag is empty
+    roast = (await roast_bag(chat_id)).draw()
     
     # Send with the target's name
     await update.message.reply_text(f"{target.first_name}, {roast}")
@@ -48,26 +91,24 @@ async def save_roast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
     chat_id = update.effective_chat.id
     
-    with next(get_db()) as db:
-        new_roast = RoastLine(chat_id=chat_id, text=text)
-        db.add(new_roast)
-        db.commit()
+    await run_db(_add_roast, chat_id, text)
+    forget_roasts(chat_id)
         
     await update.message.reply_text("Roast added.")
     return ConversationHandler.END
 
+# Roasts can be any length: cut each line so a full page stays under Telegram's 4096
+# characters, even when every character is an emoji (two UTF-16 units each)
+ROAST_PREVIEW = 90
+
+def _roast_line(row, n):
+    text = row.text if len(row.text) <= ROAST_PREVIEW else row.text[:ROAST_PREVIEW] + "..."
+    return f"{n}. {text}"
+
+paged_list("ro", _roasts_page, _roast_line, title="User Roasts:", empty="No user-added roasts.")
+
 async def show_roasts(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        roasts = db.query(RoastLine).filter_by(chat_id=chat_id).all()
-        if not roasts:
-            await update.message.reply_text("No user-added roasts.")
-            return
-        
-        msg = "User Roasts:\n"
-        for idx, r in enumerate(roasts, 1):
-            msg += f"{idx}. {r.text}\n"
-        await update.message.reply_text(msg)
+    await send_first_page(update, "ro")
 
 async def del_roast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
@@ -80,12 +121,8 @@ async def del_roast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        roasts = db.query(RoastLine).filter_by(chat_id=chat_id).all()
-        if 1 <= idx <= len(roasts):
-            target = roasts[idx-1]
-            db.delete(target)
-            db.commit()
-            await update.message.reply_text(f"Deleted roast #{idx}")
-        else:
-            await update.message.reply_text("Invalid number.")
+    if await run_db(_delete_roast, chat_id, idx):
+        forget_roasts(chat_id)
+        await update.message.reply_text(f"Deleted roast #{idx}")
+    else:
+        await update.message.reply_text("Invalid number.")
@@ -1,10 +1,19 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from database import get_db
-from models import GameSession, User, Chat, ChatMember, MatchStat
+from database import run_db
+from cache import TTLCache
+from models import User, Chat, ChatMember
+from session_store import session_store
+from callbacks import register, legacy, encode
+from identity import get_chat, get_users, forget_chat
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm.attributes import flag_modified
+import asyncio
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Move import here to avoid runtime circular import issues, 
 # but wrap in try/except or keep inside handler if strictly necessary. 
@@ -26,36 +35,47 @@ def get_session_keyboard(session_data, session_type):
 
     if is_ready_1v1:
         return InlineKeyboardMarkup([
-            [InlineKeyboardButton("🛑 Stop Session", callback_data="stop_session"),
-             InlineKeyboardButton("📊 Update Match Stats", callback_data="stats_input")]
+            [InlineKeyboardButton("🛑 Stop Session", callback_data=encode("ss")),
+             InlineKeyboardButton("📊 Update Match Stats", callback_data=encode("si"))]
         ])
 
     # --- Standard RSVP Keyboard ---
     rsvp_row = [
-        InlineKeyboardButton("✅ In", callback_data="rsvp_in"),
-        InlineKeyboardButton("❌ Out", callback_data="rsvp_out"),
-        InlineKeyboardButton("⌛ Pending", callback_data="rsvp_pending"),
+        InlineKeyboardButton("✅ In", callback_data=encode("ri")),
+        InlineKeyboardButton("❌ Out", callback_data=encode("ro")),
+        InlineKeyboardButton("⌛ Pending", callback_data=encode("rp")),
     ]
     
-    action_row = [InlineKeyboardButton("🛑 Stop Session", callback_data="stop_session")]
+    action_row = [InlineKeyboardButton("🛑 Stop Session", callback_data=encode("ss"))]
     if session_type == "1v1":
-        action_row.append(InlineKeyboardButton("📊 Update Match Stats", callback_data="stats_input"))
+        action_row.append(InlineKeyboardButton("📊 Update Match Stats", callback_data=encode("si")))
     
     config_row = []
     if session_type == "1v1":
-        config_row.append(InlineKeyboardButton("Change Opponent", callback_data="pick_opp"))
+        config_row.append(InlineKeyboardButton("Change Opponent", callback_data=encode("po")))
     # Removed "Edit Squad" button for 2v2 as requested
 
     return InlineKeyboardMarkup([rsvp_row, action_row, config_row])
 
+def session_user_ids(session_data):
+    ids = {session_data.get('pA'), session_data.get('pB')}
+    ids.update(session_data.get('squad', []))
+    ids.update(session_data.get('in', []))
+    ids.update(session_data.get('out', []))
+    ids.update(int(uid) for uid in session_data.get('pending', {}))
+    return ids
+
 def format_session_text(session_data, db_session):
-    pA = db_session.query(User).filter_by(user_id=session_data['pA']).first()
+    # One batched lookup for everyone on the card
+    users = get_users(db_session, session_user_ids(session_data))
+
+    pA = users.get(session_data['pA'])
     pA_link = f"<a href='tg://user?id={pA.user_id}'>{pA.full_name}</a>" if pA else "Unknown"
     
     status_text = ""
     
     if session_data['type'] == '1v1':
-        pB = db_session.query(User).filter_by(user_id=session_data.get('pB')).first()
+        pB = users.get(session_data.get('pB'))
         pB_link = f"<a href='tg://user?id={pB.user_id}'>{pB.full_name}</a>" if pB else "Opponent"
         header = f"🎮 <b>1v1 Session</b>\n{pA_link} 🆚 {pB_link}\n"
     else:
@@ -63,279 +83,364 @@ def format_session_text(session_data, db_session):
         squad_ids = session_data.get('squad', [])
         squad_names = []
         for uid in squad_ids:
-            u = db_session.query(User).filter_by(user_id=uid).first()
+            u = users.get(uid)
             if u: 
                 squad_names.append(f"<a href='tg://user?id={u.user_id}'>{u.full_name}</a>")
         header = f"🎮 <b>2v2 Session</b>\nSquad: {', '.join(squad_names)}\n"
 
-    in_list = []
-    for uid in session_data.get('in', []):
-        u = db_session.query(User).filter_by(user_id=uid).first()
-        if u: in_list.append(u.full_name)
-        
-    out_list = []
-    for uid in session_data.get('out', []):
-        u = db_session.query(User).filter_by(user_id=uid).first()
-        if u: out_list.append(u.full_name)
+    in_list = [users[uid].full_name for uid in session_data.get('in', []) if uid in users]
+    out_list = [users[uid].full_name for uid in session_data.get('out', []) if uid in users]
     
     status_text += f"\n✅ <b>In ({len(in_list)}):</b> {', '.join(in_list)}"
     status_text += f"\n❌ <b>Out ({len(out_list)}):</b> {', '.join(out_list)}"
     
     pending_list = []
     for uid, time_str in session_data.get('pending', {}).items():
-        u = db_session.query(User).filter_by(user_id=int(uid)).first()
+        u = users.get(int(uid))
         if u: pending_list.append(f"{u.full_name} ({time_str})")
     
     status_text += f"\n⌛ <b>Pending:</b> {', '.join(pending_list)}"
     
     return header + status_text
 
+# --- DB units of work (run via run_db) ---
+
+def _find_user_ids(db, usernames):
+    ids = set()
+    for username in usernames:
+        u = db.query(User).filter(User.username.ilike(username)).first()
+        if u: ids.add(u.user_id)
+    return ids
+
+def _save_squad(db, chat_id, ids):
+    chat = db.query(Chat).filter_by(chat_id=chat_id).first()
+    if chat is None:
+        # A command can be the first update seen from a group; the title comes with its next message
+        chat = Chat(chat_id=chat_id)
+        db.add(chat)
+    chat.primary_squad = list(ids)
+    flag_modified(chat, "primary_squad")
+    db.commit()
+    forget_chat(chat_id)
+
+def _opponent_choices(db, chat_id, user_id):
+    members = db.query(ChatMember.user_id).filter(ChatMember.chat_id==chat_id, ChatMember.user_id!=user_id).limit(20).all()
+    users = get_users(db, [uid for uid, in members])
+    return [(uid, users[uid].full_name) for uid, in members if uid in users]
+
+DEFAULT_SESSION_TTL = 360 # minutes, the chats.session_ttl default
+
+def _chat_settings(db, chat_id):
+    chat = get_chat(db, chat_id)
+    if chat is None: # no row written for this chat yet
+        return DEFAULT_SESSION_TTL, None
+    return chat.session_ttl or DEFAULT_SESSION_TTL, chat.primary_squad
+
+def _render(db, session_data):
+    return format_session_text(session_data, db)
+
+def _opponent_keyboard(choices, host_id):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(name, callback_data=encode("so", uid, host_id))] for uid, name in choices])
+
+# --- Debounced card edits ---
+# State changes are saved immediately, but a burst of RSVP clicks on one card
+# becomes a single edit carrying the latest render.
+EDIT_DEBOUNCE = 0.4 # seconds
+
+_pending_edits = {} # message_id -> (message, session_data, session_type), latest wins
+_sent_cards = TTLCache("session_cards", maxsize=1024, ttl=86400) # message_id -> (text, keyboard) on screen
+
+def _card(text, markup):
+    return text, json.dumps(markup.to_dict(), sort_keys=True)
+
+def queue_card_edit(context, message, s_data, session_type):
+    msg_id = message.message_id
+    scheduled = msg_id in _pending_edits
+    _pending_edits[msg_id] = (message, s_data, session_type)
+    if not scheduled:
+        context.application.create_task(_flush_card_edit(msg_id))
+
+def forget_card(msg_id):
+    """Drops any pending edit and the on-screen snapshot (card deleted or redrawn elsewhere)."""
+    _pending_edits.pop(msg_id, None)
+    _sent_cards.pop(msg_id)
+
+async def _flush_card_edit(msg_id):
+    await asyncio.sleep(EDIT_DEBOUNCE)
+    pending = _pending_edits.pop(msg_id, None)
+    if pending is None:
+        return
+    message, s_data, session_type = pending
+    text = await run_db(_render, s_data)
+    markup = get_session_keyboard(s_data, session_type)
+    card = _card(text, markup)
+    if _sent_cards.get(msg_id) == card:
+        return
+    try:
+        await message.edit_text(text, parse_mode="HTML", reply_markup=markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            logger.warning("Session card %s edit failed: %s", msg_id, e)
+            return
+    _sent_cards.set(msg_id, card)
+
 # --- Commands ---
 
 async def set_squad(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     ids = set()
+    usernames = []
     
     if update.message.entities:
         for entity in update.message.entities:
             if entity.type == "text_mention":
                 ids.add(entity.user.id)
             elif entity.type == "mention":
-                username = update.message.text[entity.offset:entity.offset+entity.length].lstrip('@')
-                with next(get_db()) as db:
-                    u = db.query(User).filter(User.username.ilike(username)).first()
-                    if u: ids.add(u.user_id)
+                usernames.append(update.message.text[entity.offset:entity.offset+entity.length].lstrip('@'))
+    if usernames:
+        ids |= await run_db(_find_user_ids, usernames)
     
     if not ids:
          await update.message.reply_text("⚠️ Mention users to add to squad.\nEx: <code>/setsquad @User1 @User2</code>", parse_mode="HTML")
          return
 
-    with next(get_db()) as db:
-        chat = db.query(Chat).filter_by(chat_id=chat_id).first()
-        chat.primary_squad = list(ids)
-        flag_modified(chat, "primary_squad")
-        db.commit()
+    await run_db(_save_squad, chat_id, ids)
         
     await update.message.reply_text(f"✅ <b>Squad Saved!</b>\nAdded {len(ids)} players.", parse_mode="HTML")
 
 # --- Handlers ---
 
 async def start_play(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [[InlineKeyboardButton("1v1", callback_data="new_1v1"), 
-                 InlineKeyboardButton("2v2", callback_data="new_2v2")]]
+    keyboard = [[InlineKeyboardButton("1v1", callback_data=encode("n1")), 
+                 InlineKeyboardButton("2v2", callback_data=encode("n2"))]]
     await update.message.reply_text("Select Mode:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# --- NEW SESSION FLOW ---
+@register("n1")
+async def new_1v1(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    choices = await run_db(_opponent_choices, update.effective_chat.id, query.from_user.id)
+    
+    if not choices:
+         await query.edit_message_text("No other members tracked yet. Ask them to speak!")
+         return
+
+    await query.edit_message_text("Select Opponent:", reply_markup=_opponent_keyboard(choices, query.from_user.id))
+
+@register("so", int, int)
+async def select_opponent(update: Update, context: ContextTypes.DEFAULT_TYPE, opp_id: int, host_id: int):
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    await query.answer()
+
+    if query.from_user.id != host_id:
+        await context.bot.answer_callback_query(query.id, "🚫 Only the host can pick the opponent.", show_alert=True)
+        return
+
+    ttl_min, _ = await run_db(_chat_settings, chat_id)
+    expiry = datetime.now(timezone.utc) + timedelta(minutes=ttl_min)
+    
+    session_data = {
+        "type": "1v1",
+        "pA": host_id,
+        "pB": opp_id,
+        "in": [], "out": [], "pending": {}
+    }
+    
+    await query.message.delete()
+    text = await run_db(_render, session_data)
+    markup = get_session_keyboard(session_data, "1v1")
+    sent_msg = await context.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML", reply_markup=markup)
+    _sent_cards.set(sent_msg.message_id, _card(text, markup))
+    
+    await session_store.create(sent_msg.message_id, chat_id, "1v1", host_id, expiry, session_data)
+
+@register("n2")
+async def new_2v2(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    data = query.data
     chat_id = update.effective_chat.id
     user_id = query.from_user.id
-    msg_id = query.message.message_id
+    await query.answer()
+
+    ttl_min, squad = await run_db(_chat_settings, chat_id)
+    
+    if not squad:
+        await query.edit_message_text("⚠️ No squad set!\nUse <code>/setsquad @p1 @p2 @p3</code> to set it.", parse_mode="HTML")
+        return
+    
+    expiry = datetime.now(timezone.utc) + timedelta(minutes=ttl_min)
+    
+    session_data = {
+        "type": "2v2",
+        "pA": user_id,
+        "squad": squad,
+        "in": [], "out": [], "pending": {}
+    }
     
+    await query.message.delete()
+    text = await run_db(_render, session_data)
+    markup = get_session_keyboard(session_data, "2v2")
+    sent_msg = await context.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML", reply_markup=markup)
+    _sent_cards.set(sent_msg.message_id, _card(text, markup))
+    
+    await session_store.create(sent_msg.message_id, chat_id, "2v2", user_id, expiry, session_data)
+
+# --- EXISTING SESSION INTERACTION ---
+async def _active_session(update, context, players_only=True):
+    """Answers the query and returns the live session for its message, or None after telling the user why."""
+    query = update.callback_query
+    msg_id = query.message.message_id
     await query.answer()
 
-    # We use a persistent DB session for most ops
-    with next(get_db()) as db:
+    session = session_store.get(msg_id)
+    
+    if not session:
+        forget_card(msg_id)
+        await query.message.edit_text("❌ Session not found or deleted.")
+        return None
         
-        # --- NEW SESSION FLOW ---
-        if data == "new_1v1":
-            members = db.query(ChatMember).filter(ChatMember.chat_id==chat_id, ChatMember.user_id!=user_id).limit(20).all()
-            buttons = []
-            for m in members:
-                u = db.query(User).filter_by(user_id=m.user_id).first()
-                if u: buttons.append([InlineKeyboardButton(u.full_name, callback_data=f"sel_opp_{u.user_id}_{user_id}")])
-            
-            if not buttons:
-                 await query.edit_message_text("No other members tracked yet. Ask them to speak!")
-                 return
-
-            await query.edit_message_text("Select Opponent:", reply_markup=InlineKeyboardMarkup(buttons))
-            return
+    if datetime.now(timezone.utc) > session['expires_at']:
+        forget_card(msg_id)
+        await query.message.edit_text("❌ Session Expired.")
+        await session_store.delete([msg_id])
+        return None
 
-        if data.startswith("sel_opp_"):
-            parts = data.split("_")
-            opp_id = int(parts[2])
-            host_id = int(parts[3])
-
-            if user_id != host_id:
-                await context.bot.answer_callback_query(query.id, "🚫 Only the host can pick the opponent.", show_alert=True)
-                return
-
-            ttl_min = db.query(Chat).filter_by(chat_id=chat_id).first().session_ttl
-            expiry = datetime.now(timezone.utc) + timedelta(minutes=ttl_min)
-            
-            session_data = {
-                "type": "1v1",
-                "pA": host_id,
-                "pB": opp_id,
-                "in": [], "out": [], "pending": {}
-            }
-            
-            await query.message.delete()
-            sent_msg = await context.bot.send_message(
-                chat_id=chat_id,
-                text=format_session_text(session_data, db),
-                parse_mode="HTML",
-                reply_markup=get_session_keyboard(session_data, "1v1")
-            )
-            
-            new_sess = GameSession(
-                message_id=sent_msg.message_id,
-                chat_id=chat_id,
-                session_type="1v1",
-                initiator_id=host_id,
-                expires_at=expiry,
-                state_data=session_data
-            )
-            db.add(new_sess)
-            db.commit()
-            return
+    s_data = session['state_data']
+    user_id = query.from_user.id
+    is_player = (user_id == s_data.get('pA') or user_id == s_data.get('pB'))
+    
+    if players_only and session['session_type'] == "1v1" and not is_player:
+         await context.bot.answer_callback_query(query.id, "🚫 You are not in this match.", show_alert=True)
+         return None
+    return session
 
-        if data == "new_2v2":
-            chat = db.query(Chat).filter_by(chat_id=chat_id).first()
-            squad = chat.primary_squad
-            
-            if not squad:
-                await query.edit_message_text("⚠️ No squad set!\nUse <code>/setsquad @p1 @p2 @p3</code> to set it.", parse_mode="HTML")
-                return
-            
-            ttl_min = chat.session_ttl
-            expiry = datetime.now(timezone.utc) + timedelta(minutes=ttl_min)
-            
-            session_data = {
-                "type": "2v2",
-                "pA": user_id,
-                "squad": squad,
-                "in": [], "out": [], "pending": {}
-            }
-            
-            await query.message.delete()
-            sent_msg = await context.bot.send_message(
-                chat_id=chat_id,
-                text=format_session_text(session_data, db),
-                parse_mode="HTML",
-                reply_markup=get_session_keyboard(session_data, "2v2")
-            )
-            
-            new_sess = GameSession(
-                message_id=sent_msg.message_id,
-                chat_id=chat_id,
-                session_type="2v2",
-                initiator_id=user_id,
-                expires_at=expiry,
-                state_data=session_data
-            )
-            db.add(new_sess)
-            db.commit()
-            return
+@register("po")
+async def pick_opponent(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = await _active_session(update, context, players_only=False)
+    if not session: return
+    query = update.callback_query
+    user_id = query.from_user.id
+    msg_id = query.message.message_id
 
-        # --- EXISTING SESSION INTERACTION ---
-        session = db.query(GameSession).filter_by(message_id=msg_id).first()
-        
-        if not session:
-            await query.message.edit_text("❌ Session not found or deleted.")
-            return
-            
-        if datetime.now(timezone.utc) > session.expires_at:
-            await query.message.edit_text("❌ Session Expired.")
-            db.delete(session)
-            db.commit()
-            return
+    if user_id != session['state_data'].get('pA'):
+        await context.bot.answer_callback_query(query.id, "🚫 Only the host can change opponent.", show_alert=True)
+        return
+    
+    await session_store.delete([msg_id])
+    forget_card(msg_id)
+    choices = await run_db(_opponent_choices, update.effective_chat.id, user_id)
+    
+    await query.edit_message_text("Select New Opponent:", reply_markup=_opponent_keyboard(choices, user_id))
 
-        s_data = dict(session.state_data)
-        
-        is_player = (user_id == s_data.get('pA') or user_id == s_data.get('pB'))
-        
-        if session.session_type == "1v1" and not is_player and data != "pick_opp":
-             await context.bot.answer_callback_query(query.id, "🚫 You are not in this match.", show_alert=True)
-             return
-
-        if data == "pick_opp":
-            if user_id != s_data.get('pA'):
-                await context.bot.answer_callback_query(query.id, "🚫 Only the host can change opponent.", show_alert=True)
-                return
-            
-            db.delete(session)
-            db.commit()
-            
-            members = db.query(ChatMember).filter(ChatMember.chat_id==chat_id, ChatMember.user_id!=user_id).limit(20).all()
-            buttons = []
-            for m in members:
-                u = db.query(User).filter_by(user_id=m.user_id).first()
-                if u: buttons.append([InlineKeyboardButton(u.full_name, callback_data=f"sel_opp_{u.user_id}_{user_id}")])
-            
-            await query.edit_message_text("Select New Opponent:", reply_markup=InlineKeyboardMarkup(buttons))
-            return
+async def _rsvp(update, context, going):
+    session = await _active_session(update, context)
+    if not session: return
+    query = update.callback_query
+    user_id = query.from_user.id
+    s_data = session['state_data']
 
-        if data in ["rsvp_in", "rsvp_out"]:
-            if user_id in s_data['in']: s_data['in'].remove(user_id)
-            if user_id in s_data['out']: s_data['out'].remove(user_id)
-            if str(user_id) in s_data['pending']: del s_data['pending'][str(user_id)]
-            
-            if data == "rsvp_in": s_data['in'].append(user_id)
-            else: s_data['out'].append(user_id)
-            
-            session.state_data = s_data
-            flag_modified(session, "state_data")
-            db.commit()
-            
-            await query.message.edit_text(format_session_text(s_data, db), parse_mode="HTML", reply_markup=get_session_keyboard(s_data, session.session_type))
-            return
+    if user_id in s_data['in']: s_data['in'].remove(user_id)
+    if user_id in s_data['out']: s_data['out'].remove(user_id)
+    if str(user_id) in s_data['pending']: del s_data['pending'][str(user_id)]
+    
+    if going: s_data['in'].append(user_id)
+    else: s_data['out'].append(user_id)
+    
+    session_store.update(query.message.message_id, s_data)
+    queue_card_edit(context, query.message, s_data, session['session_type'])
 
-        if data == "rsvp_pending":
-            timers = [
-                [InlineKeyboardButton("5m", callback_data="time_5m"), InlineKeyboardButton("10m", callback_data="time_10m")],
-                [InlineKeyboardButton("15m", callback_data="time_15m"), InlineKeyboardButton("30m", callback_data="time_30m")],
-                [InlineKeyboardButton("45m", callback_data="time_45m"), InlineKeyboardButton("1h", callback_data="time_1h")],
-                [InlineKeyboardButton("🔙 Back", callback_data="time_back")]
-            ]
-            await query.message.edit_reply_markup(InlineKeyboardMarkup(timers))
-            return
+@register("ri")
+async def rsvp_in(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _rsvp(update, context, True)
 
-        if data.startswith("time_"):
-            if data == "time_back":
-                await query.message.edit_reply_markup(get_session_keyboard(s_data, session.session_type))
-                return
-                
-            label = data.split("_")[1]
-            
-            if user_id in s_data['in']: s_data['in'].remove(user_id)
-            if user_id in s_data['out']: s_data['out'].remove(user_id)
-            
-            if 'pending' not in s_data: s_data['pending'] = {}
-            s_data['pending'][str(user_id)] = f"in {label}"
-            
-            session.state_data = s_data
-            flag_modified(session, "state_data")
-            db.commit()
-            
-            await query.message.edit_text(format_session_text(s_data, db), parse_mode="HTML", reply_markup=get_session_keyboard(s_data, session.session_type))
-            return
+@register("ro")
+async def rsvp_out(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _rsvp(update, context, False)
 
-        if data == "stop_session":
-            await query.message.delete()
-            db.delete(session)
-            db.commit()
-            return
+TIMER_LABELS = ("5m", "10m", "15m", "30m", "45m", "1h")
 
-        # --- FIX FOR STATS INPUT ---
-        if data == "stats_input":
-            # Extract IDs before we delete anything
-            pA_id = s_data.get('pA')
-            pB_id = s_data.get('pB')
-            
-            # Delete message and DB entry first
-            try:
-                await query.message.delete()
-            except Exception:
-                pass # Message might be gone already
-            
-            db.delete(session)
-            db.commit()
-            
-            # Now trigger the stats flow (IMPORT HERE to be safe)
-            from features.stats import start_stats_input
-            
-            # This function will open its own fresh DB connection
-            await start_stats_input(context, chat_id, pA_id, pB_id)
-            return
+@register("rp")
+async def rsvp_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = await _active_session(update, context)
+    if not session: return
+    query = update.callback_query
+
+    buttons = [InlineKeyboardButton(label, callback_data=encode("tm", label)) for label in TIMER_LABELS]
+    timers = [buttons[i:i+2] for i in range(0, len(buttons), 2)]
+    timers.append([InlineKeyboardButton("🔙 Back", callback_data=encode("tb"))])
+    _sent_cards.pop(query.message.message_id) # keyboard no longer matches the snapshot
+    await query.message.edit_reply_markup(InlineKeyboardMarkup(timers))
+
+@register("tb")
+async def timer_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = await _active_session(update, context)
+    if not session: return
+    query = update.callback_query
+    _sent_cards.pop(query.message.message_id)
+    await query.message.edit_reply_markup(get_session_keyboard(session['state_data'], session['session_type']))
+
+@register("tm", str)
+async def timer_pick(update: Update, context: ContextTypes.DEFAULT_TYPE, label: str):
+    session = await _active_session(update, context)
+    if not session or label not in TIMER_LABELS: return
+    query = update.callback_query
+    user_id = query.from_user.id
+    s_data = session['state_data']
+    
+    if user_id in s_data['in']: s_data['in'].remove(user_id)
+    if user_id in s_data['out']: s_data['out'].remove(user_id)
+    
+    if 'pending' not in s_data: s_data['pending'] = {}
+    s_data['pending'][str(user_id)] = f"in {label}"
+    
+    session_store.update(query.message.message_id, s_data)
+    queue_card_edit(context, query.message, s_data, session['session_type'])
+
+@register("ss")
+async def stop_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = await _active_session(update, context)
+    if not session: return
+    msg_id = update.callback_query.message.message_id
+    forget_card(msg_id)
+    await update.callback_query.message.delete()
+    await session_store.delete([msg_id])
+
+# --- FIX FOR STATS INPUT ---
+@register("si")
+async def stats_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = await _active_session(update, context)
+    if not session: return
+    query = update.callback_query
+    msg_id = query.message.message_id
+
+    # Extract IDs before we delete anything
+    pA_id = session['state_data'].get('pA')
+    pB_id = session['state_data'].get('pB')
+    
+    # Delete message and DB entry first
+    forget_card(msg_id)
+    try:
+        await query.message.delete()
+    except Exception:
+        pass # Message might be gone already
+    
+    await session_store.delete([msg_id])
+    
+    # Now trigger the stats flow (IMPORT HERE to be safe)
+    from features.stats import start_stats_input
+    
+    await start_stats_input(context, update.effective_chat.id, pA_id, pB_id)
+
+# Buttons on cards sent before the compact format
+legacy("new_1v1", "n1")
+legacy("new_2v2", "n2")
+legacy("sel_opp_", "so")
+legacy("pick_opp", "po")
+legacy("rsvp_in", "ri")
+legacy("rsvp_out", "ro")
+legacy("rsvp_pending", "rp")
+legacy("time_back", "tb")
+legacy("time_", "tm")
+legacy("stop_session", "ss")
+legacy("stats_input", "si")
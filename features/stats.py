@@ -1,142 +1,237 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database import get_db
-from models import User, MatchStat
-from sqlalchemy import func, or_
+from database import run_db, dialect_insert
+from models import MatchSeries, PlayerMonthStat
+from identity import get_users
+from cache import TTLCache, Generations
+from callbacks import register, legacy, encode
+from sqlalchemy import func, insert, select, union_all
 from datetime import datetime, timezone
+import time
+
+# Rendered leaderboard/profile text per chat. Saving results bumps the chat's
+# generation, so a write makes every older entry stale. Monthly keys also carry
+# the month, so a rollover is a plain miss.
+rendered_cache = TTLCache("rendered_stats", maxsize=2048, ttl=3600, generations=Generations())
+
+def forget_rendered(chat_id=None):
+    if chat_id is None:
+        rendered_cache.clear()
+    else:
+        rendered_cache.invalidate(chat_id)
 
 # =========================================
 #  PART 1: STATS INPUT (Entering Scores)
 # =========================================
 
-async def start_stats_input(context, chat_id, pA_id, pB_id):
-    with next(get_db()) as db:
-        uA = db.query(User).filter_by(user_id=pA_id).first()
-        uB = db.query(User).filter_by(user_id=pB_id).first()
-        name_A = uA.full_name if uA else "Player A"
-        name_B = uB.full_name if uB else "Player B"
-
-    context.chat_data['current_stats'] = {
-        'pA': pA_id, 'pB': pB_id, 
-        'nameA': name_A, 'nameB': name_B,
-        'chat_id': chat_id
-    }
+WIZARD_TTL = 86400 # seconds an unfinished stats wizard is kept
+
+def _player_names(db, pA_id, pB_id):
+    users = get_users(db, [pA_id, pB_id])
+    uA = users.get(pA_id)
+    uB = users.get(pB_id)
+    name_A = uA.full_name if uA else "Player A"
+    name_B = uB.full_name if uB else "Player B"
+    return name_A, name_B
+
+def month_key(ts):
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts.strftime("%Y-%m")
+
+def add_to_rollup(db, chat_id, month, deltas):
+    """Adds {user_id: [wins, draws, total]} onto the month's rollup rows (no commit)."""
+    rows = [{"chat_id": chat_id, "user_id": uid, "month": month, "wins": w, "draws": d, "total": t}
+            for uid, (w, d, t) in deltas.items()]
+    upsert = dialect_insert(db)
+    if upsert is None:
+        for row in rows:
+            current = db.get(PlayerMonthStat, (chat_id, row["user_id"], month))
+            if current:
+                current.wins += row["wins"]; current.draws += row["draws"]; current.total += row["total"]
+            else:
+                db.add(PlayerMonthStat(**row))
+        return
+
+    stmt = upsert(PlayerMonthStat)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["chat_id", "user_id", "month"],
+        set_={
+            "wins": PlayerMonthStat.wins + stmt.excluded.wins,
+            "draws": PlayerMonthStat.draws + stmt.excluded.draws,
+            "total": PlayerMonthStat.total + stmt.excluded.total,
+        }
+    )
+    db.execute(stmt, rows)
+
+def rebuild_rollups(db, chat_id=None):
+    """Regenerates player_month_stats from the raw match history."""
+    q = db.query(MatchSeries.chat_id, MatchSeries.player_a_id, MatchSeries.player_b_id,
+                 MatchSeries.played, MatchSeries.wins_a, MatchSeries.wins_b, MatchSeries.draws, MatchSeries.timestamp)
+    if chat_id is not None:
+        q = q.filter(MatchSeries.chat_id == chat_id)
+
+    totals = {} # (chat_id, user_id, month) -> [wins, draws, total]
+    for cid, a, b, played, wins_a, wins_b, draws, ts in q.yield_per(5000):
+        month = month_key(ts)
+        for uid, wins in ((a, wins_a), (b, wins_b)):
+            t = totals.setdefault((cid, uid, month), [0, 0, 0])
+            t[0] += wins
+            t[1] += draws
+            t[2] += played
+
+    wipe = db.query(PlayerMonthStat)
+    if chat_id is not None:
+        wipe = wipe.filter(PlayerMonthStat.chat_id == chat_id)
+    wipe.delete(synchronize_session=False)
+
+    if totals:
+        db.execute(insert(PlayerMonthStat), [
+            {"chat_id": cid, "user_id": uid, "month": month, "wins": w, "draws": d, "total": t}
+            for (cid, uid, month), (w, d, t) in totals.items()
+        ])
+    db.commit()
+    return len(totals)
+
+def _save_results(db, stats):
+    # The whole session is one row
+    db.execute(insert(MatchSeries).values(
+        chat_id=stats['chat_id'], player_a_id=stats['pA'], player_b_id=stats['pB'],
+        played=stats['played'], wins_a=stats['winsA'], wins_b=stats['winsB'], draws=stats['draws']
+    ))
+
+    # Same transaction as the raw rows, so the leaderboard never drifts
+    deltas = {}
+    for uid, wins in ((stats['pA'], stats['winsA']), (stats['pB'], stats['winsB'])):
+        d = deltas.setdefault(uid, [0, 0, 0])
+        d[0] += wins; d[1] += stats['draws']; d[2] += stats['played']
+    add_to_rollup(db, stats['chat_id'], month_key(datetime.now(timezone.utc)), deltas)
     
+    db.commit()
+
+async def start_stats_input(context, chat_id, pA_id, pB_id):
+    name_A, name_B = await run_db(_player_names, pA_id, pB_id)
+
     keyboard = []
-    row1 = [InlineKeyboardButton(str(i), callback_data=f"stat_matches_{i}") for i in range(1, 6)]
-    row2 = [InlineKeyboardButton(str(i), callback_data=f"stat_matches_{i}") for i in range(6, 11)]
+    row1 = [InlineKeyboardButton(str(i), callback_data=encode("sm", i)) for i in range(1, 6)]
+    row2 = [InlineKeyboardButton(str(i), callback_data=encode("sm", i)) for i in range(6, 11)]
     keyboard = [row1, row2]
     
-    await context.bot.send_message(
+    sent = await context.bot.send_message(
         chat_id=chat_id, 
         text=f"📊 <b>Stats Input</b>\n{name_A} vs {name_B}\n\nHow many matches played in total?", 
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode="HTML"
     )
 
-async def handle_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # One wizard per message, so several can be filled in at once. chat_data is persisted
+    # as JSON: message ids are string keys. Abandoned wizards are dropped after a day.
+    wizards = context.chat_data.setdefault('stats_wizards', {})
+    now = time.time()
+    for msg_id in [m for m, w in wizards.items() if now - w['started'] > WIZARD_TTL]:
+        del wizards[msg_id]
+    wizards[str(sent.message_id)] = {
+        'pA': pA_id, 'pB': pB_id,
+        'nameA': name_A, 'nameB': name_B,
+        'chat_id': chat_id, 'started': now
+    }
+
+async def _stats_wizard(update, context):
+    """Answers the query and returns the stats being entered on this message, or None if it's gone."""
     query = update.callback_query
-    data = query.data
     await query.answer()
     
-    if 'current_stats' not in context.chat_data:
+    stats = context.chat_data.get('stats_wizards', {}).get(str(query.message.message_id))
+    if stats is None:
         await query.message.edit_text("❌ Stats session expired. Please start over.")
-        return
+    return stats
 
-    stats = context.chat_data['current_stats']
-    name_A = stats['nameA']
-    name_B = stats['nameB']
+@register("sm", int)
+async def stats_matches(update: Update, context: ContextTypes.DEFAULT_TYPE, val: int):
+    stats = await _stats_wizard(update, context)
+    if stats is None: return
+    stats['played'] = val
+    
+    keys = [InlineKeyboardButton(str(i), callback_data=encode("sa", i)) for i in range(val + 1)]
+    rows = [keys[i:i+5] for i in range(0, len(keys), 5)]
+    
+    await update.callback_query.message.edit_text(
+        f"Matches Played: {val}\n\n🏆 How many wins for <b>{stats['nameA']}</b>?", 
+        reply_markup=InlineKeyboardMarkup(rows),
+        parse_mode="HTML"
+    )
 
-    if data.startswith("stat_matches_"):
-        val = int(data.split("_")[-1])
-        stats['played'] = val
-        
-        keys = [InlineKeyboardButton(str(i), callback_data=f"stat_winsA_{i}") for i in range(val + 1)]
-        rows = [keys[i:i+5] for i in range(0, len(keys), 5)]
-        
-        await query.message.edit_text(
-            f"Matches Played: {val}\n\n🏆 How many wins for <b>{name_A}</b>?", 
-            reply_markup=InlineKeyboardMarkup(rows),
-            parse_mode="HTML"
-        )
-        context.chat_data['current_stats'] = stats
-        return
+@register("sa", int)
+async def stats_wins_a(update: Update, context: ContextTypes.DEFAULT_TYPE, val: int):
+    stats = await _stats_wizard(update, context)
+    if stats is None: return
+    stats['winsA'] = val
+    
+    remaining = stats['played'] - val
+    keys = [InlineKeyboardButton(str(i), callback_data=encode("sb", i)) for i in range(remaining + 1)]
+    rows = [keys[i:i+5] for i in range(0, len(keys), 5)]
+    
+    await update.callback_query.message.edit_text(
+        f"Matches: {stats['played']}\n{stats['nameA']} Wins: {val}\n\n🏆 How many wins for <b>{stats['nameB']}</b>?", 
+        reply_markup=InlineKeyboardMarkup(rows),
+        parse_mode="HTML"
+    )
 
-    if data.startswith("stat_winsA_"):
-        val = int(data.split("_")[-1])
-        stats['winsA'] = val
-        
-        remaining = stats['played'] - val
-        keys = [InlineKeyboardButton(str(i), callback_data=f"stat_winsB_{i}") for i in range(remaining + 1)]
-        rows = [keys[i:i+5] for i in range(0, len(keys), 5)]
-        
-        await query.message.edit_text(
-            f"Matches: {stats['played']}\n{name_A} Wins: {val}\n\n🏆 How many wins for <b>{name_B}</b>?", 
-            reply_markup=InlineKeyboardMarkup(rows),
-            parse_mode="HTML"
-        )
-        context.chat_data['current_stats'] = stats
-        return
+@register("sb", int)
+async def stats_wins_b(update: Update, context: ContextTypes.DEFAULT_TYPE, val: int):
+    stats = await _stats_wizard(update, context)
+    if stats is None: return
+    name_A = stats['nameA']
+    name_B = stats['nameB']
+    stats['winsB'] = val
+    
+    draws = stats['played'] - stats['winsA'] - stats['winsB']
+    stats['draws'] = draws
+    
+    await run_db(_save_results, stats)
+    forget_rendered(stats['chat_id'])
+    
+    receipt = (f"✅ <b>Stats Saved</b>\n"
+               f"👤 {name_A} vs 👤 {name_B}\n\n"
+               f"🎮 Played: {stats['played']}\n"
+               f"🥇 {name_A}: {stats['winsA']}\n"
+               f"🥈 {name_B}: {stats['winsB']}\n"
+               f"🤝 Draws: {stats['draws']}")
+    
+    await update.callback_query.message.edit_text(receipt, parse_mode="HTML")
+    wizards = context.chat_data['stats_wizards']
+    wizards.pop(str(update.callback_query.message.message_id), None)
+    if not wizards:
+        del context.chat_data['stats_wizards']
 
-    if data.startswith("stat_winsB_"):
-        val = int(data.split("_")[-1])
-        stats['winsB'] = val
-        
-        draws = stats['played'] - stats['winsA'] - stats['winsB']
-        stats['draws'] = draws
-        
-        with next(get_db()) as db:
-            for _ in range(stats['winsA']):
-                db.add(MatchStat(chat_id=stats['chat_id'], player_a_id=stats['pA'], player_b_id=stats['pB'], score_a=1, score_b=0, is_draw=False))
-            for _ in range(stats['winsB']):
-                db.add(MatchStat(chat_id=stats['chat_id'], player_a_id=stats['pA'], player_b_id=stats['pB'], score_a=0, score_b=1, is_draw=False))
-            for _ in range(stats['draws']):
-                db.add(MatchStat(chat_id=stats['chat_id'], player_a_id=stats['pA'], player_b_id=stats['pB'], score_a=0, score_b=0, is_draw=True))
-            
-            db.commit()
-            
-            receipt = (f"✅ <b>Stats Saved</b>\n"
-                       f"👤 {name_A} vs 👤 {name_B}\n\n"
-                       f"🎮 Played: {stats['played']}\n"
-                       f"🥇 {name_A}: {stats['winsA']}\n"
-                       f"🥈 {name_B}: {stats['winsB']}\n"
-                       f"🤝 Draws: {stats['draws']}")
-            
-            await query.message.edit_text(receipt, parse_mode="HTML")
-            del context.chat_data['current_stats']
+legacy("stat_matches_", "sm")
+legacy("stat_winsA_", "sa")
+legacy("stat_winsB_", "sb")
 
 # =========================================
 #  PART 2: LEADERBOARDS & VIEWING STATS
 # =========================================
 
-def calculate_leaderboard(db, chat_id, since_date=None):
-    query = db.query(MatchStat).filter(MatchStat.chat_id == chat_id)
-    if since_date:
-        query = query.filter(MatchStat.timestamp >= since_date)
+def calculate_leaderboard(db, chat_id, month=None):
+    # Answered from the rollup table: one grouped, indexed query
+    query = db.query(
+        PlayerMonthStat.user_id,
+        func.sum(PlayerMonthStat.wins),
+        func.sum(PlayerMonthStat.draws),
+        func.sum(PlayerMonthStat.total)
+    ).filter(PlayerMonthStat.chat_id == chat_id)
+    if month:
+        query = query.filter(PlayerMonthStat.month == month)
     
-    stats = query.all()
-    data = {} 
+    rows = query.group_by(PlayerMonthStat.user_id).having(func.sum(PlayerMonthStat.total) >= 3).all()
     
-    for s in stats:
-        # Process A
-        if s.player_a_id not in data: data[s.player_a_id] = {'wins': 0, 'draws': 0, 'total': 0}
-        data[s.player_a_id]['total'] += 1
-        if s.score_a > s.score_b: data[s.player_a_id]['wins'] += 1
-        if s.is_draw: data[s.player_a_id]['draws'] += 1
-        
-        # Process B
-        if s.player_b_id not in data: data[s.player_b_id] = {'wins': 0, 'draws': 0, 'total': 0}
-        data[s.player_b_id]['total'] += 1
-        if s.score_b > s.score_a: data[s.player_b_id]['wins'] += 1
-        if s.is_draw: data[s.player_b_id]['draws'] += 1
-        
+    users = get_users(db, [uid for uid, _, _, _ in rows])
+
     leaderboard = []
-    for uid, d in data.items():
-        if d['total'] < 3: continue 
-        win_pct = (d['wins'] + 0.5 * d['draws']) / d['total'] * 100
-        user = db.query(User).filter_by(user_id=uid).first()
-        name = user.full_name if user else str(uid)
-        leaderboard.append({'name': name, 'pct': win_pct, 'w': d['wins'], 'd': d['draws'], 't': d['total']})
+    for uid, wins, draws, total in rows:
+        win_pct = (wins + 0.5 * draws) / total * 100
+        name = users[uid].full_name if uid in users else str(uid)
+        leaderboard.append({'name': name, 'pct': win_pct, 'w': wins, 'd': draws, 't': total})
         
     leaderboard.sort(key=lambda x: x['pct'], reverse=True)
     return leaderboard
@@ -149,108 +244,128 @@ async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Default -> Show Leaderboard Menu
-    keyboard = [[InlineKeyboardButton("📅 Monthly", callback_data="lb_monthly"),
-                 InlineKeyboardButton("♾️ Overall", callback_data="lb_overall")]]
+    keyboard = [[InlineKeyboardButton("📅 Monthly", callback_data=encode("lb", "m")),
+                 InlineKeyboardButton("♾️ Overall", callback_data=encode("lb", "o"))]]
     
     await update.message.reply_text("🏆 <b>Leaderboards</b>\nSelect duration:", 
                                     reply_markup=InlineKeyboardMarkup(keyboard),
                                     parse_mode="HTML")
 
+def _player_profile(db, chat_id, target_id):
+    # Per-opponent W/L/D in one round trip: the target's series as A and as B
+    # (each side served by its own (chat_id, player) index), folded per opponent.
+    as_a = select(
+        MatchSeries.player_b_id.label("opp"), MatchSeries.id.label("sid"), MatchSeries.played.label("t"),
+        MatchSeries.wins_a.label("w"), MatchSeries.wins_b.label("l"), MatchSeries.draws.label("d")
+    ).where(MatchSeries.chat_id == chat_id, MatchSeries.player_a_id == target_id)
+    as_b = select(
+        MatchSeries.player_a_id, MatchSeries.id, MatchSeries.played,
+        MatchSeries.wins_b, MatchSeries.wins_a, MatchSeries.draws
+    ).where(MatchSeries.chat_id == chat_id, MatchSeries.player_b_id == target_id)
+    both = union_all(as_a, as_b).subquery()
+
+    rows = db.execute(
+        select(both.c.opp, func.sum(both.c.t), func.sum(both.c.w), func.sum(both.c.l), func.sum(both.c.d))
+        .group_by(both.c.opp)
+        .order_by(func.min(both.c.sid)) # first-played opponent first, as before
+    ).all()
+    
+    if not rows:
+        return None
+
+    opponents = {opp: {'t': t, 'w': w, 'l': l, 'd': d} for opp, t, w, l, d in rows}
+    total = sum(d['t'] for d in opponents.values())
+    wins = sum(d['w'] for d in opponents.values())
+    losses = sum(d['l'] for d in opponents.values())
+    draws = sum(d['d'] for d in opponents.values())
+
+    users = get_users(db, opponents)
+    for oid, d in opponents.items():
+        d['name'] = users[oid].full_name if oid in users else "Unknown"
+
+    return {'total': total, 'wins': wins, 'losses': losses, 'draws': draws, 'opponents': opponents}
+
+def format_profile(target_name, profile):
+    # Calc Favorite
+    fav_opp = "None"
+    best_pct = -1
+    
+    detail_txt = ""
+    for oid, d in profile['opponents'].items():
+        name = d['name']
+        detail_txt += f"vs {name}: {d['t']} (W{d['w']}/L{d['l']}/D{d['d']})\n"
+        
+        if d['t'] >= 3:
+            pct = (d['w'] / d['t']) * 100
+            if pct > best_pct:
+                best_pct = pct
+                fav_opp = f"{name} ({pct:.0f}%)"
+
+    return (f"👤 <b>Player Stats: {target_name}</b>\n"
+            f"Total: {profile['total']} | W: {profile['wins']} | L: {profile['losses']} | D: {profile['draws']}\n"
+            f"🦆 <b>Favorite Opponent:</b> {fav_opp}\n\n"
+            f"⚔️ <b>Head-to-Head:</b>\n{detail_txt}")
+
 async def show_individual_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     target_id = None
     target_name = "User"
 
     from features.general import get_target_users
-    with next(get_db()) as db:
-        targets = await get_target_users(update, context, db)
-        if targets:
-            target_id = targets[0].id
-            target_name = targets[0].full_name
-        else:
-            # Self stats fallback (only if args were confusing or empty target found)
-            target_id = update.effective_user.id
-            target_name = update.effective_user.full_name
-            
-        if not target_id: return
-
-        matches = db.query(MatchStat).filter(
-            MatchStat.chat_id == chat_id,
-            or_(MatchStat.player_a_id == target_id, MatchStat.player_b_id == target_id)
-        ).all()
+    targets = await get_target_users(update, context)
+    if targets:
+        target_id = targets[0].id
+        target_name = targets[0].full_name
+    else:
+        # Self stats fallback (only if args were confusing or empty target found)
+        target_id = update.effective_user.id
+        target_name = update.effective_user.full_name
         
-        if not matches:
-            await update.message.reply_text(f"No stats for {target_name}.")
-            return
-
-        total = 0; wins = 0; losses = 0; draws = 0
-        opponents = {} 
-
-        for m in matches:
-            total += 1
-            is_a = (m.player_a_id == target_id)
-            opp_id = m.player_b_id if is_a else m.player_a_id
-            
-            if opp_id not in opponents: opponents[opp_id] = {'t':0, 'w':0, 'l':0, 'd':0}
-            opponents[opp_id]['t'] += 1
-
-            if m.is_draw:
-                draws += 1
-                opponents[opp_id]['d'] += 1
-            elif (is_a and m.score_a > m.score_b) or (not is_a and m.score_b > m.score_a):
-                wins += 1
-                opponents[opp_id]['w'] += 1
-            else:
-                losses += 1
-                opponents[opp_id]['l'] += 1
+    if not target_id: return
 
-        # Calc Favorite
-        fav_opp = "None"
-        best_pct = -1
-        
-        detail_txt = ""
-        for oid, d in opponents.items():
-            u = db.query(User).filter_by(user_id=oid).first()
-            name = u.full_name if u else "Unknown"
-            
-            detail_txt += f"vs {name}: {d['t']} (W{d['w']}/L{d['l']}/D{d['d']})\n"
-            
-            if d['t'] >= 3:
-                pct = (d['w'] / d['t']) * 100
-                if pct > best_pct:
-                    best_pct = pct
-                    fav_opp = f"{name} ({pct:.0f}%)"
-
-        msg = (f"👤 <b>Player Stats: {target_name}</b>\n"
-               f"Total: {total} | W: {wins} | L: {losses} | D: {draws}\n"
-               f"🦆 <b>Favorite Opponent:</b> {fav_opp}\n\n"
-               f"⚔️ <b>Head-to-Head:</b>\n{detail_txt}")
+    profile = await cached_profile(chat_id, target_id)
+    if not profile:
+        await update.message.reply_text(f"No stats for {target_name}.")
+        return
+    await update.message.reply_text(format_profile(target_name, profile), parse_mode="HTML")
+
+async def cached_profile(chat_id, target_id):
+    # Keyed by player only: the display name is formatted in per request, so a rename
+    # doesn't leave a second copy behind, and saving results (a generation bump) reaches it
+    return await rendered_cache.fetch(
+        (chat_id, "profile", target_id), lambda: run_db(_player_profile, chat_id, target_id), scope=chat_id
+    )
+
+def render_leaderboard(lb, month_of=None):
+    if month_of:
+        title = f"📅 <b>Monthly Leaderboard ({month_of.strftime('%B')})</b>"
+    else:
+        title = "♾️ <b>Overall Leaderboard</b>"
         
-        await update.message.reply_text(msg, parse_mode="HTML")
+    if not lb:
+        return f"{title}\nNo stats yet (min 3 matches)."
+
+    txt = f"{title}\n\n"
+    for i, row in enumerate(lb, 1):
+        icon = "🏆 " if i == 1 else f"{i}. "
+        txt += f"{icon}<b>{row['name']}</b>: {row['pct']:.1f}% ({row['w']}W/{row['d']}D/{row['t']}T)\n"
+    return txt
 
-async def handle_lb_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@register("lb", str)
+async def handle_lb_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, scope: str):
     query = update.callback_query
-    data = query.data
     chat_id = update.effective_chat.id
     
-    with next(get_db()) as db:
-        if data == "lb_monthly":
-            now = datetime.now(timezone.utc)
-            # Safe reset to start of month
-            start_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            lb = calculate_leaderboard(db, chat_id, start_month)
-            title = f"📅 <b>Monthly Leaderboard ({now.strftime('%B')})</b>"
-        else:
-            lb = calculate_leaderboard(db, chat_id, None)
-            title = "♾️ <b>Overall Leaderboard</b>"
-            
-        if not lb:
-            await query.edit_message_text(f"{title}\nNo stats yet (min 3 matches).", parse_mode="HTML")
-            return
-
-        txt = f"{title}\n\n"
-        for i, row in enumerate(lb, 1):
-            icon = "🏆 " if i == 1 else f"{i}. "
-            txt += f"{icon}<b>{row['name']}</b>: {row['pct']:.1f}% ({row['w']}W/{row['d']}D/{row['t']}T)\n"
-            
-        await query.edit_message_text(txt, parse_mode="HTML")
+    now = datetime.now(timezone.utc)
+    month = month_key(now) if scope == "m" else None
+
+    async def render():
+        return render_leaderboard(await run_db(calculate_leaderboard, chat_id, month), now if month else None)
+
+    # Repeat presses with no new results cost no DB work at all
+    txt = await rendered_cache.fetch((chat_id, "lb", month), render, scope=chat_id)
+        
+    await query.edit_message_text(txt, parse_mode="HTML")
+
+legacy("lb_monthly", "lb", "m")
+legacy("lb_overall", "lb", "o")
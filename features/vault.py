@@ -1,8 +1,111 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from database import get_db
+from database import run_db
 from models import VaultItem
-from sqlalchemy import func
+from cache import TTLCache, Generations
+from search import KeywordIndex
+from pagination import paged_list, keyset_page, send_first_page
+from sqlalchemy import case
+import html
+import random
+
+# --- Caches ---
+# Saves and deletes bump the chat's generation, shared by all three caches below,
+# so a value loaded while a write was in flight is never reused.
+vault_generations = Generations()
+
+# (chat_id, keyword) -> (item_type, content), or () for a known miss.
+vault_cache = TTLCache("vault_items", maxsize=4096, ttl=3600, generations=vault_generations)
+
+# chat_id -> KeywordIndex. Patched in place by forget_vault when it is current,
+# rebuilt from the table otherwise.
+search_cache = TTLCache("vault_search", maxsize=256, ttl=3600, generations=vault_generations)
+
+# chat_id -> [excuse ids]. /excuse picks an index instead of sorting the chat's
+# excuses by random() on every call.
+excuse_cache = TTLCache("vault_excuses", maxsize=256, ttl=3600, generations=vault_generations)
+
+def forget_vault(chat_id, added=None, removed=None):
+    """Call after a committed save ((keyword, item_type, text) in added) or delete (keyword in removed)."""
+    gen = vault_generations.current(chat_id)
+    new_gen = vault_generations.bump(chat_id)
+    entry = search_cache.get(chat_id)
+    if entry is None:
+        return
+    if entry[0] != gen:
+        search_cache.pop(chat_id)
+        return
+    index = entry[1]
+    if added: index.add(*added)
+    if removed: index.remove(removed)
+    search_cache.set(chat_id, (new_gen, index))
+
+async def search_index(chat_id):
+    return await search_cache.fetch(chat_id, lambda: run_db(_build_index, chat_id))
+
+async def excuse_ids(chat_id):
+    return await excuse_cache.fetch(chat_id, lambda: run_db(_excuse_ids, chat_id))
+
+async def lookup_item(chat_id, keyword, item_type=None):
+    async def load():
+        return await run_db(_find_item, chat_id, keyword) or ()
+    item = await vault_cache.fetch((chat_id, keyword), load, scope=chat_id)
+    if not item or (item_type and item[0] != item_type):
+        return None
+    return item
+
+# --- DB units of work (run via run_db) ---
+def _add_item(db, chat_id, keyword, item_type, content):
+    if db.query(VaultItem).filter_by(chat_id=chat_id, keyword=keyword).first():
+        return False
+    db.add(VaultItem(chat_id=chat_id, keyword=keyword, item_type=item_type, content=content))
+    db.commit()
+    return True
+
+def _find_item(db, chat_id, keyword, item_type=None):
+    q = db.query(VaultItem).filter_by(chat_id=chat_id, keyword=keyword)
+    if item_type: q = q.filter_by(item_type=item_type)
+    item = q.first()
+    return (item.item_type, item.content) if item else None
+
+def _delete_item(db, chat_id, keyword, item_type=None):
+    q = db.query(VaultItem).filter_by(chat_id=chat_id, keyword=keyword)
+    if item_type: q = q.filter_by(item_type=item_type)
+    item = q.first()
+    if not item:
+        return False
+    db.delete(item)
+    db.commit()
+    return True
+
+def _saves_page(db, chat_id, after, before, size):
+    q = db.query(VaultItem.id, VaultItem.keyword, VaultItem.item_type).filter(
+        VaultItem.chat_id==chat_id, VaultItem.item_type.notin_(['sticker', 'excuse']))
+    return keyset_page(q, VaultItem.id, after, before, size)
+
+def _stickers_page(db, chat_id, after, before, size):
+    q = db.query(VaultItem.id, VaultItem.keyword).filter_by(chat_id=chat_id, item_type="sticker")
+    return keyset_page(q, VaultItem.id, after, before, size)
+
+def _excuses_page(db, chat_id, after, before, size):
+    q = db.query(VaultItem.id, VaultItem.keyword, VaultItem.content).filter_by(chat_id=chat_id, item_type="excuse")
+    return keyset_page(q, VaultItem.id, after, before, size)
+
+def _search_rows(db, chat_id):
+    # Excuse text is searchable too; file_ids and saved texts are not loaded
+    text = case((VaultItem.item_type == "excuse", VaultItem.content), else_=None)
+    return db.query(VaultItem.keyword, VaultItem.item_type, text).filter(VaultItem.chat_id == chat_id).all()
+
+def _build_index(db, chat_id):
+    # Built on the worker too: a large chat's index takes a noticeable moment
+    return KeywordIndex(_search_rows(db, chat_id))
+
+def _excuse_ids(db, chat_id):
+    # Covered by ix_vault_items_chat_type
+    return [i for i, in db.query(VaultItem.id).filter_by(chat_id=chat_id, item_type="excuse")]
+
+def _excuse_content(db, item_id):
+    return db.query(VaultItem.content).filter_by(id=item_id, item_type="excuse").scalar()
 
 # --- Generic Save/Recall ---
 async def save_item(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -26,57 +129,69 @@ async def save_item(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Unsupported content.")
         return
 
-    with next(get_db()) as db:
-        if db.query(VaultItem).filter_by(chat_id=chat_id, keyword=keyword).first():
-            await update.message.reply_text("Keyword taken.")
-            return
-        db.add(VaultItem(chat_id=chat_id, keyword=keyword, item_type=item_type, content=content))
-        db.commit()
-        await update.message.reply_text(f"Saved '{keyword}'.")
+    if not await run_db(_add_item, chat_id, keyword, item_type, content):
+        await update.message.reply_text("Keyword taken.")
+        return
+    forget_vault(chat_id, added=(keyword, item_type))
+    await update.message.reply_text(f"Saved '{keyword}'.")
 
 async def recall_item(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args: return
     keyword = context.args[0].lower()
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        item = db.query(VaultItem).filter_by(chat_id=chat_id, keyword=keyword).first()
-        if not item:
+    item = await lookup_item(chat_id, keyword)
+    if not item:
+        suggestions = (await search_index(chat_id)).search(keyword, limit=3)
+        if suggestions:
+            names = ", ".join(f"<code>{html.escape(k)}</code>" for k, _, _ in suggestions)
+            await update.message.reply_text(f"Not found. Did you mean {names}?", parse_mode="HTML")
+        else:
             await update.message.reply_text("Not found.")
-            return
-        
-        try:
-            if item.item_type == "text": await update.message.reply_text(item.content)
-            elif item.item_type == "photo": await update.message.reply_photo(item.content)
-            elif item.item_type == "video": await update.message.reply_video(item.content)
-            elif item.item_type == "document": await update.message.reply_document(item.content)
-            elif item.item_type == "voice": await update.message.reply_voice(item.content)
-            elif item.item_type == "audio": await update.message.reply_audio(item.content)
-            elif item.item_type == "sticker": await update.message.reply_sticker(item.content)
-        except Exception:
-            await update.message.reply_text("Error sending media (file too old?).")
+        return
+    
+    item_type, content = item
+    try:
+        if item_type == "text": await update.message.reply_text(content)
+        elif item_type == "photo": await update.message.reply_photo(content)
+        elif item_type == "video": await update.message.reply_video(content)
+        elif item_type == "document": await update.message.reply_document(content)
+        elif item_type == "voice": await update.message.reply_voice(content)
+        elif item_type == "audio": await update.message.reply_audio(content)
+        elif item_type == "sticker": await update.message.reply_sticker(content)
+    except Exception:
+        await update.message.reply_text("Error sending media (file too old?).")
+
+async def search_saves(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text("Usage: /qsearch <text>")
+        return
+    query = " ".join(context.args)
+    matches = (await search_index(update.effective_chat.id)).search(query, limit=10)
+    if not matches:
+        await update.message.reply_text("No matches.")
+        return
+    lines = []
+    for keyword, item_type, text in matches:
+        line = f"• <code>{html.escape(keyword)}</code> ({item_type})"
+        if text: line += f": {html.escape(text[:30])}"
+        lines.append(line)
+    await update.message.reply_text(f"🔎 <b>Matches for '{html.escape(query)}':</b>\n" + "\n".join(lines), parse_mode="HTML")
+
+paged_list("sv", _saves_page, lambda row, n: f"{html.escape(row.keyword)} ({row.item_type})",
+           title="📁 <b>Saved Items:</b>", empty="No saves.", parse_mode="HTML")
 
 async def list_saves(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        items = db.query(VaultItem).filter(VaultItem.chat_id==chat_id, VaultItem.item_type.notin_(['sticker', 'excuse'])).all()
-        if not items:
-            await update.message.reply_text("No saves.")
-            return
-        lines = [f"{i.keyword} ({i.item_type})" for i in items]
-        await update.message.reply_text("📁 <b>Saved Items:</b>\n" + "\n".join(lines), parse_mode="HTML")
+    await send_first_page(update, "sv")
 
 async def delete_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args: return
     key = context.args[0].lower()
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        item = db.query(VaultItem).filter_by(chat_id=chat_id, keyword=key).first()
-        if item:
-            db.delete(item)
-            db.commit()
-            await update.message.reply_text(f"Deleted '{key}'.")
-        else:
-            await update.message.reply_text("Not found.")
+    if await run_db(_delete_item, chat_id, key):
+        forget_vault(chat_id, removed=key)
+        await update.message.reply_text(f"Deleted '{key}'.")
+    else:
+        await update.message.reply_text("Not found.")
 
 # --- Stickers ---
 async def save_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -87,45 +202,35 @@ async def save_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     file_id = update.message.reply_to_message.sticker.file_id
     
-    with next(get_db()) as db:
-        if db.query(VaultItem).filter_by(chat_id=chat_id, keyword=keyword).first():
-            await update.message.reply_text("Keyword taken.")
-            return
-        db.add(VaultItem(chat_id=chat_id, keyword=keyword, item_type="sticker", content=file_id))
-        db.commit()
-        await update.message.reply_text("Sticker saved.")
+    if not await run_db(_add_item, chat_id, keyword, "sticker", file_id):
+        await update.message.reply_text("Keyword taken.")
+        return
+    forget_vault(chat_id, added=(keyword, "sticker"))
+    await update.message.reply_text("Sticker saved.")
 
 async def recall_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args: return
     keyword = context.args[0].lower()
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        item = db.query(VaultItem).filter_by(chat_id=chat_id, keyword=keyword, item_type="sticker").first()
-        if item: await update.message.reply_sticker(item.content)
-        else: await update.message.reply_text("Sticker not found.")
+    item = await lookup_item(chat_id, keyword, "sticker")
+    if item: await update.message.reply_sticker(item[1])
+    else: await update.message.reply_text("Sticker not found.")
+
+paged_list("st", _stickers_page, lambda row, n: f"• {html.escape(row.keyword)}",
+           title="🖼 <b>Stickers:</b>", empty="No saved stickers.", parse_mode="HTML")
 
 async def list_stickers(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        items = db.query(VaultItem).filter_by(chat_id=chat_id, item_type="sticker").all()
-        if not items:
-            await update.message.reply_text("No saved stickers.")
-            return
-        lines = [f"• {i.keyword}" for i in items]
-        await update.message.reply_text("🖼 <b>Stickers:</b>\n" + "\n".join(lines), parse_mode="HTML")
+    await send_first_page(update, "st")
 
 async def delete_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args: return
     key = context.args[0].lower()
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        item = db.query(VaultItem).filter_by(chat_id=chat_id, keyword=key, item_type="sticker").first()
-        if item:
-            db.delete(item)
-            db.commit()
-            await update.message.reply_text(f"Deleted sticker '{key}'.")
-        else:
-            await update.message.reply_text("Not found.")
+    if await run_db(_delete_item, chat_id, key, "sticker"):
+        forget_vault(chat_id, removed=key)
+        await update.message.reply_text(f"Deleted sticker '{key}'.")
+    else:
+        await update.message.reply_text("Not found.")
 
 # --- Excuses ---
 async def save_excuse(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -145,40 +250,36 @@ async def save_excuse(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Provide text or reply to a message.")
         return
 
-    with next(get_db()) as db:
-        if db.query(VaultItem).filter_by(chat_id=chat_id, keyword=keyword).first():
-            await update.message.reply_text("Keyword taken.")
-            return
-        db.add(VaultItem(chat_id=chat_id, keyword=keyword, item_type="excuse", content=content))
-        db.commit()
-        await update.message.reply_text("Excuse saved.")
+    if not await run_db(_add_item, chat_id, keyword, "excuse", content):
+        await update.message.reply_text("Keyword taken.")
+        return
+    forget_vault(chat_id, added=(keyword, "excuse", content))
+    await update.message.reply_text("Excuse saved.")
 
 async def random_excuse(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        item = db.query(VaultItem).filter_by(chat_id=chat_id, item_type="excuse").order_by(func.random()).first()
-        if item: await update.message.reply_text(item.content)
-        else: await update.message.reply_text("No excuses found.")
+    ids = await excuse_ids(chat_id)
+    content = await run_db(_excuse_content, random.choice(ids)) if ids else None
+    if content is None and ids:
+        # Deleted under us: reload the ids once
+        excuse_cache.pop(chat_id)
+        ids = await excuse_ids(chat_id)
+        content = await run_db(_excuse_content, random.choice(ids)) if ids else None
+    if content: await update.message.reply_text(content)
+    else: await update.message.reply_text("No excuses found.")
+
+paged_list("ex", _excuses_page, lambda row, n: f"{html.escape(row.keyword)}: {html.escape(row.content[:30])}...",
+           title="🤥 <b>Excuses:</b>", empty="No excuses saved.", parse_mode="HTML")
 
 async def list_excuses(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        items = db.query(VaultItem).filter_by(chat_id=chat_id, item_type="excuse").all()
-        if not items:
-            await update.message.reply_text("No excuses saved.")
-            return
-        lines = [f"{i.keyword}: {i.content[:30]}..." for i in items]
-        await update.message.reply_text("🤥 <b>Excuses:</b>\n" + "\n".join(lines), parse_mode="HTML")
+    await send_first_page(update, "ex")
 
 async def delete_excuse(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args: return
     key = context.args[0].lower()
     chat_id = update.effective_chat.id
-    with next(get_db()) as db:
-        item = db.query(VaultItem).filter_by(chat_id=chat_id, keyword=key, item_type="excuse").first()
-        if item:
-            db.delete(item)
-            db.commit()
-            await update.message.reply_text(f"Deleted excuse '{key}'.")
-        else:
-            await update.message.reply_text("Not found.")
+    if await run_db(_delete_item, chat_id, key, "excuse"):
+        forget_vault(chat_id, removed=key)
+        await update.message.reply_text(f"Deleted excuse '{key}'.")
+    else:
+        await update.message.reply_text("Not found.")
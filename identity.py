@@ -0,0 +1,60 @@
+from collections import namedtuple
+from cache import TTLCache
+from models import Chat, User
+
+# Immutable snapshots of the small identity rows. Safe to share between
+# run_db workers and handlers, unlike session-bound ORM objects.
+ChatRow = namedtuple("ChatRow", "chat_id title about_text session_ttl primary_squad")
+UserRow = namedtuple("UserRow", "user_id full_name username")
+MemberRow = namedtuple("MemberRow", "id chat_id user_id is_excluded")
+
+chat_cache = TTLCache("chats", maxsize=2048, ttl=600)
+user_cache = TTLCache("users", maxsize=20000, ttl=600)
+member_cache = TTLCache("members", maxsize=50000, ttl=600)
+
+
+def chat_row(c):
+    return ChatRow(c.chat_id, c.title, c.about_text, c.session_ttl, c.primary_squad)
+
+def user_row(u):
+    return UserRow(u.user_id, u.full_name, u.username)
+
+def member_row(m):
+    return MemberRow(m.id, m.chat_id, m.user_id, m.is_excluded)
+
+
+# --- Read-through lookups (call with a session, i.e. inside run_db) ---
+def get_chat(db, chat_id):
+    row = chat_cache.get(chat_id)
+    if row is None:
+        c = db.query(Chat).filter_by(chat_id=chat_id).first()
+        if c:
+            row = chat_row(c)
+            chat_cache.set(chat_id, row)
+    return row
+
+def get_users(db, user_ids):
+    """Resolves many user ids at once: cache first, then one IN (...) query for the rest."""
+    found, missing = {}, set()
+    for uid in user_ids:
+        if uid is None or uid in found:
+            continue
+        row = user_cache.get(uid)
+        if row is None:
+            missing.add(uid)
+        else:
+            found[uid] = row
+    if missing:
+        for u in db.query(User).filter(User.user_id.in_(missing)).all():
+            row = user_row(u)
+            user_cache.set(u.user_id, row)
+            found[u.user_id] = row
+    return found
+
+
+# --- Invalidation (call after the writing transaction commits) ---
+def forget_chat(chat_id):
+    chat_cache.pop(chat_id)
+
+def forget_member(chat_id, user_id):
+    member_cache.pop((chat_id, user_id))
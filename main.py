@@ -1,19 +1,31 @@
+import asyncio
 import logging
+from collections import defaultdict
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
-from config import BOT_TOKEN
-from database import init_db, get_db
-from models import GameSession
+from config import (
+    BOT_TOKEN, UPDATE_WORKERS, SHARDS, UPDATE_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+)
+from database import init_db, engine
 from datetime import datetime, timezone
+from activity import activity_buffer, flush_activity, FLUSH_INTERVAL
+from session_store import session_store, flush_sessions, FLUSH_INTERVAL as SESSION_FLUSH_INTERVAL
+from perf import TracedRequest, instrument_engine, instrument_handlers
+from scheduler import OutboundScheduler, GLOBAL_RATE
+from update_processor import ChatOrderedProcessor
+from persistence import DBPersistence
+from utils import safe_delete
+from webhook import run_webhook
+from sharding import run_sharded, shard_of
 
 # Feature Imports
 from features.general import (
     track_activity, mention_all, exclude_member, include_member, 
-    all_list, who_all, help_command, about_command, set_about, start_command, handle_dm_callback,
+    all_list, who_all, help_command, about_command, set_about, start_command,
     set_dm_commands, set_dm_about, set_dm_repo
 )
 from features.vault import (
-    save_item, recall_item, list_saves, delete_save,
+    save_item, recall_item, search_saves, list_saves, delete_save,
     save_sticker, recall_sticker, list_stickers, delete_sticker,
     save_excuse, random_excuse, list_excuses, delete_excuse
 )
@@ -21,14 +33,12 @@ from features.roast import (
     roast_command, start_add_roast, save_roast, show_roasts, del_roast, ADD_ROAST_TEXT
 )
 from features.session import (
-    start_play, handle_callback, set_squad
-)
-# IMPORT handle_stats_callback HERE
-from features.stats import (
-    show_leaderboard, handle_lb_callback, handle_stats_callback
+    start_play, set_squad, forget_card
 )
+from features.stats import show_leaderboard
+from callbacks import route
 from features.admin import (
-    reset_all, list_groups, leave_group
+    reset_all, list_groups, leave_group, rebuild_stats, show_cache_stats, show_perf
 )
 
 logging.basicConfig(
@@ -36,32 +46,62 @@ logging.basicConfig(
     level=logging.INFO
 )
 
+EXPIRY_TICK = 15       # seconds between checks of the session expiry heap
+DELETE_CONCURRENCY = 8 # chats whose expired cards are deleted at once
+
 async def cleanup_sessions(context):
-    with next(get_db()) as db:
-        now = datetime.now(timezone.utc)
-        expired = db.query(GameSession).filter(GameSession.expires_at < now).all()
-        for session in expired:
-            try:
-                await context.bot.delete_message(chat_id=session.chat_id, message_id=session.message_id)
-            except Exception:
-                pass
-            db.delete(session)
-        db.commit()
+    expired = session_store.due(datetime.now(timezone.utc))
+    if not expired:
+        return
+    # Rows go first, in one statement, so late clicks see the session as gone
+    await session_store.delete([message_id for _, message_id in expired])
 
-def main():
-    init_db()
+    by_chat = defaultdict(list)
+    for chat_id, message_id in expired:
+        forget_card(message_id) # a debounced edit must not land on a deleted card
+        by_chat[chat_id].append(message_id)
+    limit = asyncio.Semaphore(DELETE_CONCURRENCY)
+
+    async def clear_chat(chat_id, message_ids):
+        # Messages within a chat go one by one; its rate bucket would serialize them anyway
+        async with limit:
+            for message_id in message_ids:
+                await safe_delete(context, chat_id, message_id)
+
+    await asyncio.gather(*(clear_chat(c, ids) for c, ids in by_chat.items()))
+
+async def on_shutdown(app):
+    # Don't lose buffered activity or session state on restart
+    await activity_buffer.flush()
+    await session_store.flush()
+
+def build_app(shard=0, shards=1):
+    """The whole bot. In sharded mode each worker process builds one for its share of the chats."""
+    owns = None if shards == 1 else lambda chat_id: shard_of(chat_id, shards) == shard
+    session_store.load(owns)
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    instrument_engine(engine)
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .request(TracedRequest(connection_pool_size=256))
+        .rate_limiter(OutboundScheduler(global_rate=GLOBAL_RATE / shards))
+        .concurrent_updates(ChatOrderedProcessor(UPDATE_WORKERS))
+        .persistence(DBPersistence(owns=owns))
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     
     # --- Job Queue (Auto Delete) ---
     jq = app.job_queue
-    jq.run_repeating(cleanup_sessions, interval=21600, first=60) 
+    jq.run_repeating(cleanup_sessions, interval=EXPIRY_TICK, first=EXPIRY_TICK)
+    jq.run_repeating(flush_activity, interval=FLUSH_INTERVAL, first=FLUSH_INTERVAL)
+    jq.run_repeating(flush_sessions, interval=SESSION_FLUSH_INTERVAL, first=SESSION_FLUSH_INTERVAL)
 
     # --- Handlers ---
     
     # 1. General
     app.add_handler(CommandHandler("start", start_command))
-    app.add_handler(CallbackQueryHandler(handle_dm_callback, pattern=r"^dm_"))
     app.add_handler(CommandHandler("setdmcommands", set_dm_commands))
     app.add_handler(CommandHandler("setdmabout", set_dm_about))
     app.add_handler(CommandHandler("setdmrepo", set_dm_repo))
@@ -80,6 +120,7 @@ def main():
     # 2. Vault
     app.add_handler(CommandHandler("save", save_item))
     app.add_handler(CommandHandler("q", recall_item))
+    app.add_handler(CommandHandler("qsearch", search_saves))
     app.add_handler(CommandHandler("sshow", list_saves))
     app.add_handler(CommandHandler("sdel", delete_save))
     app.add_handler(CommandHandler("ssave", save_sticker))
@@ -99,7 +140,9 @@ def main():
     conv_roast = ConversationHandler(
         entry_points=[CommandHandler("roastadd", start_add_roast)],
         states={ADD_ROAST_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_roast)]},
-        fallbacks=[]
+        fallbacks=[],
+        name="roastadd",
+        persistent=True
     )
     app.add_handler(conv_roast)
 
@@ -107,20 +150,39 @@ def main():
     app.add_handler(CommandHandler("play", start_play))
     app.add_handler(CommandHandler("setsquad", set_squad))
     app.add_handler(CommandHandler("stats", show_leaderboard))
-    
-    # ADDED STATS HANDLERS BACK
-    app.add_handler(CallbackQueryHandler(handle_lb_callback, pattern=r"^lb_"))
-    app.add_handler(CallbackQueryHandler(handle_stats_callback, pattern=r"^stat_"))
-    
-    app.add_handler(CallbackQueryHandler(handle_callback)) 
+
+    # Every inline button (sessions, stats, DM menu) goes through one router
+    app.add_handler(CallbackQueryHandler(route))
 
     # 5. Admin
     app.add_handler(CommandHandler("resetall", reset_all))
     app.add_handler(CommandHandler("groups", list_groups))
     app.add_handler(CommandHandler("groupdel", leave_group))
+    app.add_handler(CommandHandler("statsrebuild", rebuild_stats))
+    app.add_handler(CommandHandler("cachestats", show_cache_stats))
+    app.add_handler(CommandHandler("perf", show_perf))
+
+    # Must come after every add_handler
+    instrument_handlers(app)
+    return app
+
+def main():
+    init_db()
+    if UPDATE_MODE == "webhook" and not WEBHOOK_URL:
+        raise SystemExit("UPDATE_MODE=webhook needs WEBHOOK_URL")
+    webhook = (WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET) if UPDATE_MODE == "webhook" else None
 
     print("Marceline is waking up...")
-    app.run_polling()
+    if SHARDS > 1:
+        # Migrations ran above, once; the workers only build the app
+        run_sharded(BOT_TOKEN, SHARDS, build_app, webhook)
+        return
+
+    app = build_app()
+    if webhook:
+        run_webhook(app, *webhook)
+    else:
+        app.run_polling()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,165 @@
+"""
+Versioned schema migrations, applied in order at startup by init_db().
+
+Each migration runs once, in its own transaction, and is recorded in
+schema_migrations. Bodies are written to be safe to re-run anyway.
+
+    python migrations.py           # apply pending migrations
+    python migrations.py --check   # show which index the hot queries use
+"""
+import logging
+import sys
+from datetime import datetime, timezone
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, select, insert, func, case, text
+from database import engine, SessionLocal
+from models import VaultItem, ChatMember, RoastLine, GameSession, MatchStat, MatchSeries, PlayerMonthStat
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", DateTime(timezone=True)),
+)
+
+MIGRATIONS = [] # (version, name, fn)
+
+def migration(version, name):
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+def _create_indexes(db, model):
+    for index in model.__table__.indexes:
+        index.create(bind=db.connection(), checkfirst=True)
+
+
+@migration(1, "fold legacy match_stats into match_series")
+def fold_match_stats(db):
+    # Games saved together share a timestamp, so each (chat, A, B, timestamp) group is one series
+    a_won = case((MatchStat.score_a > MatchStat.score_b, 1), else_=0)
+    b_won = case((MatchStat.score_b > MatchStat.score_a, 1), else_=0)
+    drew = case((MatchStat.is_draw == True, 1), else_=0)
+    grouped = select(
+        MatchStat.chat_id, MatchStat.player_a_id, MatchStat.player_b_id,
+        func.count(), func.sum(a_won), func.sum(b_won), func.sum(drew), MatchStat.timestamp
+    ).group_by(
+        MatchStat.chat_id, MatchStat.player_a_id, MatchStat.player_b_id, MatchStat.timestamp
+    ).order_by(func.min(MatchStat.id))
+
+    db.execute(insert(MatchSeries).from_select(
+        ["chat_id", "player_a_id", "player_b_id", "played", "wins_a", "wins_b", "draws", "timestamp"],
+        grouped
+    ))
+    db.query(MatchStat).delete(synchronize_session=False)
+
+
+@migration(2, "backfill leaderboard rollups")
+def backfill_rollups(db):
+    from features.stats import rebuild_rollups
+    if db.query(PlayerMonthStat).first() is None:
+        rebuild_rollups(db)
+
+
+def _merge_vault_items(rows):
+    # The newest save is the value people have been getting back
+    return rows[-1]
+
+def _merge_chat_members(rows):
+    # Oldest row survives; an exclusion on any copy still holds
+    kept = rows[0]
+    kept.is_excluded = any(r.is_excluded for r in rows)
+    seen = [r.last_active for r in rows if r.last_active is not None]
+    if seen:
+        kept.last_active = max(seen)
+    return kept
+
+@migration(3, "indexes for hot lookups")
+def hot_indexes(db):
+    # Unique indexes can't be built over duplicates: fold each group into one row first
+    for model, cols, merge in ((VaultItem, ("chat_id", "keyword"), _merge_vault_items),
+                               (ChatMember, ("chat_id", "user_id"), _merge_chat_members)):
+        columns = [getattr(model, c) for c in cols]
+        groups = db.query(*columns).group_by(*columns).having(func.count() > 1).all()
+        for key in groups:
+            rows = db.query(model).filter_by(**dict(zip(cols, key))).order_by(model.id).all()
+            kept = merge(rows)
+            for row in rows:
+                if row is not kept:
+                    db.delete(row)
+            logger.warning("Merged %d duplicate %s rows for %s into id %d",
+                           len(rows), model.__tablename__, dict(zip(cols, key)), kept.id)
+    db.flush()
+
+    for model in (VaultItem, ChatMember, RoastLine, GameSession, MatchSeries, PlayerMonthStat):
+        _create_indexes(db, model)
+
+
+@migration(4, "vault page index")
+def vault_page_index(db):
+    _create_indexes(db, VaultItem)
+
+
+def run_migrations():
+    schema_migrations.create(bind=engine, checkfirst=True)
+    with SessionLocal() as db:
+        applied = set(db.scalars(select(schema_migrations.c.version)))
+
+    for version, name, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        logger.info("Applying migration %d: %s", version, name)
+        with SessionLocal() as db:
+            fn(db)
+            db.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.now(timezone.utc)
+            ))
+            db.commit()
+
+
+# --- Index check ---
+HOT_QUERIES = {
+    "vault recall": ("SELECT * FROM vault_items WHERE chat_id = 1 AND keyword = 'k'", "uq_vault_items_chat_keyword"),
+    "vault list by type": ("SELECT * FROM vault_items WHERE chat_id = 1 AND item_type = 'excuse'", "ix_vault_items_chat_type"),
+    "vault page": ("SELECT * FROM vault_items WHERE chat_id = 1 AND id > 5 ORDER BY id", "ix_vault_items_chat_id"),
+    "member lookup": ("SELECT * FROM chat_members WHERE chat_id = 1 AND user_id = 2", "uq_chat_members_chat_user"),
+    "roasts by chat": ("SELECT * FROM roasts WHERE chat_id = 1 ORDER BY id", "ix_roasts_chat_id"),
+    "expired sessions": ("SELECT * FROM sessions WHERE expires_at < CURRENT_TIMESTAMP", "ix_sessions_expires_at"),
+    "series by chat + time": ("SELECT * FROM match_series WHERE chat_id = 1 AND timestamp >= CURRENT_TIMESTAMP", "ix_match_series_chat_ts"),
+    "series as player A": ("SELECT * FROM match_series WHERE chat_id = 1 AND player_a_id = 2", "ix_match_series_chat_a"),
+    "series as player B": ("SELECT * FROM match_series WHERE chat_id = 1 AND player_b_id = 2", "ix_match_series_chat_b"),
+    "monthly leaderboard": ("SELECT * FROM player_month_stats WHERE chat_id = 1 AND month = '2024-01'", "ix_player_month_stats_chat_month"),
+}
+
+def check_indexes():
+    """Returns [(label, expected_index, used, plan)] for every hot query."""
+    results = []
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            # Tiny tables would otherwise be seq-scanned no matter what exists
+            conn.execute(text("SET enable_seqscan = off"))
+        for label, (sql, index) in HOT_QUERIES.items():
+            if postgres:
+                plan = "\n".join(row[0] for row in conn.execute(text("EXPLAIN " + sql)))
+            else:
+                plan = "\n".join(row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql)))
+            results.append((label, index, index in plan, plan))
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from database import init_db
+    init_db()
+    if "--check" in sys.argv:
+        failed = 0
+        for label, index, used, plan in check_indexes():
+            failed += not used
+            print(f"{'OK  ' if used else 'MISS'} {label:<24} {index}")
+            if not used:
+                print("     " + plan.replace("\n", "\n     "))
+        sys.exit(1 if failed else 0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, BigInteger, Boolean, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, BigInteger, Boolean, DateTime, Text, ForeignKey, JSON, Index
 from sqlalchemy.sql import func
 from database import Base
 
@@ -23,6 +23,7 @@ class ChatMember(Base):
     user_id = Column(BigInteger, ForeignKey("users.user_id"))
     is_excluded = Column(Boolean, default=False)
     last_active = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (Index("uq_chat_members_chat_user", "chat_id", "user_id", unique=True),)
 
 class VaultItem(Base):
     __tablename__ = "vault_items"
@@ -32,12 +33,18 @@ class VaultItem(Base):
     item_type = Column(String) 
     content = Column(String) 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        Index("uq_vault_items_chat_keyword", "chat_id", "keyword", unique=True),
+        Index("ix_vault_items_chat_type", "chat_id", "item_type"),
+        Index("ix_vault_items_chat_id", "chat_id", "id"), # keyset pages
+    )
 
 class RoastLine(Base):
     __tablename__ = "roasts"
     id = Column(Integer, primary_key=True, index=True)
     chat_id = Column(BigInteger, ForeignKey("chats.chat_id"))
     text = Column(Text)
+    __table_args__ = (Index("ix_roasts_chat_id", "chat_id", "id"),)
 
 class GameSession(Base):
     __tablename__ = "sessions"
@@ -48,8 +55,10 @@ class GameSession(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     expires_at = Column(DateTime(timezone=True))
     state_data = Column(JSON) 
+    __table_args__ = (Index("ix_sessions_expires_at", "expires_at"),)
 
 class MatchStat(Base):
+    # Legacy: one row per game. Migrated into match_series at startup, no longer written.
     __tablename__ = "match_stats"
     id = Column(Integer, primary_key=True, index=True)
     chat_id = Column(BigInteger, ForeignKey("chats.chat_id"))
@@ -60,8 +69,45 @@ class MatchStat(Base):
     is_draw = Column(Boolean, default=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
+class MatchSeries(Base):
+    # One row per submitted stats session (N games between A and B)
+    __tablename__ = "match_series"
+    id = Column(Integer, primary_key=True, index=True)
+    chat_id = Column(BigInteger, ForeignKey("chats.chat_id"))
+    player_a_id = Column(BigInteger, ForeignKey("users.user_id"))
+    player_b_id = Column(BigInteger, ForeignKey("users.user_id"))
+    played = Column(Integer, nullable=False)
+    wins_a = Column(Integer, nullable=False)
+    wins_b = Column(Integer, nullable=False)
+    draws = Column(Integer, nullable=False)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        Index("ix_match_series_chat_ts", "chat_id", "timestamp"),
+        Index("ix_match_series_chat_a", "chat_id", "player_a_id"),
+        Index("ix_match_series_chat_b", "chat_id", "player_b_id"),
+    )
+
 # NEW TABLE
 class BotSetting(Base):
     __tablename__ = "bot_settings"
     key = Column(String, primary_key=True)
     value = Column(Text)
+
+class PersistedState(Base):
+    # PTB persistence: one JSON document per chat_data entry or conversation key
+    __tablename__ = "persisted_state"
+    kind = Column(String, primary_key=True) # "chat" or "conv:<handler name>"
+    key = Column(String, primary_key=True)  # chat id, or the conversation key as a JSON list
+    data = Column(Text)
+
+class PlayerMonthStat(Base):
+    # Rollup of match_series per chat, player and calendar month (UTC).
+    # Kept in step with every results insert; rebuild with /statsrebuild.
+    __tablename__ = "player_month_stats"
+    chat_id = Column(BigInteger, ForeignKey("chats.chat_id"), primary_key=True)
+    user_id = Column(BigInteger, ForeignKey("users.user_id"), primary_key=True)
+    month = Column(String(7), primary_key=True) # "YYYY-MM"
+    wins = Column(Integer, default=0, nullable=False)
+    draws = Column(Integer, default=0, nullable=False)
+    total = Column(Integer, default=0, nullable=False)
+    __table_args__ = (Index("ix_player_month_stats_chat_month", "chat_id", "month"),)
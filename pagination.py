@@ -0,0 +1,97 @@
+"""
+Keyset-paginated list messages with Prev/Next buttons.
+
+A list is registered once with a fetch unit of work and a line renderer:
+
+    paged_list("st", fetch=_sticker_page, line=lambda row, n: f"• {row[1]}",
+               title="🖼 <b>Stickers:</b>", empty="No saved stickers.", parse_mode="HTML")
+
+fetch(db, chat_id, after, before, size) returns keyset_page(...) over rows whose first
+element is the indexed, unique sort key. Buttons carry only that key and the running
+row number, so turning a page reads one page and never counts or offsets.
+"""
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from database import run_db
+from callbacks import register, encode
+
+PAGE_SIZE = 20
+
+_lists = {} # kind -> PagedList
+
+
+class PagedList:
+    def __init__(self, kind, fetch, line, title, empty, parse_mode=None, allowed=None):
+        self.kind = kind
+        self.fetch = fetch
+        self.line = line
+        self.title = title
+        self.empty = empty
+        self.parse_mode = parse_mode
+        self.allowed = allowed # optional predicate(update) for admin-only lists
+
+
+def paged_list(kind, fetch, line, title, empty, parse_mode=None, allowed=None):
+    _lists[kind] = PagedList(kind, fetch, line, title, empty, parse_mode, allowed)
+
+
+def keyset_page(query, key, after=None, before=None, size=PAGE_SIZE):
+    """
+    One page of `query` ordered by `key`, seeking past a cursor instead of OFFSET.
+    Returns (rows, has_prev, has_next).
+    """
+    if before is not None:
+        rows = query.filter(key < before).order_by(key.desc()).limit(size + 1).all()
+        return rows[:size][::-1], len(rows) > size, True
+    if after is not None:
+        query = query.filter(key > after)
+    rows = query.order_by(key).limit(size + 1).all()
+    return rows[:size], after is not None, len(rows) > size
+
+
+def _render(paged, rows, has_prev, has_next, start):
+    text = paged.title + "\n" + "\n".join(paged.line(row, n) for n, row in enumerate(rows, start))
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("◀️ Prev", callback_data=encode("pg", paged.kind, "p", rows[0][0], start)))
+    if has_next:
+        nav.append(InlineKeyboardButton("Next ▶️", callback_data=encode("pg", paged.kind, "n", rows[-1][0], start + len(rows))))
+    return text, InlineKeyboardMarkup([nav]) if nav else None
+
+
+async def send_first_page(update, kind):
+    paged = _lists[kind]
+    rows, has_prev, has_next = await run_db(paged.fetch, update.effective_chat.id, None, None, PAGE_SIZE)
+    if not rows:
+        await update.message.reply_text(paged.empty)
+        return
+    text, markup = _render(paged, rows, has_prev, has_next, 1)
+    await update.message.reply_text(text, parse_mode=paged.parse_mode, reply_markup=markup)
+
+
+@register("pg", str, str, int, int)
+async def turn_page(update, context, kind, direction, cursor, start):
+    """start is the row number of the first row on the page being left (or about to be shown, for Next)."""
+    query = update.callback_query
+    paged = _lists.get(kind)
+    await query.answer()
+    if paged is None or (paged.allowed and not paged.allowed(update)):
+        return
+
+    chat_id = update.effective_chat.id
+    if direction == "p":
+        rows, has_prev, has_next = await run_db(paged.fetch, chat_id, None, cursor, PAGE_SIZE)
+        start = max(1, start - len(rows))
+    else:
+        rows, has_prev, has_next = await run_db(paged.fetch, chat_id, cursor, None, PAGE_SIZE)
+
+    if not rows:
+        # Everything on that side was deleted meanwhile: start over
+        rows, has_prev, has_next = await run_db(paged.fetch, chat_id, None, None, PAGE_SIZE)
+        start = 1
+        if not rows:
+            await query.message.edit_text(paged.empty)
+            return
+    if not has_prev:
+        start = 1
+    text, markup = _render(paged, rows, has_prev, has_next, start)
+    await query.message.edit_text(text, parse_mode=paged.parse_mode, reply_markup=markup)
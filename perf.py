@@ -0,0 +1,168 @@
+"""
+In-memory performance tracing.
+
+Every PTB handler callback runs inside an UpdateTrace. SQLAlchemy engine events and
+the Telegram request layer add their cost to the trace that is current in their context
+(run_db copies the context into its worker threads). Finished traces feed rolling
+per-handler windows that /perf summarises.
+"""
+import functools
+import threading
+import time
+from collections import deque, defaultdict
+from contextvars import ContextVar
+from sqlalchemy import event
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+WINDOW = 500        # samples kept per handler
+RECENT = 1000       # finished updates kept for the "slowest" list
+BACKGROUND = "(background)" # DB/API work outside any handler: jobs, flushes
+
+_current = ContextVar("perf_trace", default=None)
+_lock = threading.Lock()
+
+
+class UpdateTrace:
+    __slots__ = ("handler", "started", "wall_ms", "sql", "db_ms", "api_calls", "api_ms")
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.started = time.time()
+        self.wall_ms = 0.0
+        self.sql = 0
+        self.db_ms = 0.0
+        self.api_calls = 0
+        self.api_ms = 0.0
+
+
+class Window:
+    """Rolling window of the last WINDOW samples of each metric for one handler."""
+
+    def __init__(self):
+        self.count = 0
+        self.samples = {k: deque(maxlen=WINDOW) for k in ("wall_ms", "sql", "db_ms", "api_ms")}
+
+    def add(self, trace):
+        self.count += 1
+        for key, values in self.samples.items():
+            values.append(getattr(trace, key))
+
+    def percentile(self, key, pct):
+        values = sorted(self.samples[key])
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+windows = defaultdict(Window) # handler name -> Window
+recent = deque(maxlen=RECENT)
+background = UpdateTrace(BACKGROUND)
+
+
+def _finish(trace):
+    with _lock:
+        windows[trace.handler].add(trace)
+        recent.append(trace)
+
+
+def _active():
+    return _current.get() or background
+
+
+# --- Handlers ---
+def traced(name, callback):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        trace = UpdateTrace(name)
+        token = _current.set(trace)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            trace.wall_ms = (time.perf_counter() - start) * 1000
+            _current.reset(token)
+            _finish(trace)
+    return wrapper
+
+
+def rename(name):
+    """Relabels the current trace, e.g. with the function a router dispatched to."""
+    trace = _current.get()
+    if trace is not None:
+        trace.handler = name
+
+
+def instrument_handlers(app):
+    """Wraps the callback of every registered handler (call after all add_handler calls)."""
+    def wrap(handler):
+        if isinstance(handler, ConversationHandler):
+            for h in handler.entry_points + handler.fallbacks:
+                wrap(h)
+            for state_handlers in handler.states.values():
+                for h in state_handlers:
+                    wrap(h)
+        elif getattr(handler, "callback", None):
+            handler.callback = traced(handler.callback.__name__, handler.callback)
+
+    for group in app.handlers.values():
+        for handler in group:
+            wrap(handler)
+
+
+# --- Database ---
+def _charge(context):
+    # The start time lives on the statement's own execution context, so a statement
+    # that fails can't leave anything behind to mis-time the next one
+    started = getattr(context, "perf_start", None)
+    if started is None:
+        return
+    context.perf_start = None
+    trace = _active()
+    trace.sql += 1
+    trace.db_ms += (time.perf_counter() - started) * 1000
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context.perf_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        _charge(context)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        # Failed statements cost time too
+        _charge(exception_context.execution_context)
+
+
+# --- Telegram API ---
+class TracedRequest(HTTPXRequest):
+    """HTTPXRequest that charges each Bot API round trip to the current trace."""
+
+    async def do_request(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().do_request(*args, **kwargs)
+        finally:
+            trace = _active()
+            trace.api_calls += 1
+            trace.api_ms += (time.perf_counter() - start) * 1000
+
+
+# --- Reporting ---
+def summary():
+    with _lock:
+        rows = []
+        for name, w in windows.items():
+            rows.append({
+                "handler": name, "count": w.count,
+                "p50": w.percentile("wall_ms", 0.5), "p95": w.percentile("wall_ms", 0.95),
+                "sql_p95": w.percentile("sql", 0.95), "db_p95": w.percentile("db_ms", 0.95),
+                "api_p95": w.percentile("api_ms", 0.95),
+            })
+        slowest = sorted(recent, key=lambda t: t.wall_ms, reverse=True)[:10]
+    rows.sort(key=lambda r: r["p95"], reverse=True)
+    return rows, slowest
@@ -0,0 +1,170 @@
+"""
+PTB persistence in the bot's own database.
+
+Only chat_data and persistent ConversationHandler states are kept (the bot uses
+neither user_data nor bot_data). Each chat and each conversation key is its own
+row holding a JSON document, so a run of update_persistence writes just the keys
+whose JSON actually changed, in one transaction, instead of re-pickling everything.
+PTB hands over every chat that saw an update; most of them haven't changed.
+"""
+import asyncio
+import json
+import logging
+from sqlalchemy import delete, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from telegram.ext import BasePersistence, PersistenceInput
+from database import run_db, dialect_insert
+from models import PersistedState
+
+logger = logging.getLogger(__name__)
+
+UPDATE_INTERVAL = 5 # seconds between PTB's update_persistence runs
+
+CHAT = "chat"
+DELETED = None # pending value for a row to remove
+
+
+def _conv_kind(name):
+    return "conv:" + name
+
+
+class DBPersistence(BasePersistence):
+
+    def __init__(self, update_interval=UPDATE_INTERVAL, owns=None):
+        """owns(chat_id) limits loading to one shard's chats."""
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.written = {} # (kind, key) -> JSON last known to be in the table
+        self.dirty = {}   # (kind, key) -> JSON to write, or DELETED
+        self.owns = owns
+        self._writer = None
+        self.stats = {"updates": 0, "unchanged": 0, "flushes": 0, "rows_written": 0, "errors": 0}
+
+    # --- Loading (once, in Application.initialize) ---
+    async def _load(self, kind, parse_key, chat_of):
+        loaded = {}
+        for key, data in await run_db(_rows, kind):
+            parsed = parse_key(key)
+            if self.owns is None or self.owns(chat_of(parsed)):
+                self.written[(kind, key)] = data
+                loaded[parsed] = json.loads(data)
+        return loaded
+
+    async def get_chat_data(self):
+        return await self._load(CHAT, int, lambda chat_id: chat_id)
+
+    async def get_conversations(self, name):
+        # Conversation keys start with the chat id (per_chat is the default)
+        return await self._load(_conv_kind(name), lambda key: tuple(json.loads(key)), lambda key: key[0])
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # --- Changes ---
+    def _mark(self, kind, key, value):
+        self.stats["updates"] += 1
+        if value is DELETED:
+            data = DELETED
+        else:
+            try:
+                data = json.dumps(value, sort_keys=True)
+            except (TypeError, ValueError) as e:
+                logger.error("Can't persist %s %s: %s", kind, key, e)
+                return
+        if data == self.written.get((kind, key), DELETED) and (kind, key) not in self.dirty:
+            self.stats["unchanged"] += 1
+            return
+        self.dirty[(kind, key)] = data
+        if self._writer is None or self._writer.done():
+            # PTB gathers one update_* call per key; write them all once the batch is in
+            self._writer = asyncio.get_running_loop().create_task(self._write_soon())
+
+    async def update_chat_data(self, chat_id, data):
+        self._mark(CHAT, str(chat_id), data or DELETED)
+
+    async def drop_chat_data(self, chat_id):
+        self._mark(CHAT, str(chat_id), DELETED)
+
+    async def update_conversation(self, name, key, new_state):
+        self._mark(_conv_kind(name), json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # --- Durable writes ---
+    async def _write_soon(self):
+        await asyncio.sleep(0)
+        await self.write()
+
+    async def write(self):
+        if not self.dirty:
+            return 0
+        dirty, self.dirty = self.dirty, {}
+        try:
+            await run_db(_write, dirty)
+        except SQLAlchemyError as e:
+            logger.error("Persistence write failed: %s", e)
+            self.stats["errors"] += 1
+            # Newer changes made meanwhile win over the failed batch
+            for key, data in dirty.items():
+                self.dirty.setdefault(key, data)
+            return 0
+        for key, data in dirty.items():
+            if data is DELETED:
+                self.written.pop(key, None)
+            else:
+                self.written[key] = data
+        self.stats["flushes"] += 1
+        self.stats["rows_written"] += len(dirty)
+        return len(dirty)
+
+    async def flush(self):
+        if self._writer is not None and not self._writer.done():
+            await self._writer
+        await self.write()
+
+
+def _rows(db, kind):
+    return db.query(PersistedState.key, PersistedState.data).filter_by(kind=kind).all()
+
+
+def _write(db, dirty):
+    removed = [key for key, data in dirty.items() if data is DELETED]
+    rows = [{"kind": kind, "key": key, "data": data} for (kind, key), data in dirty.items() if data is not DELETED]
+    if removed:
+        db.execute(delete(PersistedState).where(tuple_(PersistedState.kind, PersistedState.key).in_(removed)))
+    if rows:
+        upsert = dialect_insert(db)
+        if upsert is None:
+            for row in rows:
+                db.merge(PersistedState(**row))
+        else:
+            stmt = upsert(PersistedState)
+            db.execute(stmt.on_conflict_do_update(index_elements=["kind", "key"], set_={"data": stmt.excluded.data}), rows)
+    db.commit()
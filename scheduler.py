@@ -0,0 +1,233 @@
+"""
+Outbound Bot API scheduler, plugged into the Application as its rate limiter.
+
+Every request waits for a token from the global bucket; new messages also wait for
+one from their chat's bucket.
+When requests queue up, a single dispatcher hands out tokens by priority class, so
+interactive edits and callback answers go before /all pings and cleanup deletes.
+A chat that is out of tokens never blocks requests for other chats.
+
+Handlers pick a class for a block of calls with `with priority(BULK): ...`; otherwise
+the class is derived from the API endpoint.
+"""
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from update_processor import slot_released
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lowest value goes first
+INTERACTIVE, NORMAL, BULK, CLEANUP = range(4)
+PRIORITY_NAMES = ("interactive", "normal", "bulk", "cleanup")
+
+GLOBAL_RATE = 30        # requests/s across all chats (Bot API broadcast limit)
+PRIVATE_RATE = 1        # requests/s in one private chat
+GROUP_RATE = 20 / 60    # requests/s in one group
+CHAT_BURST = 5          # tokens a quiet chat can spend at once
+MAX_RETRIES = 3
+MAX_IDLE_BUCKETS = 10000
+
+_priority = ContextVar("outbound_priority", default=None)
+
+
+@contextlib.contextmanager
+def priority(level):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def counts_against_chat(endpoint):
+    """Telegram's per-chat limits (1/s private, 20/min in a group) are on new messages;
+    edits, deletes and callback answers only take a global token."""
+    if endpoint == "sendChatAction":
+        return False
+    return endpoint.startswith(("send", "copyMessage", "forwardMessage"))
+
+
+def endpoint_priority(endpoint):
+    if endpoint == "answerCallbackQuery" or endpoint.startswith("editMessage"):
+        return INTERACTIVE
+    if endpoint == "deleteMessage":
+        return CLEANUP
+    return NORMAL
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def ready_at(self, now):
+        """Earliest monotonic time at which a token can be taken."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.paused_until > now:
+            return self.paused_until
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, until):
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0
+
+    def is_idle(self, now):
+        return self.ready_at(now) == now and self.tokens >= self.burst
+
+
+class OutboundScheduler(BaseRateLimiter):
+
+    def __init__(self, global_rate=GLOBAL_RATE, private_rate=PRIVATE_RATE, group_rate=GROUP_RATE,
+                 chat_burst=CHAT_BURST, max_retries=MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.chats = {} # chat_id -> TokenBucket
+        self._queue = [] # heap of (priority, seq, chat_id, future, enqueued)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+        self.stats = {
+            "sent": [0] * len(PRIORITY_NAMES), "max_depth": 0,
+            "wait_ms_total": 0.0, "max_wait_ms": 0.0, "retry_after": 0, "dropped": 0,
+        }
+
+    async def initialize(self):
+        # ExtBot.initialize calls this on every initialize (the Application's and the Updater's)
+        if self._dispatcher is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._dispatcher
+            self._dispatcher = None
+        for *_, future, _ in self._queue:
+            future.cancel()
+        self._queue.clear()
+
+    # --- Buckets ---
+    def _chat_bucket(self, chat_id):
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) >= MAX_IDLE_BUCKETS:
+                now = time.monotonic()
+                self.chats = {k: b for k, b in self.chats.items() if not b.is_idle(now)}
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            bucket = self.chats[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    # --- Queue ---
+    def depth(self):
+        counts = [0] * len(PRIORITY_NAMES)
+        for level, *_ in self._queue:
+            counts[level] += 1
+        return counts
+
+    async def _acquire(self, level, chat_id):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (level, next(self._seq), chat_id, future, time.monotonic()))
+        self.stats["max_depth"] = max(self.stats["max_depth"], len(self._queue))
+        self._wakeup.set()
+        # The handler's worker slot goes to other chats while this request waits its turn
+        async with slot_released():
+            await future
+
+    async def _dispatch(self):
+        while True:
+            delay = None
+            now = time.monotonic()
+            if self._queue:
+                global_ready = self.global_bucket.ready_at(now)
+                if global_ready > now:
+                    delay = global_ready - now
+                else:
+                    delay = self._release_next(now)
+            try:
+                if delay == 0:
+                    continue
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _release_next(self, now):
+        """Releases the first queued request whose chat has a token. Returns the wait until
+        something becomes sendable (0 if a request was released)."""
+        soonest = None
+        for entry in sorted(self._queue):
+            level, _, chat_id, future, enqueued = entry
+            if future.cancelled():
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self.stats["dropped"] += 1
+                return 0
+            if chat_id is not None:
+                ready = self._chat_bucket(chat_id).ready_at(now)
+                if ready > now:
+                    soonest = ready if soonest is None else min(soonest, ready)
+                    continue
+                self._chat_bucket(chat_id).take()
+            self.global_bucket.take()
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+
+            waited = (now - enqueued) * 1000
+            self.stats["sent"][level] += 1
+            self.stats["wait_ms_total"] += waited
+            self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], waited)
+            future.set_result(None)
+            return 0
+        return soonest - now
+
+    # --- BaseRateLimiter ---
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        level = _priority.get()
+        if level is None:
+            level = endpoint_priority(endpoint)
+        chat_id = data.get("chat_id")
+        if not isinstance(chat_id, int):
+            chat_id = None # answerCallbackQuery, getMe, @channel usernames
+        metered = chat_id if counts_against_chat(endpoint) else None
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(level, metered)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                if attempt == self.max_retries:
+                    raise
+                self.stats["retry_after"] += 1
+                logger.warning("RetryAfter %ss on %s (chat %s), backing off", exc.retry_after, endpoint, chat_id)
+                until = time.monotonic() + exc.retry_after + 0.1
+                if chat_id is None:
+                    self.global_bucket.pause(until)
+                    continue
+                self._chat_bucket(chat_id).pause(until)
+                if metered is None:
+                    # Edits and deletes don't wait on the chat bucket: sit the pause out here
+                    async with slot_released():
+                        await asyncio.sleep(until - time.monotonic())
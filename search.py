@@ -0,0 +1,119 @@
+"""
+In-memory keyword search for one chat's vault.
+
+Keywords are found by exact match, prefix (bisect over the sorted keyword list)
+and trigram similarity (pg_trgm style padding, so typos and partial words still
+match). Excuse text is searchable word by word. Indexes are small enough to keep
+one per active chat and are patched in place on save/delete.
+"""
+import bisect
+import heapq
+import math
+import re
+from collections import defaultdict, Counter
+
+MIN_SIMILARITY = 0.3 # trigram similarity below this isn't a suggestion
+PREFIX_SCAN = 200    # prefix matches examined per query
+
+_word = re.compile(r"\w+")
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def words(text):
+    return set(_word.findall(text.lower())) if text else set()
+
+
+class KeywordIndex:
+
+    def __init__(self, rows=()):
+        self.items = {}               # keyword -> (item_type, text)
+        self.sorted = []              # keywords in order, for prefix scans
+        self.grams = defaultdict(set) # trigram -> keywords
+        self.keyword_grams = {}       # keyword -> its trigrams
+        self.words = defaultdict(set) # word of excuse text -> keywords
+        for keyword, item_type, text in rows:
+            self.items[keyword] = (item_type, text)
+            self._link(keyword, text)
+        self.sorted = sorted(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _link(self, keyword, text):
+        grams = self.keyword_grams[keyword] = trigrams(keyword)
+        for g in grams:
+            self.grams[g].add(keyword)
+        for w in words(text):
+            self.words[w].add(keyword)
+
+    def add(self, keyword, item_type, text=None):
+        if keyword in self.items:
+            self.remove(keyword)
+        self.items[keyword] = (item_type, text)
+        self._link(keyword, text)
+        bisect.insort(self.sorted, keyword)
+
+    def remove(self, keyword):
+        entry = self.items.pop(keyword, None)
+        if entry is None:
+            return
+        for g in self.keyword_grams.pop(keyword):
+            self.grams[g].discard(keyword)
+        for w in words(entry[1]):
+            self.words[w].discard(keyword)
+        i = bisect.bisect_left(self.sorted, keyword)
+        if i < len(self.sorted) and self.sorted[i] == keyword:
+            del self.sorted[i]
+
+    def search(self, query, limit=10):
+        """Returns [(keyword, item_type, text)] best first."""
+        query = query.lower().strip()
+        if not query:
+            return []
+        scores = {}
+
+        def score(keyword, value):
+            if value > scores.get(keyword, 0):
+                scores[keyword] = value
+
+        if query in self.items:
+            score(query, 3.0)
+
+        # Prefix: shorter completions rank higher
+        start = bisect.bisect_left(self.sorted, query)
+        for keyword in self.sorted[start:start + PREFIX_SCAN]:
+            if not keyword.startswith(query):
+                break
+            score(keyword, 2.0 + len(query) / len(keyword))
+
+        # Trigram similarity (shared / union). A keyword can only reach MIN_SIMILARITY by
+        # sharing `need` of the query's trigrams, so it must appear in at least one of the
+        # len - need + 1 rarest: only those posting lists are read.
+        q_grams = trigrams(query)
+        need = max(1, math.ceil(MIN_SIMILARITY * len(q_grams)))
+        rarest = sorted(q_grams, key=lambda g: len(self.grams.get(g, ())))[:len(q_grams) - need + 1]
+        candidates = set()
+        for g in rarest:
+            candidates.update(self.grams.get(g, ()))
+        for keyword in candidates:
+            k_grams = self.keyword_grams[keyword]
+            n = len(q_grams & k_grams)
+            similarity = n / (len(q_grams) + len(k_grams) - n)
+            if similarity >= MIN_SIMILARITY:
+                score(keyword, 1.0 + similarity)
+
+        # Excuse text: fraction of the query's words it contains
+        q_words = words(query)
+        if q_words:
+            hits = Counter()
+            for w in q_words:
+                hits.update(self.words.get(w, ()))
+            for keyword, n in hits.items():
+                score(keyword, 0.5 * n / len(q_words))
+
+        best = heapq.nsmallest(limit, scores, key=lambda k: (-scores[k], k))
+        return [(k,) + self.items[k] for k in best]
@@ -0,0 +1,160 @@
+import copy
+import heapq
+import logging
+from datetime import timezone
+from sqlalchemy import update, delete, bindparam
+from sqlalchemy.exc import SQLAlchemyError
+from database import run_db, SessionLocal
+from models import GameSession
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 2 # seconds between durable writes of changed session state
+
+
+class SessionStore:
+    """
+    In-memory copy of every GameSession row, keyed by message_id.
+
+    Reads never touch the database. Creates and deletes are written through
+    immediately; state changes from button presses are coalesced per session
+    and written as one batch on a short timer (and on shutdown).
+    """
+
+    def __init__(self):
+        self.sessions = {} # message_id -> dict(chat_id, session_type, initiator_id, expires_at, state_data)
+        self.dirty = set() # message_ids whose state_data isn't durable yet
+        self.expiry = []   # min-heap of (expires_at, message_id); deleted sessions are skipped lazily
+        self.stats = {"reads": 0, "writes": 0, "flushes": 0, "rows_flushed": 0, "errors": 0}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    # --- Startup ---
+    def load(self, owns=None):
+        """Rebuilds the store from the sessions table. owns(chat_id) limits it to one shard's chats."""
+        with SessionLocal() as db:
+            rows = db.query(GameSession).all()
+            self.sessions = {s.message_id: _entry(s) for s in rows if owns is None or owns(s.chat_id)}
+        self.dirty.clear()
+        self.expiry = [(e["expires_at"], mid) for mid, e in self.sessions.items()]
+        heapq.heapify(self.expiry)
+        logger.info("Loaded %d game sessions", len(self.sessions))
+
+    # --- Reads ---
+    def get(self, message_id):
+        """Returns a private copy that the caller may mutate, or None."""
+        entry = self.sessions.get(message_id)
+        self.stats["reads"] += 1
+        if entry is None:
+            return None
+        return {**entry, "state_data": copy.deepcopy(entry["state_data"])}
+
+    def due(self, now):
+        """Pops sessions that expired by `now` off the heap. Returns [(chat_id, message_id)]."""
+        due = []
+        while self.expiry and self.expiry[0][0] <= now:
+            expires_at, mid = heapq.heappop(self.expiry)
+            entry = self.sessions.get(mid)
+            if entry is not None and entry["expires_at"] == expires_at:
+                due.append((entry["chat_id"], mid))
+        return due
+
+    # --- Writes ---
+    async def create(self, message_id, chat_id, session_type, initiator_id, expires_at, state_data):
+        await run_db(_insert, message_id, chat_id, session_type, initiator_id, expires_at, state_data)
+        self.sessions[message_id] = {
+            "chat_id": chat_id, "session_type": session_type, "initiator_id": initiator_id,
+            "expires_at": expires_at, "state_data": copy.deepcopy(state_data),
+        }
+        heapq.heappush(self.expiry, (expires_at, message_id))
+
+    def update(self, message_id, state_data):
+        entry = self.sessions.get(message_id)
+        if entry is None:
+            return
+        entry["state_data"] = copy.deepcopy(state_data)
+        self.dirty.add(message_id)
+        self.stats["writes"] += 1
+
+    async def delete(self, message_ids):
+        message_ids = list(message_ids)
+        self.discard(message_ids)
+        await run_db(_delete, message_ids)
+
+    def discard(self, message_ids):
+        """Drops sessions from memory only (rows already deleted in the DB)."""
+        for mid in message_ids:
+            self.sessions.pop(mid, None)
+            self.dirty.discard(mid)
+
+    def discard_chat(self, chat_id):
+        self.discard([mid for mid, e in self.sessions.items() if e["chat_id"] == chat_id])
+
+    # --- Durable writes ---
+    async def flush(self):
+        if not self.dirty:
+            return 0
+        dirty, self.dirty = self.dirty, set()
+        rows = [
+            {"message_id": mid, "state_data": copy.deepcopy(self.sessions[mid]["state_data"])}
+            for mid in dirty if mid in self.sessions
+        ]
+        if not rows:
+            return 0
+
+        try:
+            await run_db(_write_states, rows)
+        except SQLAlchemyError as e:
+            logger.error("Session flush failed: %s", e)
+            self.stats["errors"] += 1
+            # Still-live sessions are retried next time, with whatever state is newest by then
+            self.dirty |= {row["message_id"] for row in rows if row["message_id"] in self.sessions}
+            return 0
+
+        self.stats["flushes"] += 1
+        self.stats["rows_flushed"] += len(rows)
+        return len(rows)
+
+
+def _entry(session):
+    expires_at = session.expires_at
+    if expires_at.tzinfo is None: # SQLite drops the timezone
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return {
+        "chat_id": session.chat_id, "session_type": session.session_type,
+        "initiator_id": session.initiator_id, "expires_at": expires_at,
+        "state_data": dict(session.state_data or {}),
+    }
+
+
+def _insert(db, message_id, chat_id, session_type, initiator_id, expires_at, state_data):
+    db.add(GameSession(
+        message_id=message_id, chat_id=chat_id, session_type=session_type,
+        initiator_id=initiator_id, expires_at=expires_at, state_data=state_data
+    ))
+    db.commit()
+
+
+def _delete(db, message_ids):
+    db.execute(delete(GameSession).where(GameSession.message_id.in_(message_ids)))
+    db.commit()
+
+
+def _write_states(db, rows):
+    # Core UPDATE as one executemany for the whole batch. Unlike the ORM bulk update it
+    # doesn't check rowcounts: a session deleted since the snapshot is simply skipped.
+    stmt = (
+        update(GameSession.__table__)
+        .where(GameSession.message_id == bindparam("b_id"))
+        .values(state_data=bindparam("b_state"))
+    )
+    db.execute(stmt, [{"b_id": row["message_id"], "b_state": row["state_data"]} for row in rows])
+    db.commit()
+
+
+session_store = SessionStore()
+
+
+async def flush_sessions(context):
+    await session_store.flush()
@@ -0,0 +1,211 @@
+"""
+Sharded mode: one front process receives updates and routes each one by chat to
+one of N worker processes.
+
+Every worker runs the full Application: its own caches, its own slice of the
+session store, its own job queue and an outbound scheduler with 1/N of the
+global Bot API budget. A chat always lands on the same worker, in arrival order,
+so everything keyed by chat stays correct without any cross-process state.
+
+The front only reads the chat id out of the raw JSON; parsing into telegram
+objects happens in the workers.
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import secrets
+import signal
+import threading
+import time
+import httpx
+from telegram import Update
+from webhook import WebhookServer, running, stop_on_signals
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://api.telegram.org"
+POLL_TIMEOUT = 30      # getUpdates long-poll seconds
+SHUTDOWN_TIMEOUT = 30  # seconds a worker gets to finish its backlog
+WATCH_INTERVAL = 5     # seconds between checks that every worker is still up
+
+
+def shard_of(chat_id, shards):
+    return chat_id % shards
+
+
+def route_key(data):
+    """The chat an update belongs to; the user for chat-less updates (inline queries, poll answers)."""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return 0
+
+
+# --- Workers ---
+def run_shard(index, shards, inbox, build):
+    # The front decides when to stop and says so through the inbox, after the last update
+    # it routed here. Signals sent to the whole process group are left to it.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    app = build(index, shards)
+    asyncio.run(_serve_shard(app, inbox))
+
+
+async def _serve_shard(app, inbox):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    front = multiprocessing.parent_process()
+
+    def pump():
+        while True:
+            try:
+                data = inbox.get(timeout=1)
+            except queue.Empty:
+                if front.is_alive():
+                    continue
+                logger.warning("Front process is gone, stopping")
+                break
+            if data is None:
+                break
+            loop.call_soon_threadsafe(app.update_queue.put_nowait, Update.de_json(data, app.bot))
+        loop.call_soon_threadsafe(stop.set)
+
+    async with running(app):
+        threading.Thread(target=pump, name="shard-inbox", daemon=True).start()
+        await stop.wait()
+        # Everything the front sent before the stop marker is queued by now; stop() drains it
+
+
+# --- Front ---
+class ShardRouter:
+
+    def __init__(self, shards, build):
+        ctx = multiprocessing.get_context("spawn")
+        self.shards = shards
+        self.inboxes = [ctx.Queue() for _ in range(shards)]
+        self.workers = [
+            ctx.Process(target=run_shard, args=(i, shards, inbox, build), name=f"shard-{i}")
+            for i, inbox in enumerate(self.inboxes)
+        ]
+        self.routed = [0] * shards
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        logger.info("Started %d shards", self.shards)
+
+    def route(self, data):
+        shard = shard_of(route_key(data), self.shards)
+        self.inboxes[shard].put(data)
+        self.routed[shard] += 1
+
+    def alive(self):
+        return sum(worker.is_alive() for worker in self.workers)
+
+    def stop(self, timeout=SHUTDOWN_TIMEOUT):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+            if worker.is_alive():
+                logger.warning("%s did not stop in time, terminating", worker.name)
+                worker.terminate()
+                worker.join()
+
+
+class ShardWebhookServer(WebhookServer):
+
+    def __init__(self, router, path, secret_token):
+        super().__init__(None, path, secret_token)
+        self.router = router
+
+    async def accept(self, data):
+        self.router.route(data)
+
+    def health(self):
+        alive = self.router.alive()
+        return {
+            "ok": alive == self.router.shards, "mode": "sharded webhook",
+            "uptime_s": round(time.time() - self.started),
+            "shards_alive": alive, "routed": self.router.routed, **self.stats,
+        }
+
+
+async def _api(client, token, method, **params):
+    response = await client.post(f"/bot{token}/{method}", json=params)
+    payload = response.json()
+    if not payload.get("ok"):
+        raise RuntimeError(f"{method}: {payload.get('description')}")
+    return payload["result"]
+
+
+async def _poll(router, client, token, position):
+    webhook_cleared = False
+    while True:
+        try:
+            # A failure here must not end the poller: nothing would notice it had gone
+            if not webhook_cleared:
+                await _api(client, token, "deleteWebhook")
+                webhook_cleared = True
+            updates = await _api(client, token, "getUpdates", offset=position["offset"], timeout=POLL_TIMEOUT)
+        except (httpx.HTTPError, RuntimeError, ValueError) as e:
+            logger.warning("%s failed: %s", "getUpdates" if webhook_cleared else "deleteWebhook", e)
+            await asyncio.sleep(1)
+            continue
+        for data in updates:
+            router.route(data)
+            position["offset"] = data["update_id"] + 1
+
+
+async def _watch(router, stop):
+    # A dead worker would silently drop its chats: stop everything and let the platform restart us
+    while not stop.is_set():
+        await asyncio.sleep(WATCH_INTERVAL)
+        if router.alive() < router.shards:
+            logger.error("A shard worker exited, shutting down")
+            stop.set()
+
+
+async def serve_sharded(token, shards, build, webhook=None, api_url=API_URL):
+    """
+    Runs the front until SIGINT/SIGTERM. webhook is (url, listen, port, path, secret_token)
+    for webhook mode, None for polling. build(index, shards) returns a worker's Application.
+    """
+    router = ShardRouter(shards, build)
+    router.start()
+    stop = stop_on_signals()
+    watcher = asyncio.create_task(_watch(router, stop))
+    async with httpx.AsyncClient(base_url=api_url, timeout=POLL_TIMEOUT + 10) as client:
+        try:
+            if webhook:
+                url, listen, port, path, secret_token = webhook
+                secret_token = secret_token or secrets.token_urlsafe(32)
+                server = ShardWebhookServer(router, path, secret_token)
+                await server.start(listen, port)
+                await _api(client, token, "setWebhook", url=url.rstrip("/") + server.path, secret_token=secret_token)
+                await stop.wait()
+                await server.stop()
+            else:
+                position = {"offset": 0}
+                poller = asyncio.create_task(_poll(router, client, token, position))
+                await stop.wait()
+                poller.cancel()
+                if position["offset"]:
+                    # Confirm what was routed so Telegram doesn't send it again after a restart
+                    await _api(client, token, "getUpdates", offset=position["offset"], timeout=0)
+        finally:
+            watcher.cancel()
+            # Blocks while workers finish their backlog; nothing else runs here any more
+            router.stop()
+
+
+def run_sharded(token, shards, build, webhook=None, api_url=API_URL):
+    asyncio.run(serve_sharded(token, shards, build, webhook, api_url))
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The bot reads its settings at import time: point it at a scratch database first
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="marceline-test-"), "test.db")
+os.environ.setdefault("BOT_TOKEN", "0:test")
@@ -0,0 +1,62 @@
+import asyncio
+
+from cache import TTLCache, Generations
+
+
+def make_cache(name, maxsize=64, scopes=16):
+    return TTLCache(name, maxsize=maxsize, generations=Generations(maxsize=scopes))
+
+
+def test_fetch_loads_once_until_invalidated():
+    cache = make_cache("test_fetch")
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return len(loads)
+
+    async def go():
+        assert await cache.fetch(7, load) == 1
+        assert await cache.fetch(7, load) == 1
+        cache.invalidate(7)
+        assert await cache.fetch(7, load) == 2
+
+    asyncio.run(go())
+    assert len(loads) == 2
+
+
+def test_write_during_load_is_not_cached():
+    cache = make_cache("test_race")
+
+    async def load():
+        cache.invalidate(7) # a save commits while this load is in flight
+        return "stale"
+
+    async def fresh():
+        return "fresh"
+
+    async def go():
+        assert await cache.fetch(7, load) == "stale"
+        assert await cache.fetch(7, fresh) == "fresh"
+
+    asyncio.run(go())
+
+
+def test_scope_covers_many_keys():
+    cache = make_cache("test_scope")
+
+    async def go():
+        await cache.fetch((7, "lb"), lambda: asyncio.sleep(0, "old"), scope=7)
+        cache.invalidate(7)
+        return await cache.fetch((7, "lb"), lambda: asyncio.sleep(0, "new"), scope=7)
+
+    assert asyncio.run(go()) == "new"
+
+
+def test_evicted_scope_never_reads_as_an_old_generation():
+    gens = Generations(maxsize=2)
+    before = gens.current("a")
+    gens.bump("a")
+    gens.bump("b")
+    gens.bump("c") # drops "a"
+    assert gens.current("a") != before
@@ -0,0 +1,56 @@
+"""
+/play and /setsquad in a group whose activity hasn't been flushed yet.
+"""
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from telegram import Chat as TgChat, Message, Update, User as TgUser
+
+from activity import activity_buffer
+from database import init_db, run_db, SessionLocal
+from identity import chat_cache
+from models import Chat
+from features.general import track_activity
+from features.session import _chat_settings, _save_squad, DEFAULT_SESSION_TTL
+
+
+def group_message(chat_id, user_id, text="gg"):
+    chat = TgChat(chat_id, "supergroup", title="New Group")
+    user = TgUser(user_id, f"Player {user_id}", False)
+    return Update(1, message=Message(1, datetime.now(), chat, from_user=user, text=text))
+
+
+def context():
+    return SimpleNamespace(application=SimpleNamespace(create_task=asyncio.ensure_future))
+
+
+def test_first_message_writes_the_chat_before_any_flush():
+    init_db()
+
+    async def go():
+        await track_activity(group_message(-700001, 1), context())
+        assert len(activity_buffer) >= 1 # the member is still buffered...
+        return await run_db(_chat_settings, -700001)
+
+    assert asyncio.run(go()) == (DEFAULT_SESSION_TTL, None) # ...but the chat row is there
+    with SessionLocal() as db:
+        assert db.query(Chat).filter_by(chat_id=-700001).one().title == "New Group"
+
+
+def test_settings_for_a_chat_with_no_row():
+    init_db()
+    chat_cache.clear()
+    assert asyncio.run(run_db(_chat_settings, -700002)) == (DEFAULT_SESSION_TTL, None)
+
+
+def test_setsquad_creates_the_chat_row():
+    init_db()
+
+    async def go():
+        await run_db(_save_squad, -700003, {1, 2})
+        return await run_db(_chat_settings, -700003)
+
+    ttl, squad = asyncio.run(go())
+    assert ttl == DEFAULT_SESSION_TTL
+    assert sorted(squad) == [1, 2]
@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import perf
+
+
+def test_failed_statements_are_timed_and_leave_nothing_behind():
+    engine = create_engine("sqlite://")
+    perf.instrument_engine(engine)
+    trace = perf.UpdateTrace("test")
+    token = perf._current.set(trace)
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing_table"))
+            conn.execute(text("SELECT 1"))
+            assert "perf_start" not in conn.info
+    finally:
+        perf._current.reset(token)
+    assert trace.sql == 2
+    assert 0 <= trace.db_ms < 1000
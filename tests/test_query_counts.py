@@ -0,0 +1,94 @@
+"""
+Statement counts for the hot renders: a fixed number of queries however many
+people are involved, and fewer once the identity caches are warm.
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, insert
+
+from cache import registry
+from database import engine, init_db, SessionLocal
+from models import Chat, User, ChatMember, MatchSeries, PlayerMonthStat
+from features.general import _load_mentions, _load_ping_names, _load_member_stats
+from features.session import format_session_text, _opponent_choices
+from features.stats import calculate_leaderboard, _player_profile
+
+CHAT_ID = -100500
+PLAYERS = list(range(1, 11))
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded():
+    init_db()
+    with SessionLocal() as db:
+        db.add(Chat(chat_id=CHAT_ID, title="Test"))
+        db.execute(insert(User), [{"user_id": uid, "full_name": f"Player {uid}", "username": f"p{uid}"} for uid in PLAYERS])
+        db.execute(insert(ChatMember), [
+            {"chat_id": CHAT_ID, "user_id": uid, "is_excluded": uid > 8} for uid in PLAYERS
+        ])
+        db.execute(insert(MatchSeries), [
+            {"chat_id": CHAT_ID, "player_a_id": 1, "player_b_id": opp, "played": 5, "wins_a": 3, "wins_b": 1, "draws": 1}
+            for opp in PLAYERS[1:]
+        ])
+        db.execute(insert(PlayerMonthStat), [
+            {"chat_id": CHAT_ID, "user_id": uid, "month": "2026-10", "wins": 3, "draws": 1, "total": 5} for uid in PLAYERS
+        ])
+        db.commit()
+
+
+@contextmanager
+def counted():
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "after_cursor_execute", count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "after_cursor_execute", count)
+
+
+def run(fn, *args):
+    with SessionLocal() as db, counted() as statements:
+        result = fn(db, *args)
+    return result, len(statements)
+
+
+def session_card(db):
+    card = {
+        "type": "2v2", "pA": 1, "squad": [1, 2, 3, 4],
+        "in": [5, 6, 7], "out": [8, 9], "pending": {"10": "21:30"},
+    }
+    return format_session_text(card, db)
+
+
+RENDERS = [
+    # name, fn, args, cold statements, warm statements
+    ("format_session_text", session_card, (), 1, 0),
+    ("_load_mentions", _load_mentions, (CHAT_ID,), 2, 1),
+    ("_load_ping_names", _load_ping_names, (CHAT_ID,), 2, 1),
+    ("_load_member_stats", _load_member_stats, (CHAT_ID,), 2, 1),
+    ("calculate_leaderboard", calculate_leaderboard, (CHAT_ID,), 2, 1),
+    ("_player_profile", _player_profile, (CHAT_ID, 1), 2, 1),
+    ("_opponent_choices", _opponent_choices, (CHAT_ID, 1), 2, 1),
+]
+
+
+@pytest.mark.parametrize("name, fn, args, cold, warm", RENDERS, ids=[r[0] for r in RENDERS])
+def test_query_count(name, fn, args, cold, warm):
+    for cache in registry.values():
+        cache.clear()
+    first, cold_count = run(fn, *args)
+    second, warm_count = run(fn, *args)
+    assert first == second
+    assert cold_count == cold
+    assert warm_count == warm
+
+
+def test_session_card_names_everyone():
+    text, _ = run(session_card)
+    for uid in PLAYERS:
+        assert f"Player {uid}" in text
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from scheduler import OutboundScheduler
+
+GROUP = -100200
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_initialize_twice_keeps_one_dispatcher():
+    async def go():
+        scheduler = OutboundScheduler()
+        await scheduler.initialize()
+        first = scheduler._dispatcher
+        await scheduler.initialize() # the Updater's bot initializes the limiter again
+        assert scheduler._dispatcher is first
+        await scheduler.shutdown()
+        assert first.cancelled()
+
+    run(go())
+
+
+async def burst(scheduler, endpoint, n):
+    async def call():
+        return True
+
+    start = time.monotonic()
+    for _ in range(n):
+        await scheduler.process_request(call, (), {}, endpoint, {"chat_id": GROUP}, None)
+    return time.monotonic() - start
+
+
+def test_edits_in_one_group_are_not_paced_like_new_messages():
+    async def go():
+        scheduler = OutboundScheduler()
+        await scheduler.initialize()
+        try:
+            # Uses up the group's burst of new messages...
+            await burst(scheduler, "sendMessage", 5)
+            # ...but wizard steps and card edits keep flowing
+            edits = await burst(scheduler, "editMessageText", 15)
+            deletes = await burst(scheduler, "deleteMessage", 5)
+        finally:
+            await scheduler.shutdown()
+        return edits + deletes
+
+    assert run(go()) < 1.0
+
+
+def test_new_messages_still_take_the_group_bucket():
+    async def go():
+        scheduler = OutboundScheduler()
+        await scheduler.initialize()
+        try:
+            await burst(scheduler, "sendMessage", 5)
+            return scheduler.chats[GROUP].ready_at(time.monotonic()) - time.monotonic()
+        finally:
+            await scheduler.shutdown()
+
+    assert run(go()) > 2.0 # next group message waits ~3 s at 20/min
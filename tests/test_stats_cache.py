@@ -0,0 +1,29 @@
+import asyncio
+
+from database import init_db, run_db
+from features.stats import cached_profile, forget_rendered, _save_results
+
+CHAT_ID = -700100
+
+
+def result(wins_a, wins_b, played):
+    return {"chat_id": CHAT_ID, "pA": 1, "pB": 2, "played": played,
+            "winsA": wins_a, "winsB": wins_b, "draws": played - wins_a - wins_b}
+
+
+def test_saved_results_reach_the_cached_profile():
+    init_db()
+
+    async def go():
+        await run_db(_save_results, result(3, 1, 5))
+        forget_rendered(CHAT_ID)
+        before = await cached_profile(CHAT_ID, 1)
+        assert await cached_profile(CHAT_ID, 1) is before # served from the cache
+
+        await run_db(_save_results, result(2, 0, 2))
+        forget_rendered(CHAT_ID)
+        return before, await cached_profile(CHAT_ID, 1)
+
+    before, after = asyncio.run(go())
+    assert before["total"] == 5
+    assert after["total"] == 7 and after["wins"] == 5
@@ -0,0 +1,139 @@
+"""
+Per-chat ordered, cross-chat concurrent update processing.
+
+Updates from one chat run strictly one after another, in arrival order, so the
+session cards, the stats wizard in chat_data and ConversationHandler state see
+the same sequence they did with sequential processing. Different chats run in
+parallel, at most WORKERS handlers at a time, so a slow leaderboard in one group
+no longer holds up RSVP clicks in another.
+
+An update waiting for its chat's turn does not occupy a worker slot, and neither
+does a handler while the outbound rate limiter holds one of its requests back
+(see slot_released): time spent on Telegram's limits isn't handler work.
+"""
+import asyncio
+import contextlib
+import time
+from contextvars import ContextVar
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+WORKERS = 8          # handlers running at once, across all chats
+MAX_PENDING = 4096   # updates admitted (running + waiting for their chat) before intake backs off
+
+
+class WorkerSlot:
+    __slots__ = ("processor", "task", "held")
+
+    def __init__(self, processor, task):
+        self.processor = processor
+        self.task = task
+        self.held = False
+
+# The slot held by the handler running in this task. Tasks a handler spawns copy the
+# context too, so the task is checked before giving anything back.
+_slot = ContextVar("update_worker_slot", default=None)
+
+
+@contextlib.asynccontextmanager
+async def slot_released():
+    """Gives the current handler's worker slot back while it waits; the chat keeps its turn."""
+    slot = _slot.get()
+    if slot is None or not slot.held or slot.task is not asyncio.current_task():
+        yield
+        return
+    slot.processor._give_back(slot)
+    slot.processor.stats["slot_yields"] += 1
+    try:
+        yield
+    finally:
+        await slot.processor._take(slot)
+
+
+class ChatLane:
+    __slots__ = ("lock", "waiting")
+
+    def __init__(self):
+        self.lock = asyncio.Lock() # FIFO: waiters are woken in arrival order
+        self.waiting = 0
+
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        super().__init__(max_pending)
+        self.workers = workers
+        self._slots = asyncio.Semaphore(workers)
+        self.lanes = {} # chat_id -> ChatLane, dropped once the chat has nothing queued
+        self.running = 0
+        self.stats = {"processed": 0, "unordered": 0, "max_chat_depth": 0, "slot_yields": 0,
+                      "chat_wait_ms_total": 0.0, "max_chat_wait_ms": 0.0}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def depth(self):
+        """(updates waiting for their chat, chats with a backlog)."""
+        return sum(lane.waiting for lane in self.lanes.values()), sum(1 for lane in self.lanes.values() if lane.waiting)
+
+    def busiest(self, n=3):
+        """[(chat_id, waiting)] for the chats with the longest backlog."""
+        backlog = [(chat_id, lane.waiting) for chat_id, lane in self.lanes.items() if lane.waiting]
+        return sorted(backlog, key=lambda c: c[1], reverse=True)[:n]
+
+    async def do_process_update(self, update, coroutine):
+        chat_id = update.effective_chat.id if isinstance(update, Update) and update.effective_chat else None
+        if chat_id is None:
+            # Inline queries, polls and the like have no chat to keep in order
+            self.stats["unordered"] += 1
+            await self._run(coroutine)
+            return
+
+        lane = self.lanes.get(chat_id)
+        if lane is None:
+            lane = self.lanes[chat_id] = ChatLane()
+        lane.waiting += 1
+        if lane.waiting > self.stats["max_chat_depth"]:
+            self.stats["max_chat_depth"] = lane.waiting
+        queued = time.perf_counter()
+        try:
+            try:
+                await lane.lock.acquire()
+            finally:
+                lane.waiting -= 1
+            try:
+                wait_ms = (time.perf_counter() - queued) * 1000
+                self.stats["chat_wait_ms_total"] += wait_ms
+                if wait_ms > self.stats["max_chat_wait_ms"]:
+                    self.stats["max_chat_wait_ms"] = wait_ms
+                await self._run(coroutine)
+            finally:
+                lane.lock.release()
+        finally:
+            if not lane.waiting and not lane.lock.locked() and self.lanes.get(chat_id) is lane:
+                del self.lanes[chat_id]
+
+    async def _run(self, coroutine):
+        slot = WorkerSlot(self, asyncio.current_task())
+        await self._take(slot)
+        token = _slot.set(slot)
+        try:
+            await coroutine
+        finally:
+            _slot.reset(token)
+            self._give_back(slot)
+            self.stats["processed"] += 1
+
+    async def _take(self, slot):
+        await self._slots.acquire()
+        slot.held = True
+        self.running += 1
+
+    def _give_back(self, slot):
+        if slot.held:
+            slot.held = False
+            self.running -= 1
+            self._slots.release()
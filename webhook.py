@@ -0,0 +1,187 @@
+"""
+Webhook mode: a small asyncio HTTP listener in front of the Application.
+
+Telegram POSTs each update to /<WEBHOOK_PATH> with the secret token header set by
+setWebhook; anything without it is refused. GET /health answers load balancers and
+uptime checks. Connections are kept alive, so a busy chat costs one request per
+update and no getUpdates round trips.
+
+No extra dependency: PTB's own webhook server needs tornado.
+"""
+import asyncio
+import contextlib
+import hmac
+import json
+import logging
+import secrets
+import signal
+import time
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+HEALTH_PATH = "/health"
+MAX_BODY = 1 << 20   # bytes; real updates are a few KB
+IDLE_TIMEOUT = 120   # seconds a kept-alive connection may sit idle
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+# --- Minimal HTTP/1.1 ---
+async def read_request(reader):
+    """Returns (method, path, headers, body), or None once the client has closed the connection."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise ValueError("malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY:
+        raise OverflowError(length)
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+
+def respond(writer, status, body=b"", keep_alive=True, content_type="application/json"):
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+    )
+
+
+class WebhookServer:
+
+    def __init__(self, app, path, secret_token):
+        self.app = app
+        self.path = "/" + path.strip("/")
+        self.secret_token = secret_token.encode() if secret_token else b""
+        self.started = time.time()
+        self.stats = {"updates": 0, "rejected": 0, "bad_requests": 0, "connections": 0}
+        self.server = None
+
+    async def start(self, listen, port):
+        self.server = await asyncio.start_server(self.handle_connection, listen, port)
+        logger.info("Webhook listening on %s:%d%s", listen, port, self.path)
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def health(self):
+        return {
+            "ok": self.app.running, "mode": "webhook",
+            "uptime_s": round(time.time() - self.started),
+            "pending": self.app.update_queue.qsize(), **self.stats,
+        }
+
+    async def handle_connection(self, reader, writer):
+        self.stats["connections"] += 1
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), IDLE_TIMEOUT)
+                except OverflowError:
+                    self.stats["bad_requests"] += 1
+                    respond(writer, 413, keep_alive=False)
+                    break
+                except (ValueError, asyncio.IncompleteReadError):
+                    self.stats["bad_requests"] += 1
+                    respond(writer, 400, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                keep_alive = request[2].get("connection", "").lower() != "close"
+                status, body = await self.dispatch(*request)
+                respond(writer, status, body, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, headers, body):
+        path = path.split("?", 1)[0]
+        if path == HEALTH_PATH:
+            health = self.health()
+            return (200 if health["ok"] else 503), json.dumps(health).encode()
+        if path != self.path:
+            return 404, b""
+        if method != "POST":
+            return 405, b""
+        # Bytes, not str: compare_digest refuses non-ASCII strings, and the header is client input
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, "").encode("latin-1"), self.secret_token):
+            self.stats["rejected"] += 1
+            return 403, b""
+        try:
+            await self.accept(json.loads(body))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            self.stats["bad_requests"] += 1
+            return 400, b""
+        self.stats["updates"] += 1
+        return 200, b""
+
+    async def accept(self, data):
+        # Acknowledge straight away; the Application works the queue on its own
+        await self.app.update_queue.put(Update.de_json(data, self.app.bot))
+
+
+@contextlib.asynccontextmanager
+async def running(app):
+    """Starts and stops the Application with the post_init/post_stop/post_shutdown hooks run_polling calls."""
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        yield app
+    finally:
+        if app.running:
+            await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+def stop_on_signals(*signals):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in signals or (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+async def serve(app, url, listen, port, path, secret_token=None):
+    """Runs the Application behind the listener until SIGINT/SIGTERM."""
+    # A fresh secret per start is fine: setWebhook below replaces the old one
+    secret_token = secret_token or secrets.token_urlsafe(32)
+    server = WebhookServer(app, path, secret_token)
+    stop = stop_on_signals()
+    async with running(app):
+        try:
+            await server.start(listen, port)
+            await app.bot.set_webhook(url=url.rstrip("/") + server.path, secret_token=secret_token)
+            await stop.wait()
+        finally:
+            await server.stop()
+
+
+def run_webhook(app, url, listen, port, path, secret_token=None):
+    asyncio.run(serve(app, url, listen, port, path, secret_token))